@@ -12,6 +12,11 @@ diffcalc_emulator:
     The diffcalc emulator that brings all the modules together. 
     It moves the simulation in Blender and provides commands that mimic diffcalc in GDA. 
 
+util:
+    Modules that do not need Blender, e.g. the standalone collision engine i16sim.util.collision.
+    The Blender modules in i16sim.bl are only imported by register(), so util modules
+    can be imported in plain Python, worker processes and CI.
+
 For more info, see: https://github.com/DanPorter/i16sim
 Documentation: https://i16sim.readthedocs.io/
 
@@ -45,16 +50,23 @@ bl_info = {
     "blender": (2, 93, 1),
     }
     
-import i16sim.bl.ui as ui
-import i16sim.bl.no_render_animate as animate
 
 
 def register():
+    # Blender modules are imported here so the package imports without bpy
+    import i16sim.bl.ui as ui
+    import i16sim.bl.no_render_animate as animate
+    import i16sim.bl.intersect_test as intersect_test
     ui.register()
     animate.register()
+    intersect_test.register()
 
 
 def unregister():
+    import i16sim.bl.ui as ui
+    import i16sim.bl.no_render_animate as animate
+    import i16sim.bl.intersect_test as intersect_test
     ui.unregister()
     animate.unregister()
+    intersect_test.unregister()
 
@@ -4,6 +4,9 @@ Blender specific modules
 ik_to_fk:
     functinos for enabling and disabling inverse kinematics and saving the visual position.
     
+export_model:
+    functions for exporting the armature for use without Blender.
+
 intersect_test:
     function for checking if meshes in the simulation are intersecting.
     
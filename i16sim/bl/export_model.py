@@ -0,0 +1,238 @@
+"""
+functions for exporting the simulation model for use without Blender
+
+export_armature(filename):
+    save the armature bone chain, see i16sim.util.kinematics.ArmatureModel
+
+export_model(filename):
+    save the armature and all meshes, see i16sim.util.collision.CollisionModel
+"""
+
+import bpy
+import numpy as np
+
+import i16sim.parameters as params
+from i16sim.util.kinematics import ArmatureModel, rotation_y_array
+from i16sim.util.collision import CollisionModel
+from i16sim.bl.intersect_test import mesh_arrays
+
+#constants
+arm_name=params.arm_name #"Armature"
+motors=params.armature_motors #["kmu","kdelta","kgamma","ktheta","kappa","kphi"]
+check_offset=0.3 # radians added to every motor for the second pose compared with Blender
+
+
+def _ordered_bones(armature):
+    """list of bones of armature data, parents before children"""
+    ordered = []
+    def add(bone):
+        ordered.append(bone)
+        for child in bone.children:
+            add(child)
+    for bone in armature.data.bones:
+        if bone.parent is None:
+            add(bone)
+    return ordered
+
+
+def get_armature_model(arm_name=arm_name, motors=motors):
+    """Create a kinematic model of the armature in its current state
+
+    Bone constraints, e.g. IK, are not included, so disable IK first (fk command).
+
+    Parameters
+    ----------
+    arm_name : str, optional
+        armature name. The default is params.arm_name.
+    motors : [str], optional
+        motor bone names. The default is params.armature_motors.
+
+    Returns
+    -------
+    model : ArmatureModel
+        bone chain and rest matrices of the armature.
+    error : float
+        largest difference between the model and Blender bone matrices in the current pose
+        and with every motor moved by check_offset.
+
+    """
+    bpy.context.view_layer.update()
+    Arm=bpy.data.objects[arm_name]
+    bones = _ordered_bones(Arm)
+    names = [bone.name for bone in bones]
+
+    parents = np.array([names.index(bone.parent.name) if bone.parent else -1 for bone in bones])
+    rest = np.array([np.array(bone.matrix_local) for bone in bones])
+    basis = np.array([np.array(Arm.pose.bones[name].matrix_basis) for name in names])
+    # remove motor rotations about the bone y axis
+    b_angles = np.array([Arm.pose.bones[motor].rotation_euler[1] for motor in motors])
+    for motor, angle in zip(motors, b_angles):
+        basis[names.index(motor)] = basis[names.index(motor)] @ rotation_y_array(-angle)
+
+    model = ArmatureModel(names, parents, rest, basis, np.array(Arm.matrix_world), motors)
+
+    # compare with blender in the current pose and in a pose with every motor moved,
+    # the current pose alone matches by construction of the basis matrices
+    error = 0.
+    try:
+        for offset in (0., check_offset):
+            for motor, angle in zip(motors, b_angles):
+                Arm.pose.bones[motor].rotation_euler[1] = angle + offset
+            bpy.context.view_layer.update()
+            blender = np.array([np.array(Arm.pose.bones[name].matrix) for name in names])
+            model_matrices = model.pose_b_angles(b_angles + offset, world=False)[0]
+            error = max(error, float(np.max(np.abs(model_matrices - blender), initial=0)))
+    finally:
+        for motor, angle in zip(motors, b_angles):
+            Arm.pose.bones[motor].rotation_euler[1] = angle
+        bpy.context.view_layer.update()
+    return model, error
+
+
+def export_armature(filename, arm_name=arm_name, motors=motors, tolerance=1e-4):
+    """Save the bone chain and rest matrices of the armature for kinematics without Blender
+
+    example:
+        export_armature('armature.npz')
+        model = i16sim.util.kinematics.ArmatureModel.load('armature.npz')
+
+    Parameters
+    ----------
+    filename : str
+        .npz file name.
+    arm_name : str, optional
+        armature name. The default is params.arm_name.
+    motors : [str], optional
+        motor bone names. The default is params.armature_motors.
+    tolerance : float, optional
+        largest allowed difference from the Blender bone matrices, see get_armature_model. The default is 1e-4.
+
+    Returns
+    -------
+    model : ArmatureModel
+        the saved model.
+
+    """
+    model, error = get_armature_model(arm_name, motors)
+    if error > tolerance:
+        raise Exception('Armature model differs from Blender by %.3g, are bone constraints (IK) enabled, or do motor bones rotate other than about y (XYZ euler)?' % error)
+    model.save(filename)
+    print('Saved %d bones to %s, max. difference from Blender: %.3g' % (len(model.bone_names), filename, error))
+    return model
+
+
+def _parent_bone(obj, Arm):
+    """name of the bone the object or one of its parents is parented to, or None"""
+    while obj.parent is not None:
+        if obj.parent == Arm and obj.parent_type == 'BONE':
+            return obj.parent_bone
+        obj = obj.parent
+    return None
+
+
+def _vertex_bones(obj, Arm, bone_names, nvertices):
+    """
+    bone name of every vertex of an object
+    Objects deformed by an armature modifier use the vertex group with the largest weight,
+    otherwise all vertices move with the parent bone.
+    """
+    bone = _parent_bone(obj, Arm)
+    bones = np.array([bone or ''] * nvertices, dtype=object)
+    deformed = any(mod.type == 'ARMATURE' and mod.object == Arm and mod.use_vertex_groups and mod.show_viewport
+                   for mod in obj.modifiers)
+    if deformed and len(obj.data.vertices) == nvertices:
+        group_names = {group.index: group.name for group in obj.vertex_groups}
+        for vertex in obj.data.vertices:
+            groups = [(g.weight, group_names[g.group]) for g in vertex.groups
+                      if g.weight > 0 and group_names.get(g.group) in bone_names]
+            if groups:
+                bones[vertex.index] = max(groups)[1]
+    return bones
+
+
+def get_collision_model(arm_name=arm_name, motors=motors):
+    """Create a collision model of all meshes in the current pose
+
+    Each mesh checked by is_intersect is split into rigid parts that move with one bone.
+    Meshes deformed by several bones are split by the vertex group with the largest weight,
+    so they are only exact if every vertex moves with one bone.
+
+    Parameters
+    ----------
+    arm_name : str, optional
+        armature name. The default is params.arm_name.
+    motors : [str], optional
+        motor bone names. The default is params.armature_motors.
+
+    Returns
+    -------
+    model : CollisionModel
+        meshes and armature.
+    error : float
+        largest difference between the armature model and Blender bone matrices, see get_armature_model.
+
+    """
+    armature, error = get_armature_model(arm_name, motors)
+    Arm=bpy.data.objects[arm_name]
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    objects = bpy.context.scene.objects
+
+    # same meshes as is_intersect(check_all_meshes=True)
+    meshes = [obj for obj in objects if obj.type == 'MESH' and obj.name == obj.data.name]
+    mesh_names = [obj.name for obj in meshes]
+    visible = [obj.visible_get() and not obj.hide_select for obj in meshes]
+    collections = {
+        collection.name: [name for name in collection.all_objects.keys() if name in mesh_names]
+        for collection in bpy.data.collections
+    }
+
+    bone_world = {name: np.array(Arm.matrix_world @ Arm.pose.bones[name].matrix) for name in armature.bone_names}
+    parts = []
+    for index, obj in enumerate(meshes):
+        co, tris = mesh_arrays(obj, depsgraph)
+        matrix = np.array(obj.matrix_world)
+        co = co @ matrix[:3, :3].T + matrix[:3, 3]  # world space in the current pose
+        bones = _vertex_bones(obj, Arm, bone_world, len(co))
+        tri_bones = bones[tris[:, 0]] if len(tris) else np.array([], dtype=object)
+        for bone in sorted(set(tri_bones)):
+            part_tris = tris[tri_bones == bone]
+            used, part_tris = np.unique(part_tris, return_inverse=True)
+            vertices = co[used]
+            if bone:
+                to_bone = np.linalg.inv(bone_world[bone])
+                vertices = vertices @ to_bone[:3, :3].T + to_bone[:3, 3]
+            parts.append({'mesh': index, 'bone': bone, 'vertices': vertices, 'triangles': part_tris.reshape(-1, 3)})
+    return CollisionModel(armature, mesh_names, parts, collections, visible), error
+
+
+def export_model(filename, arm_name=arm_name, motors=motors, tolerance=1e-4):
+    """Save the armature and all meshes for collision checks without Blender
+
+    example:
+        export_model('i16model.npz')
+        model = i16sim.util.collision.CollisionModel.load('i16model.npz')
+        print(model.intersect([0, 30, 0, 15, 45, 0]))
+
+    Parameters
+    ----------
+    filename : str
+        .npz file name.
+    arm_name : str, optional
+        armature name. The default is params.arm_name.
+    motors : [str], optional
+        motor bone names. The default is params.armature_motors.
+    tolerance : float, optional
+        largest allowed difference from the Blender bone matrices, see get_armature_model. The default is 1e-4.
+
+    Returns
+    -------
+    model : CollisionModel
+        the saved model.
+
+    """
+    model, error = get_collision_model(arm_name, motors)
+    if error > tolerance:
+        raise Exception('Armature model differs from Blender by %.3g, are bone constraints (IK) enabled, or do motor bones rotate other than about y (XYZ euler)?' % error)
+    model.save(filename)
+    print('Saved %d meshes in %d parts to %s' % (len(model.mesh_names), len(model.parts), filename))
+    return model
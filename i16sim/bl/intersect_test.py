@@ -1,18 +1,67 @@
 """
 function for checking if meshes in the simulation are intersecting
+
+The triangulated local-space geometry of every mesh is cached between calls,
+with a BVH tree in world coordinates that is only rebuilt when the mesh moves.
+A cached mesh is rebuilt only if its mesh data changes.
+
+Bounding boxes of all meshes in the current pose are compared first (sweep and prune),
+only pairs with overlapping boxes are checked with the exact BVH overlap.
+The result of each exact check is kept with the relative transform of the two meshes,
+if neither mesh has moved relative to the other since then the result is reused.
+Before the exact check, convex proxies of both meshes are compared from coarse to fine
+(hull, then convex pieces, see i16sim.util.collision.convex_proxies), the exact BVH trees are
+only checked if the proxies overlap. Proxies are saved next to the .blend file ('<file> proxies.npz')
+and only rebuilt for meshes that changed.
+Meshes that are allowed to touch are looked up in a boolean matrix,
+which is only rebuilt when the checked meshes or the contact groups change.
+The pair counts and timing of the last check are in collision_stats.
+
+get_clearance finds the smallest distance between meshes instead, the exact triangle to triangle
+distance (i16sim.util.collision.TriangleBVH) of the pairs whose bounding boxes are closer than a distance.
+
+scene_digest hashes the names and geometry of the meshes is_intersect would check,
+so results can be reused while the same meshes are visible and unchanged.
 """
 
+import os
+import time
+import hashlib
 import bpy
-import bmesh 
 import mathutils
+import numpy as np
+from bpy.app.handlers import persistent
 BVHTree = mathutils.bvhtree.BVHTree # shorthand
 
 import i16sim.parameters as params
+from i16sim.util.collision import transform_aabb, sweep_and_prune, allowed_contact_matrix, TriangleBVH
+from i16sim.util.collision import convex_proxies, proxies_overlap, mesh_digest, save_proxies, load_proxies
 
 #Constants
 Arm_name = params.arm_name #"Armature"
 mesh_names = params.mesh_names
 
+# cached geometry of each checked mesh object {object name: {'key', 'co', 'tris', 'bounds', 'matrix', 'world_tree', 'bvh', 'digest'}}
+_mesh_cache = {}
+
+# last exact check of each pair {(name1, name2): (mesh1 cache, mesh2 cache, relative matrix, intersecting)}
+_pair_cache = {}
+# relative transforms closer than this are the same pose
+pair_tolerance = 1e-6
+
+# contact groups from collections {'key', 'groups'}, cleared when collections change
+_groups_cache = {}
+# allowed contact matrix of the checked meshes {'key', 'matrix'}
+_contact_cache = {}
+
+# convex proxies of the meshes {'file': proxy file, 'proxies': {mesh digest: (hull, pieces)}, 'new': bool}
+_proxy_cache = {}
+# check convex proxies before the exact mesh overlap
+use_proxies = True
+
+# statistics of the last call of is_intersect
+collision_stats = {}
+
 def ShowMessageBox(message = "", title = "Collision Detected", icon = 'ERROR'):
     """Draw a popup window with message in Blender
     
@@ -40,6 +89,338 @@ def ShowMessageBox(message = "", title = "Collision Detected", icon = 'ERROR'):
     bpy.context.window_manager.popup_menu(draw, title = title, icon = icon)
 
 
+def clear_mesh_cache(name=None):
+    """Remove cached mesh geometry and BVH trees
+    
+    Parameters
+    ----------
+    name : str, optional
+        object name to remove. The default is None, which removes all.
+    """
+    if name is None:
+        _mesh_cache.clear()
+        _pair_cache.clear()
+    else:
+        _mesh_cache.pop(name, None)
+        for pair in [pair for pair in _pair_cache if name in pair]:
+            del _pair_cache[pair]
+
+
+@persistent
+def _geometry_update_handler(scene, depsgraph):
+    """depsgraph handler, removes the cache of meshes whose geometry changed and of changed collections"""
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Collection):
+            _groups_cache.clear()
+        elif _mesh_cache and update.is_updated_geometry:
+            clear_mesh_cache(update.id.name)
+
+
+@persistent
+def _load_handler(*args):
+    """load handler, a new file has new meshes"""
+    clear_mesh_cache()
+    _groups_cache.clear()
+    _contact_cache.clear()
+    _proxy_cache.clear()
+
+
+def contact_groups(collision_exceptions, intersect_collections):
+    """Get groups of meshes that are allowed to touch
+    
+    The groups are cached until a collection or the scene changes.
+    The input lists are not changed.
+
+    Parameters
+    ----------
+    collision_exceptions : [[str]]
+        groups of mesh names that should touch, e.g. params.collision_exceptions
+    intersect_collections : [[str, [str]]]
+        [collection name, [mesh names]] all objects in the collection and the meshes should touch,
+        e.g. params.intersect_collections
+
+    Returns
+    -------
+    groups : tuple ((str, ...), ...)
+        groups of mesh names that should touch.
+
+    """
+    key = (
+        tuple(tuple(group) for group in collision_exceptions),
+        tuple((collection, tuple(names)) for collection, names in intersect_collections),
+    )
+    if _groups_cache.get('key') != key:
+        groups = list(key[0])
+        for collection, names in key[1]:  # collections where all included objects should touch
+            groups.append(names + tuple(bpy.data.collections[collection].all_objects.keys()))
+        _groups_cache['key'] = key
+        _groups_cache['groups'] = tuple(groups)
+    return _groups_cache['groups']
+
+
+def _get_allowed_contacts(names, exceptions):
+    """get boolean matrix of allowed contacts between names, rebuilt if the names or exceptions change"""
+    key = (tuple(names), tuple(tuple(group) for group in exceptions))
+    if _contact_cache.get('key') != key:
+        _contact_cache['key'] = key
+        _contact_cache['matrix'] = allowed_contact_matrix(names, exceptions)
+    return _contact_cache['matrix']
+
+
+def _mesh_key(obj):
+    """cheap fingerprint of the mesh data of an object, in case a change is missed by the depsgraph handler"""
+    return (
+        obj.data.as_pointer(),
+        len(obj.data.vertices),
+        len(obj.data.polygons),
+        tuple((mod.type, mod.show_viewport) for mod in obj.modifiers),
+    )
+
+
+def mesh_arrays(obj, depsgraph):
+    """
+    Get triangulated evaluated mesh of an object, including modifiers
+    in: obj # Blender mesh object
+        depsgraph # evaluated dependency graph
+    out: co, tris # (n, 3) array of vertex coordinates in object local space, (m, 3) int array of triangle vertex indices
+    """
+    obj_eval = obj.evaluated_get(depsgraph)
+    mesh = obj_eval.to_mesh()
+    try:
+        mesh.calc_loop_triangles()
+        co = np.empty(3 * len(mesh.vertices))
+        mesh.vertices.foreach_get('co', co)
+        tris = np.empty(3 * len(mesh.loop_triangles), dtype=int)
+        mesh.loop_triangles.foreach_get('vertices', tris)
+    finally:
+        obj_eval.to_mesh_clear()
+    return co.reshape(-1, 3), tris.reshape(-1, 3)
+
+
+def _get_mesh(obj, depsgraph):
+    """
+    Get cached mesh geometry, building it from the evaluated mesh if the mesh has changed
+    in: obj # Blender mesh object
+        depsgraph # evaluated dependency graph
+    out: dict {'co': (n, 3) array of local vertex coordinates, 'tris': (m, 3) array of vertex indices,
+               'bounds': (min, max) local bounding box, 'world_tree': BVHTree in world coordinates, ...}
+    """
+    key = _mesh_key(obj)
+    cache = _mesh_cache.get(obj.name)
+    if cache is not None and cache['key'] == key:
+        return cache
+
+    co, tris = mesh_arrays(obj, depsgraph)
+    cache = {
+        'key': key,
+        'co': co,
+        'tris': tris,
+        'bounds': (co.min(axis=0), co.max(axis=0)) if len(tris) else None,
+        'matrix': None,
+        'world_tree': None,
+        'proxies': None,
+        'bvh': None,
+        'digest': None,
+    }
+    _mesh_cache[obj.name] = cache
+    return cache
+
+
+def _get_digest(cache):
+    """hash of the geometry of a cached mesh, see i16sim.util.collision.mesh_digest"""
+    if cache.get('digest') is None:
+        cache['digest'] = mesh_digest(cache['co'], cache['tris'])
+    return cache['digest']
+
+
+def _proxy_file():
+    """file the proxies are saved to, next to the .blend file, or None if the file is not saved"""
+    if not bpy.data.filepath:
+        return None
+    return os.path.splitext(bpy.data.filepath)[0] + ' proxies.npz'
+
+
+def _get_proxies(cache):
+    """
+    Get convex proxies of a cached mesh, from the proxy file if the mesh is saved in it
+    in: cache # mesh cache of _get_mesh
+    out: (hull, pieces) in object local space, see convex_proxies
+    """
+    if cache.get('proxies') is None:
+        filename = _proxy_file()
+        if _proxy_cache.get('file') != filename:
+            _proxy_cache.update(file=filename, new=False, proxies={})
+            if filename is not None and os.path.isfile(filename):
+                _proxy_cache['proxies'] = load_proxies(filename)
+        key = _get_digest(cache)
+        if key not in _proxy_cache['proxies']:
+            _proxy_cache['proxies'][key] = convex_proxies(cache['co'], cache['tris'])
+            _proxy_cache['new'] = True
+        cache['proxies'] = _proxy_cache['proxies'][key]
+    return cache['proxies']
+
+
+def save_proxy_cache():
+    """Save new convex proxies next to the .blend file"""
+    if _proxy_cache.get('new') and _proxy_cache.get('file') is not None:
+        save_proxies(_proxy_cache['file'], _proxy_cache['proxies'])
+        _proxy_cache['new'] = False
+
+
+def _is_pair_unchanged(name1, name2, relative, meshes):
+    """True if the pair was checked before with the same meshes in the same relative pose"""
+    last = _pair_cache.get((name1, name2))
+    if last is None:
+        return False
+    mesh1, mesh2, last_relative, _ = last
+    return (mesh1 is meshes[name1] and mesh2 is meshes[name2]
+            and np.allclose(relative, last_relative, rtol=0, atol=pair_tolerance))
+
+
+def _get_world_tree(obj, depsgraph):
+    """
+    Get BVH tree of the cached mesh in the current world position, only rebuilt if the object moved
+    in: obj # Blender mesh object
+        depsgraph # evaluated dependency graph
+    out: BVHTree in world coordinates
+    """
+    cache = _get_mesh(obj, depsgraph)
+    matrix = np.array(obj.matrix_world)
+    if cache['matrix'] is None or not np.array_equal(cache['matrix'], matrix):
+        co = cache['co'] @ matrix[:3, :3].T + matrix[:3, 3]
+        cache['world_tree'] = BVHTree.FromPolygons(co.tolist(), cache['tris'].tolist(), all_triangles=True)
+        cache['matrix'] = matrix
+    return cache['world_tree']
+
+
+def _get_bvh(cache):
+    """TriangleBVH of a cached mesh in object local space, built on first use, see i16sim.util.collision"""
+    if cache.get('bvh') is None:
+        cache['bvh'] = TriangleBVH(cache['co'], cache['tris'])
+    return cache['bvh']
+
+
+def _mesh_nearest(obj1, obj2, depsgraph, max_distance):
+    """
+    Closest points of two meshes in world space, the exact triangle to triangle distance (TriangleBVH.nearest)
+    in: obj1, obj2 # Blender mesh objects
+        depsgraph # evaluated dependency graph
+        max_distance # largest distance searched
+    out: distance, point1, point2 # inf, None, None if further than max_distance, 0 if intersecting
+    """
+    matrix1 = np.array(obj1.matrix_world)
+    relative = np.linalg.solve(matrix1, np.array(obj2.matrix_world))
+    bvh1 = _get_bvh(_get_mesh(obj1, depsgraph))
+    bvh2 = _get_bvh(_get_mesh(obj2, depsgraph))
+    distance, point1, point2 = bvh1.nearest(bvh2, relative, max_distance)
+    if point1 is None:
+        return np.inf, None, None
+    return distance, point1 @ matrix1[:3, :3].T + matrix1[:3, 3], point2 @ matrix1[:3, :3].T + matrix1[:3, 3]
+
+
+def get_clearance(max_distance=params.clearance_distance, mesh_names=mesh_names, check_all_meshes=True,
+                  verbose=False, exceptions=None):
+    """Get the smallest distance between meshes in the simulation
+    
+    Only meshes checked by is_intersect are measured, pairs that are allowed to touch are skipped.
+
+    Parameters
+    ----------
+    max_distance : float, optional
+        largest distance in Blender units (m) to measure. The default is params.clearance_distance.
+    mesh_names : [str], optional
+        mesh ids. The default is mesh_names.
+    check_all_meshes : bool, optional
+        check all visible meshes, see is_intersect. The default is True.
+    verbose : bool, optional
+        print every pair. The default is False.
+    exceptions : [[str]], optional
+        sets of meshes that should touch, see contact_groups. The default is None.
+
+    Returns
+    -------
+    clearance : list [[mesh1, mesh2, distance, point1, point2],...]
+        mesh pairs closer than max_distance, closest first, with the closest world space point of each mesh.
+        Intersecting meshes have distance 0.
+
+    """
+    if exceptions is None:
+        exceptions = []
+    bpy.context.view_layer.update()
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    objects = bpy.context.scene.objects
+    if check_all_meshes:
+        mesh_names = [obj.data.name for obj in objects if obj.type == 'MESH' and obj.name == obj.data.name]
+    checked_names = [
+        name for name in mesh_names
+        if objects[name].visible_get() and not objects[name].hide_select
+    ]
+    meshes = {name: _get_mesh(objects[name], depsgraph) for name in checked_names}
+    checked_names = [name for name in checked_names if meshes[name]['bounds'] is not None]
+
+    boxes = [transform_aabb(*meshes[name]['bounds'], objects[name].matrix_world) for name in checked_names]
+    grow = max_distance / 2 if np.isfinite(max_distance) else 1e19
+    candidates = sweep_and_prune([box[0] - grow for box in boxes], [box[1] + grow for box in boxes])
+    allowed = _get_allowed_contacts(checked_names, exceptions)
+
+    clearance = []
+    for i, j in candidates:
+        if allowed[i, j]:
+            continue
+        name1, name2 = checked_names[i], checked_names[j]
+        distance, point1, point2 = _mesh_nearest(objects[name1], objects[name2], depsgraph, max_distance)
+        if point1 is not None:
+            clearance.append([name1, name2, distance, point1, point2])
+    clearance.sort(key=lambda pair: pair[2])
+    if verbose:
+        for name1, name2, distance, point1, point2 in clearance:
+            print("%s and %s are %.4g apart" % (name1, name2, distance))
+    return clearance
+
+
+def _visible_meshes(objects, mesh_names, check_all_meshes):
+    """names of the meshes checked by is_intersect, see is_intersect for the arguments"""
+    if (check_all_meshes):
+        mesh_names=[]
+        for object in objects:
+            if (object.type=='MESH'):
+                if (object.name==object.data.name):
+                    mesh_names.append(object.data.name)
+    return [
+        name for name in mesh_names
+        if objects[name].visible_get() and not objects[name].hide_select
+    ]
+
+
+def scene_digest(mesh_names=mesh_names, check_all_meshes=True):
+    """Hash of the names and geometry of the meshes is_intersect would check.
+    
+    Changes when meshes are edited, shown or hidden, e.g. when another sample environment is made visible,
+    but not when meshes move. Meshes deformed by the armature are included in their current pose.
+
+    Parameters
+    ----------
+    mesh_names : [str], optional
+        mesh ids. The default is mesh_names.
+    check_all_meshes : bool, optional
+        check all visible meshes, see is_intersect. The default is True.
+
+    Returns
+    -------
+    digest : str
+        hex digest.
+
+    """
+    bpy.context.view_layer.update()
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    objects = bpy.context.scene.objects
+    digest = hashlib.sha1()
+    for name in _visible_meshes(objects, mesh_names, check_all_meshes):
+        digest.update(name.encode())
+        digest.update(_get_digest(_get_mesh(objects[name], depsgraph)).encode())
+    return digest.hexdigest()
+
+
 #Print objects that are intersecting
 def is_intersect(Arm_name = None, mesh_names=mesh_names, check_all_meshes=True, verbose=False, popups=False, exceptions=None):
     """Check if meshes in the simulation are intersecting
@@ -61,8 +442,8 @@ def is_intersect(Arm_name = None, mesh_names=mesh_names, check_all_meshes=True,
         print every check. The default is False.
     popups : bool, optional
         Draw popup window if collision is detected. The default is False.
-    exceptions : TYPE, optional
-        sets of meshes that should touch. The default is None.
+    exceptions : [[str]], optional
+        sets of meshes that should touch, see contact_groups. The default is None.
 
 
     Returns
@@ -73,144 +454,121 @@ def is_intersect(Arm_name = None, mesh_names=mesh_names, check_all_meshes=True,
     """
     
     intersections=[] # returns list of intersecting mesh names.
+    if exceptions is None:
+        exceptions = []
     
-    try:
-        #set up context, view, and selection
-        bpy.context.view_layer.objects.active=bpy.data.objects[0]
-        if (bpy.data.objects[0].hide_viewport==False):
-            bpy.ops.object.mode_set(mode='OBJECT')
-        bpy.context.view_layer.update()
-        bpy.ops.object.select_all(action="DESELECT")
+    #set up context and view
+    bpy.context.view_layer.objects.active=bpy.data.objects[0]
+    if (bpy.data.objects[0].hide_viewport==False):
+        bpy.ops.object.mode_set(mode='OBJECT')
+    bpy.context.view_layer.update()
+    depsgraph = bpy.context.evaluated_depsgraph_get()
 
-        #shorthands 
-        objects = bpy.context.scene.objects #object dictionary
-        
-        # get the current valid mesh names
-        if (check_all_meshes):
-            mesh_names=[]
-            for object in objects:
-                if (object.type=='MESH'):
-                    if (object.name==object.data.name):
-                        mesh_names.append(object.data.name)
-        
-        #[print(mesh.name) for mesh in bpy.data.meshes]
-        #[print(mesh) for mesh in mesh_names]
-        
-        #shorthands 
-        objects = bpy.context.scene.objects #object dictionary
-        
-        #create clones with armature deform transforms 
-        #(cheesy hack to preserve parenting and pose)
-        clone_names=[]
-        for name in mesh_names:
-            #for each object make it active and selected
-            objects[name].select_set(True)
-            bpy.context.view_layer.objects.active = objects[name]
-            bpy.context.view_layer.update()
-            
-            #print(name)
-            
-            #if object is hidden, do not check it
-            if (bpy.context.view_layer.objects.active.visible_get() == False or
-             bpy.context.view_layer.objects.active.hide_select == True):
-                continue
-            
-            try:
-                #create clone and rename it so we can trace back the original
-                bpy.ops.object.convert(target='MESH', keep_original=True) #creates clone and selects the clone
-                new_name=name+".clone"
-                bpy.context.selected_objects[0].name=new_name
-                bpy.context.selected_objects[0].data.name=new_name #rename child mesh
-                
-                #save name and 
-                clone_names.append(new_name)
-            except:
-                raise Exception("Could not copy visual mesh of "+name)
-                
-                
-            #clean up before next clone    
-            bpy.ops.object.select_all(action="DESELECT")
-            
-            #refresh object dictionary
-            objects = bpy.context.scene.objects
-            
-        #print(clone_names) 
-        
-        if (verbose):
-            print("Checked meshes: ",[name[:-6] for name in clone_names])
+    #shorthands 
+    objects = bpy.context.scene.objects #object dictionary
+    
+    # get the current valid mesh names, if object is hidden, do not check it
+    checked_names = _visible_meshes(objects, mesh_names, check_all_meshes)
+    
+    if (verbose):
+        print("Checked meshes: ",checked_names)
+    
+    #broad phase: bounding boxes of the cached local geometry in the current pose
+    t0 = time.perf_counter()
+    meshes = {}
+    for name in checked_names:
+        try:
+            meshes[name] = _get_mesh(objects[name], depsgraph)
+        except Exception:
+            raise Exception("Could not copy visual mesh of "+name)
+    checked_names = [name for name in checked_names if meshes[name]['bounds'] is not None]
+    boxes = [transform_aabb(*meshes[name]['bounds'], objects[name].matrix_world) for name in checked_names]
+    t1 = time.perf_counter()
+    candidates = sweep_and_prune([box[0] for box in boxes], [box[1] for box in boxes])
+    allowed = _get_allowed_contacts(checked_names, exceptions)
+    t2 = time.perf_counter()
+    
+    #narrow phase: check candidate pairs for intersection
+    n_tested = 0
+    n_reused = 0
+    n_proxy = 0
+    matrices = {name: np.array(objects[name].matrix_world) for name in checked_names}
+    for i, j in candidates:
+        name1=checked_names[i]
+        name2=checked_names[j]
         
-        #check every object for intersection with every other object
-        #print("Starts Here")
-        for i in range(len(clone_names)):
-            for j in range(i,len(clone_names)):
-                if i == j:
-                    continue
-                name1=clone_names[i]
-                name2=clone_names[j]
-                #print(name1,name2)
-                
-                #check is the meshes should be touching
-                to_skip=False
-                for exception in exceptions:
-                    if ((name1[:-6] in exception) and (name2[:-6] in exception)):
-                        to_skip=True
-                        break
-                if (to_skip):
-                    continue
-
-
-            #create bmesh objects
-                bm1 = bmesh.new()
-                bm2 = bmesh.new()
-                
-
-            #fill bmesh data from objects
-                bm1.from_mesh(objects[name1].data)   
-                bm2.from_mesh(objects[name2].data)  
-                
-                #get matrix of transform
-                m_world1=objects[name1].matrix_world
-                m_world2=objects[name2].matrix_world
-
-            #fixed it here: Transform the objects based transform
-                bm1.transform(m_world1)   
-                bm2.transform(m_world2)  
-
-            #make BVH tree from BMesh of objects
-                obj_now_BVHtree = BVHTree.FromBMesh(bm1)
-                obj_next_BVHtree = BVHTree.FromBMesh(bm2)   
-
-            #get intersecting pairs
-                inter = obj_now_BVHtree.overlap(obj_next_BVHtree)
-
-            #if list of vertexes and lines is empty, no objects are touching
-                #print(inter)
-
-                
-                
-                if inter != []:
-                    intersections.append([name1[:-6],name2[:-6]])
-                    print(name1[:-6] + " and " + name2[:-6] + " are touching!")  
-     
-        if (intersections==[]):
-            print("No intersections") 
+        #check is the meshes should be touching
+        if allowed[i, j]:
+            continue
+
+    #skip pairs that have not moved relative to each other, e.g. parts on the same bone
+        relative = np.linalg.solve(matrices[name1], matrices[name2])
+        if _is_pair_unchanged(name1, name2, relative, meshes):
+            touching = _pair_cache[(name1, name2)][3]
+            n_reused += 1
+        elif use_proxies and proxies_overlap(_get_proxies(meshes[name1]), _get_proxies(meshes[name2]), relative) < 2:
+        #convex proxies don't overlap, so the meshes can't
+            touching = False
+            n_proxy += 1
+            _pair_cache[(name1, name2)] = (meshes[name1], meshes[name2], relative, touching)
         else:
-            if(popups):
-                ShowMessageBox("Intersections between: "+str(intersections))
-            for pair in intersections:
-                for ob_name in pair:
-                    bpy.data.objects[ob_name].select_set(True)
-        
-        
-    finally:
-        #delete clones
-        for name in clone_names:
-            bpy.data.objects.remove(objects[name], do_unlink=True)
-            bpy.data.meshes.remove(bpy.data.meshes[name])
-        print()
+        #get intersecting pairs, BVH trees in world coordinates are only rebuilt if the object moved
+            inter = _get_world_tree(objects[name1], depsgraph).overlap(_get_world_tree(objects[name2], depsgraph))
+            n_tested += 1
+        #if list of vertexes and lines is empty, no objects are touching
+            touching = inter != []
+            _pair_cache[(name1, name2)] = (meshes[name1], meshes[name2], relative, touching)
+
+        if touching:
+            intersections.append([name1,name2])
+            print(name1 + " and " + name2 + " are touching!")  
+    t3 = time.perf_counter()
+    save_proxy_cache()
+    
+    n_meshes = len(checked_names)
+    collision_stats.clear()
+    collision_stats.update({
+        'meshes': n_meshes,
+        'pairs': n_meshes * (n_meshes - 1) // 2,
+        'candidates': len(candidates),
+        'reused': n_reused,
+        'proxy_misses': n_proxy,
+        'tested': n_tested,
+        'intersections': len(intersections),
+        'time_bounds': t1 - t0,
+        'time_broad': t2 - t1,
+        'time_narrow': t3 - t2,
+    })
+    if (verbose):
+        print("Pairs: %(pairs)d, bounding box overlaps: %(candidates)d, unchanged: %(reused)d, proxy misses: %(proxy_misses)d, exact tests: %(tested)d" % collision_stats)
+        print("Time: bounds %(time_bounds).4fs, broad phase %(time_broad).4fs, exact tests %(time_narrow).4fs" % collision_stats)
+ 
+    if (intersections==[]):
+        print("No intersections") 
+    else:
+        if(popups):
+            ShowMessageBox("Intersections between: "+str(intersections))
+        bpy.ops.object.select_all(action="DESELECT")
+        for pair in intersections:
+            for ob_name in pair:
+                bpy.data.objects[ob_name].select_set(True)
+    print()
     
     return (intersections)
 
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(_geometry_update_handler)
+    bpy.app.handlers.load_post.append(_load_handler)
+
+
+def unregister():
+    if _geometry_update_handler in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(_geometry_update_handler)
+    if _load_handler in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(_load_handler)
+    clear_mesh_cache()
+
 #testing
 """
 #Arm_name = "Armature"
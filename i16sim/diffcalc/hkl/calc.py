@@ -3,15 +3,19 @@
 Module implementing calculations based on UB matrix data and diffractometer
 constraints.
 """
+import dataclasses
 from copy import copy
+from functools import partial
 from itertools import product
 from math import acos, asin, atan, atan2, cos, degrees, isnan, pi, sin, sqrt, tan
-from typing import Dict, Iterator, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
+from i16sim.diffcalc.hkl.constraints import Constraints
 from i16sim.diffcalc.hkl.geometry import (
     Position,
     get_rotation_matrices,
+    get_rotation_matrices_array,
     rot_CHI,
     rot_ETA,
     rot_MU,
@@ -24,6 +28,7 @@ from i16sim.diffcalc.util import (
     I,
     angle_between_vectors,
     bound,
+    bound_array,
     cross3,
     is_small,
     normalised,
@@ -37,6 +42,66 @@ from numpy.linalg import inv, norm
 
 logger = logging.getLogger("i16sim.diffcalc.hkl.calc")
 
+VERIFY_POLICIES = ("always", "sampled", "off")
+
+I6: np.ndarray = np.identity(6)
+
+VIRTUAL_ANGLES_DTYPE = np.dtype(
+    [
+        (name, float)
+        for name in (
+            "theta",
+            "ttheta",
+            "qaz",
+            "alpha",
+            "naz",
+            "tau",
+            "psi",
+            "beta",
+            "betain",
+            "betaout",
+        )
+    ]
+)
+
+
+@dataclasses.dataclass(eq=False)
+class _SolverStrategy:
+    """Constraint mode compiled for repeated hkl to position calculations.
+
+    Attributes
+    ----------
+    name: str
+        Constraint mode name listing constrained angles.
+    constraints: Constraints
+        Constraints object the strategy was compiled from.
+    version: int
+        Constraints version the strategy was compiled from.
+    reference: Dict[str, float]
+        Reference constraint name and value.
+    detector: Dict[str, float]
+        Detector constraint name and value.
+    sample: Dict[str, float]
+        Sample constraint names and values.
+    naz: Optional[float]
+        naz constraint value.
+    solve: Callable[[np.ndarray, float, float, float], List[Tuple[float, ...]]]
+        Mode specific routine calculating solution angles from h_phi, theta,
+        tau and surf_tau with constraint values bound.
+    """
+
+    name: str
+    constraints: Constraints
+    version: int
+    reference: Dict[str, float]
+    detector: Dict[str, float]
+    sample: Dict[str, float]
+    naz: Optional[float]
+    solve: Callable[
+        [np.ndarray, float, float, float],
+        List[Tuple[float, float, float, float, float, float]],
+    ]
+
 
 class HklCalculation:
     """Class for converting between miller indices and diffractometer position.
@@ -47,6 +112,16 @@ class HklCalculation:
         Reference to UBcalculation object containing UB matrix data.
     constraints:
         Reference to Constraints object containing diffractometer constraint settings.
+    verify: str, default = "always"
+        Verification policy for calculated positions, one of "always",
+        "sampled" or "off".
+    verify_every: int, default = 10
+        Verify one in verify_every solutions if verify policy is "sampled".
+    verification_stats: Dict[str, int]
+        Numbers of verified, skipped and failed solutions.
+    mode_stats: Dict[str, int]
+        Number of hkl to position calculations done with the compiled solver
+        strategy for each constraint mode.
 
     Methods
     -------
@@ -54,11 +129,64 @@ class HklCalculation:
         Calculate miller indices corresponding to a diffractometer positions.
     get_virtual_angles(pos: Position, asdegrees: bool = True) -> Dict[str,float]
         Calculate pseudo-angles corresponding to a diffractometer position.
+    get_hkl_array(angles: np.ndarray, wavelength: float) -> np.ndarray
+        Calculate miller indices for an array of diffractometer positions.
+    get_virtual_angles_array(angles: np.ndarray) -> np.ndarray
+        Calculate pseudo-angles for an array of diffractometer positions.
+    get_position(h: float, k: float, l: float, wavelength: float) -> List[Tuple[Position, Dict[str, float]]]
+        Calculate diffractometer positions from miller indices and wavelength.
+    get_positions(hkl: np.ndarray, wavelength: float) -> Tuple[np.ndarray, np.ndarray]
+        Calculate diffractometer positions for an array of miller indices.
     """
 
-    def __init__(self, ubcalc, constraints):
+    def __init__(
+        self, ubcalc, constraints, verify: str = "always", verify_every: int = 10
+    ):
         self.ubcalc = ubcalc  # to get the UBMatrix
         self.constraints = constraints
+        self.verify = verify
+        self.verify_every = verify_every
+        self.verification_stats: Dict[str, int] = {
+            "checked": 0,
+            "skipped": 0,
+            "failed": 0,
+        }
+        self._verify_count = 0
+        self.mode_stats: Dict[str, int] = {}
+        self._strategy: Optional[_SolverStrategy] = None
+
+    @property
+    def verify(self) -> str:
+        """Verification policy for calculated positions.
+
+        With "always" every solution is mapped back to miller indices and
+        virtual angles and a mismatch raises DiffcalcException. With "sampled"
+        only one in verify_every solutions is checked and failed solutions are
+        logged and discarded. With "off" solutions are not verified.
+        """
+        return self._verify
+
+    @verify.setter
+    def verify(self, policy: str) -> None:
+        if policy not in VERIFY_POLICIES:
+            raise DiffcalcException(
+                f"Invalid verification policy {policy}. "
+                f"Please choose one of {', '.join(VERIFY_POLICIES)}."
+            )
+        self._verify = policy
+
+    @property
+    def verify_every(self) -> int:
+        """Verify one in verify_every solutions with sampled verification policy."""
+        return self._verify_every
+
+    @verify_every.setter
+    def verify_every(self, every: int) -> None:
+        if int(every) < 1:
+            raise DiffcalcException(
+                "Verification sampling interval must be a positive integer."
+            )
+        self._verify_every = int(every)
 
     def __str__(self):
         """Return string representing class instance.
@@ -92,7 +220,7 @@ class HklCalculation:
 
         q_lab = (NU @ DELTA - I) @ np.array([[0], [2 * pi / wavelength], [0]])  # 12
 
-        hkl = inv(self.ubcalc.UB) @ inv(PHI) @ inv(CHI) @ inv(ETA) @ inv(MU) @ q_lab
+        hkl = self.ubcalc.inv_UB @ PHI.T @ CHI.T @ ETA.T @ MU.T @ q_lab
 
         return hkl[0, 0], hkl[1, 0], hkl[2, 0]
 
@@ -164,13 +292,136 @@ class HklCalculation:
             result = {key: degrees(val) for key, val in result.items()}
         return result
 
+    def get_hkl_array(
+        self, angles: np.ndarray, wavelength: float, indegrees: bool = True
+    ) -> np.ndarray:
+        """Calculate miller indices for an array of diffractometer positions.
+
+        Batch version of get_hkl using stacked rotation matrices.
+
+        Parameters
+        ----------
+        angles: np.ndarray
+            (N, 6) array of mu, delta, nu, eta, chi and phi angles.
+        wavelength: float
+            wavelength in Angstroms
+        indegrees: bool = True
+            If True, input angles are in degrees
+
+        Returns
+        -------
+        np.ndarray
+            (N, 3) array of miller indices corresponding to the specified
+            diffractometer positions at the given wavelength.
+        """
+        MU, DELTA, NU, ETA, CHI, PHI = get_rotation_matrices_array(angles, indegrees)
+        # q_lab = (NU @ DELTA - I) @ [0, 2 * pi / wavelength, 0]              (12)
+        q_lab = (np.einsum("nij,nj->ni", NU, DELTA[:, :, 1]) - I[1]) * (
+            2 * pi / wavelength
+        )
+        Z = MU @ ETA @ CHI @ PHI
+        q_phi = np.einsum("nji,nj->ni", Z, q_lab)  # inverse of rotation is transpose
+        return np.einsum("ij,nj->ni", self.ubcalc.inv_UB, q_phi)
+
+    def get_virtual_angles_array(
+        self, angles: np.ndarray, asdegrees: bool = True, indegrees: bool = True
+    ) -> np.ndarray:
+        """Calculate pseudo-angles for an array of diffractometer positions.
+
+        Batch version of get_virtual_angles. Angles that cannot be determined,
+        e.g. psi with reference vector parallel to the scattering vector,
+        are set to NaN.
+
+        Parameters
+        ----------
+        angles: np.ndarray
+            (N, 6) array of mu, delta, nu, eta, chi and phi angles.
+        asdegrees: bool = True
+            If True, return angles in degrees
+        indegrees: bool = True
+            If True, input angles are in degrees
+
+        Returns
+        -------
+        np.ndarray
+            (N,) structured array with alpha, beta, betain, betaout, naz, psi,
+            qaz, tau, theta and ttheta fields.
+        """
+        MU, DELTA, NU, ETA, CHI, PHI = get_rotation_matrices_array(angles, indegrees)
+        angles = np.atleast_2d(np.asarray(angles, dtype=float))
+        if indegrees:
+            angles = np.radians(angles)
+        delta, nu = angles[:, 1], angles[:, 2]
+
+        # Equation 19:
+        theta = np.arccos(bound_array(np.cos(delta) * np.cos(nu))) / 2.0
+        sgn = _sign_array(np.sin(2.0 * theta))
+        qaz = np.arctan2(sgn * np.sin(delta), sgn * np.cos(delta) * np.sin(nu))
+
+        Z = MU @ ETA @ CHI @ PHI
+        kout = np.einsum("nij,nj->ni", NU, DELTA[:, :, 1])
+
+        # Compute incidence and outgoing angles bin and betaout
+        surf_lab = np.einsum("nij,j->ni", Z, self.ubcalc.surf_nphi[:, 0])
+        surf_lab = surf_lab / norm(surf_lab, axis=1)[:, np.newaxis]
+        betain = np.arccos(bound_array(surf_lab[:, 1])) - pi / 2.0
+        betaout = pi / 2.0 - np.arccos(
+            bound_array(np.einsum("ni,ni->n", kout, surf_lab))
+        )
+
+        n_lab = np.einsum("nij,j->ni", Z, self.ubcalc.n_phi[:, 0])
+        alpha = np.arcsin(bound_array(-n_lab[:, 1]))
+        naz = np.arctan2(n_lab[:, 0], n_lab[:, 2])  # (20)
+
+        cos_tau = np.cos(alpha) * np.cos(theta) * np.cos(naz - qaz) + np.sin(
+            alpha
+        ) * np.sin(theta)
+        tau = np.arccos(bound_array(cos_tau))  # (23)
+
+        sin_beta = 2 * np.sin(theta) * np.cos(tau) - np.sin(alpha)
+        beta = np.arcsin(bound_array(sin_beta))  # (24)
+
+        # psi from Eq. (18), (25) and (28) with qaz and naz known
+        sin_tau = np.sin(tau)
+        cos_theta = np.cos(theta)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cos_psi = (np.cos(tau) * np.sin(theta) - np.sin(alpha)) / cos_theta
+            sin_psi = np.cos(alpha) * np.sin(qaz - naz)
+            sgn = _sign_array(sin_tau)
+            sigma_ = (sin_psi ** 2 + cos_psi ** 2) / sin_tau ** 2 - 1
+            psi = np.arctan2(sgn * sin_psi, sgn * cos_psi)
+        undefined = (
+            (np.abs(sin_tau) <= SMALL)
+            | (np.abs(cos_theta) <= SMALL)
+            | (np.abs(np.sin(theta)) <= SMALL)
+            | ~(np.abs(sigma_) <= SMALL)
+        )
+        psi[undefined] = np.nan
+
+        result = np.empty(len(angles), dtype=VIRTUAL_ANGLES_DTYPE)
+        result["theta"] = theta
+        result["ttheta"] = 2 * theta
+        result["qaz"] = qaz
+        result["alpha"] = alpha
+        result["naz"] = naz
+        result["tau"] = tau
+        result["psi"] = psi
+        result["beta"] = beta
+        result["betain"] = betain
+        result["betaout"] = betaout
+        if asdegrees:
+            for name in VIRTUAL_ANGLES_DTYPE.names:
+                result[name] = np.degrees(result[name])
+        return result
+
     def get_position(
         self, h: float, k: float, l: float, wavelength: float, asdegrees: bool = True
     ) -> List[Tuple[Position, Dict[str, float]]]:
         """Calculate diffractometer position from miller indices and wavelength.
 
         The calculated positions and angles are verified by checking that they
-        map to the requested miller indices.
+        map to the requested miller indices. How many solutions are checked is
+        set by the verify policy.
 
         Parameters
         ----------
@@ -197,8 +448,8 @@ class HklCalculation:
         results = []
 
         for pos, virtual_angles in pos_virtual_angles_pairs:
-            self._verify_pos_map_to_hkl(h, k, l, wavelength, pos)
-            self._verify_virtual_angles(h, k, l, pos, virtual_angles)
+            if not self._verify_solution(h, k, l, wavelength, pos, virtual_angles):
+                continue
             if asdegrees:
                 res_pos = Position.asdegrees(pos)
                 res_virtual_angles = {
@@ -211,9 +462,181 @@ class HklCalculation:
 
         return results
 
-    def _calc_hkl_to_position(
-        self, h: float, k: float, l: float, wavelength: float
-    ) -> List[Tuple[Position, Dict[str, float]]]:
+    def get_positions(
+        self, hkl: np.ndarray, wavelength: float, asdegrees: bool = True
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Calculate diffractometer positions for an array of miller indices.
+
+        Batch version of get_position for four-circle constraint modes with
+        one of delta or nu detector constraints, one of mu or eta sample
+        constraints and either phi, bisect or psi constraint, e.g. vertical
+        (mu = nu = 0) or horizontal (eta = delta = 0) geometry. All solution
+        branches are calculated in closed form over the whole array and are
+        verified with the same verification policy and statistics as
+        get_position.
+
+        Parameters
+        ----------
+        hkl: np.ndarray
+            (N, 3) array of miller indices.
+        wavelength: float
+            wavelength in Angstroms
+        asdegrees: bool = True
+            If True, return angles in degrees
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            (N, M, 6) array of mu, delta, nu, eta, chi and phi angles and
+            (N, M) structured array of corresponding virtual angles, where M is
+            the largest number of solutions found for a single reflection.
+            Solutions are listed in the same order as by get_position and
+            missing solutions are padded with NaN values.
+
+        Raises
+        ------
+        DiffcalcException
+            If the current constraint combination is not available for batch
+            calculation, or if a solution fails verification with "always"
+            verification policy.
+        """
+        hkl = np.atleast_2d(np.asarray(hkl, dtype=float))
+        if hkl.shape[-1] != 3:
+            raise ValueError("Miller indices array must have (N, 3) shape.")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            positions, failed = self._calc_hkl_to_position_array(hkl, wavelength)
+            positions = self._tidy_degenerate_solutions_array(positions)
+
+        n_hkl, n_branch = positions.shape[:2]
+        flat = positions.reshape(-1, 6)
+        valid = ~np.isnan(flat).any(axis=1) & np.repeat(~failed, n_branch)
+        virtual_angles = np.empty(len(flat), dtype=VIRTUAL_ANGLES_DTYPE)
+        virtual_angles[...] = np.nan
+        virtual_angles[valid] = self.get_virtual_angles_array(
+            flat[valid], asdegrees=False, indegrees=False
+        )
+        for constraint_name, constraint_value in self.constraints._reference.items():
+            diff = np.sin((constraint_value - virtual_angles[constraint_name]) / 2.0)
+            valid &= np.abs(diff) <= SMALL
+
+        index = np.flatnonzero(valid)
+        keep = self._verify_solutions_array(
+            np.repeat(hkl, n_branch, axis=0)[index],
+            wavelength,
+            flat[index],
+            virtual_angles[index],
+        )
+        valid[index[~keep]] = False
+
+        flat[~valid] = np.nan
+        virtual_angles[~valid] = np.nan
+        valid = valid.reshape(n_hkl, n_branch)
+        order = np.argsort(~valid, axis=1, kind="stable")
+        width = int(valid.sum(axis=1).max(initial=0))
+        positions = np.take_along_axis(
+            flat.reshape(n_hkl, n_branch, 6), order[:, :, np.newaxis], axis=1
+        )[:, :width]
+        virtual_angles = np.take_along_axis(
+            virtual_angles.reshape(n_hkl, n_branch), order, axis=1
+        )[:, :width]
+        if asdegrees:
+            positions = np.degrees(positions)
+            for name in VIRTUAL_ANGLES_DTYPE.names:
+                virtual_angles[name] = np.degrees(virtual_angles[name])
+        return positions, virtual_angles
+
+    def track_position(
+        self,
+        h: float,
+        k: float,
+        l: float,
+        wavelength: float,
+        seed: Position,
+        asdegrees: bool = True,
+        max_iterations: int = 10,
+    ) -> Optional[Tuple[Position, Dict[str, float]]]:
+        """Follow solution branch from a nearby diffractometer position.
+
+        Solve miller indices and constraint equations with Newton iterations
+        starting from the seed position and using finite difference Jacobian.
+        This is intended for small steps in scans or interactive updates, where
+        the previous position stays on the same solution branch.
+
+        Parameters
+        ----------
+        h: float
+            h miller index
+        k: float
+            k miller index
+        l: float
+            l miller index
+        wavelength: float
+            wavelength in Angstroms
+        seed: Position
+            Diffractometer position to start iterations from.
+        asdegrees: bool = True
+            If True, return angles in degrees
+        max_iterations: int = 10
+            Maximum number of Newton iterations.
+
+        Returns
+        -------
+        Optional[Tuple[Position, Dict[str, float]]]
+            Pair of diffractometer position and virtual angles dictionary or
+            None if the branch was lost, e.g. iterations did not converge,
+            the current constraint combination is not supported or the
+            position is degenerate. Use get_position to enumerate all solutions
+            in that case.
+        """
+        target = np.array([h, k, l], dtype=float)
+        angles = np.array(Position.asradians(seed).astuple, dtype=float)
+        step = 1e-6
+        for _ in range(max_iterations):
+            trial = angles + np.vstack([np.zeros(6), step * I6])
+            residuals = self._calc_constraint_residuals_array(trial)
+            if residuals is None:
+                return None
+            F = np.hstack(
+                [self.get_hkl_array(trial, wavelength, False) - target, residuals]
+            )
+            if not np.all(np.isfinite(F)):
+                return None
+            J = (F[1:] - F[0]).T / step
+            if np.linalg.cond(J) > 1e10:
+                # Degenerate position where solution is not locally unique
+                return None
+            if np.all(np.abs(F[0, :3]) < 1e-9) and np.all(np.abs(F[0, 3:]) < SMALL):
+                break
+            angles = angles - np.linalg.solve(J, F[0])
+        else:
+            return None
+
+        pos = Position(*angles, indegrees=False)
+        virtual_angles = self.get_virtual_angles(pos, False)
+        if asdegrees:
+            return (
+                Position.asdegrees(pos),
+                {key: degrees(val) for key, val in virtual_angles.items()},
+            )
+        return pos, virtual_angles
+
+    def _get_solver_strategy(self) -> "_SolverStrategy":
+        """Return solver strategy for the current constraint set.
+
+        The strategy is compiled again only if constraints were changed since
+        the previous call.
+        """
+        strategy = self._strategy
+        if (
+            strategy is None
+            or strategy.constraints is not self.constraints
+            or strategy.version != self.constraints.version
+        ):
+            strategy = self._compile_solver_strategy()
+            self._strategy = strategy
+        return strategy
+
+    def _compile_solver_strategy(self) -> "_SolverStrategy":
         if not self.constraints.is_fully_constrained():
             raise DiffcalcException(
                 "Diffcalc is not fully constrained.\n"
@@ -228,10 +651,6 @@ class HklCalculation:
 
         # constraints are dictionaries
         ref_constraint = self.constraints._reference
-        if ref_constraint:
-            ref_constraint_name, ref_constraint_value = next(
-                iter(ref_constraint.items())
-            )
         det_constraint = self.constraints._detector
         naz_constraint = {"naz": self.constraints.naz} if self.constraints.naz else None
         samp_constraints = self.constraints._sample
@@ -240,6 +659,194 @@ class HklCalculation:
             det_constraint and naz_constraint
         ), "Two 'detector' constraints given"
 
+        if ref_constraint:
+            ref_constraint_name, ref_constraint_value = next(
+                iter(ref_constraint.items())
+            )
+            use_surface = ref_constraint_name in {"bin_eq_bout", "betain", "betaout"}
+            reference = partial(
+                self._calc_reference_column,
+                ref_constraint_name,
+                ref_constraint_value,
+                use_surface,
+            )
+
+        if det_constraint or naz_constraint:
+            if len(samp_constraints) == 1:
+                solve = partial(
+                    self._solve_given_detector_reference_and_sample,
+                    reference,
+                    det_constraint,
+                    naz_constraint,
+                    samp_constraints,
+                )
+            elif len(samp_constraints) == 2 and det_constraint:
+                det_constraint_name, det_constraint_val = next(
+                    iter(det_constraint.items())
+                )
+                solve = partial(
+                    self._solve_given_detector_and_two_sample,
+                    det_constraint_name,
+                    det_constraint_val,
+                    samp_constraints,
+                )
+            else:
+                raise DiffcalcException(
+                    "No code yet to handle this combination of detector and sample constraints!"
+                )
+        elif len(samp_constraints) == 2:
+            solve = partial(
+                self._solve_given_reference_and_two_sample,
+                reference,
+                ref_constraint_name,
+                ref_constraint_value,
+                samp_constraints,
+            )
+        else:
+            solve = partial(
+                self._solve_given_three_sample,
+                samp_constraints,
+            )
+
+        name = ", ".join(self.constraints.asdict)
+        logger.debug("Compiled solver strategy for constraint mode %s", name)
+        self.mode_stats.setdefault(name, 0)
+        return _SolverStrategy(
+            name=name,
+            constraints=self.constraints,
+            version=self.constraints.version,
+            reference=ref_constraint,
+            detector=det_constraint,
+            sample=samp_constraints,
+            naz=self.constraints.naz,
+            solve=solve,
+        )
+
+    def _calc_reference_column(
+        self,
+        ref_constraint_name: str,
+        ref_constraint_value: float,
+        use_surface: bool,
+        theta: float,
+        tau: float,
+        surf_tau: float,
+    ) -> Tuple[float, float, np.ndarray]:
+        if use_surface:
+            alpha, _ = self._calc_remaining_reference_angles(
+                ref_constraint_name, ref_constraint_value, theta, surf_tau
+            )
+            return alpha, surf_tau, self.ubcalc.surf_nphi
+        # An angle for the reference vector (n) is given      (Section 5.2)
+        alpha, _ = self._calc_remaining_reference_angles(
+            ref_constraint_name, ref_constraint_value, theta, tau
+        )
+        return alpha, tau, self.ubcalc.n_phi
+
+    def _solve_given_detector_reference_and_sample(
+        self,
+        reference: Callable[[float, float, float], Tuple[float, float, np.ndarray]],
+        det_constraint: Dict[str, Optional[float]],
+        naz_constraint: Dict[str, Optional[float]],
+        samp_constraints: Dict[str, Optional[float]],
+        h_phi: np.ndarray,
+        theta: float,
+        tau: float,
+        surf_tau: float,
+    ) -> List[Tuple[float, float, float, float, float, float]]:
+        alpha, tau, n_phi = reference(theta, tau, surf_tau)
+        solution_tuples = []
+        for qaz, naz, delta, nu in self._calc_det_angles_given_det_or_naz_constraint(
+            det_constraint, naz_constraint, theta, tau, alpha
+        ):
+            for (
+                mu,
+                eta,
+                chi,
+                phi,
+            ) in self._calc_sample_angles_from_one_sample_constraint(
+                samp_constraints, h_phi, theta, alpha, qaz, naz, n_phi
+            ):
+                solution_tuples.append((mu, delta, nu, eta, chi, phi))
+        return solution_tuples
+
+    def _solve_given_detector_and_two_sample(
+        self,
+        det_constraint_name: str,
+        det_constraint_val: float,
+        samp_constraints: Dict[str, Optional[float]],
+        h_phi: np.ndarray,
+        theta: float,
+        tau: float,
+        surf_tau: float,
+    ) -> List[Tuple[float, float, float, float, float, float]]:
+        n_phi = self.ubcalc.n_phi
+        solution_tuples = []
+        for delta, nu, qaz in self._calc_remaining_detector_angles(
+            det_constraint_name, det_constraint_val, theta
+        ):
+            for (
+                mu,
+                eta,
+                chi,
+                phi,
+            ) in self._calc_sample_angles_given_two_sample_and_detector(
+                samp_constraints, qaz, theta, h_phi, n_phi
+            ):
+                solution_tuples.append((mu, delta, nu, eta, chi, phi))
+        return solution_tuples
+
+    def _solve_given_reference_and_two_sample(
+        self,
+        reference: Callable[[float, float, float], Tuple[float, float, np.ndarray]],
+        ref_constraint_name: str,
+        ref_constraint_value: float,
+        samp_constraints: Dict[str, Optional[float]],
+        h_phi: np.ndarray,
+        theta: float,
+        tau: float,
+        surf_tau: float,
+    ) -> List[Tuple[float, float, float, float, float, float]]:
+        alpha, tau, n_phi = reference(theta, tau, surf_tau)
+        if ref_constraint_name == "psi":
+            psi_vals = iter(
+                [
+                    ref_constraint_value,
+                ]
+            )
+        else:
+            psi_vals = self._calc_psi(alpha, theta, tau)
+        solution_tuples = []
+        for psi in psi_vals:
+            solution_tuples.extend(
+                self._calc_sample_given_two_sample_and_reference(
+                    samp_constraints, h_phi, theta, psi, n_phi
+                )
+            )
+        return solution_tuples
+
+    def _solve_given_three_sample(
+        self,
+        samp_constraints: Dict[str, Optional[float]],
+        h_phi: np.ndarray,
+        theta: float,
+        tau: float,
+        surf_tau: float,
+    ) -> List[Tuple[float, float, float, float, float, float]]:
+        return list(
+            self._calc_angles_given_three_sample_constraints(
+                samp_constraints,
+                h_phi,
+                theta,
+            )
+        )
+
+    def _calc_hkl_to_position(
+        self, h: float, k: float, l: float, wavelength: float
+    ) -> List[Tuple[Position, Dict[str, float]]]:
+        strategy = self._get_solver_strategy()
+        self.mode_stats[strategy.name] += 1
+        ref_constraint_name = next(iter(strategy.reference), None)
+
         h_phi = self.ubcalc.UB @ np.array([[h], [k], [l]])
         theta = (
             self.ubcalc.get_ttheta_from_hkl((h, k, l), 12.39842 / wavelength) / 2.0
@@ -247,7 +854,7 @@ class HklCalculation:
         tau = angle_between_vectors(h_phi, self.ubcalc.n_phi)
         surf_tau = angle_between_vectors(h_phi, self.ubcalc.surf_nphi)
 
-        if is_small(sin(tau)) and ref_constraint:
+        if is_small(sin(tau)):
             if ref_constraint_name == "psi":
                 raise DiffcalcException(
                     "Azimuthal angle 'psi' is undefined as reference and scattering vectors parallel.\n"
@@ -258,101 +865,13 @@ class HklCalculation:
                     "Reference constraint 'a_eq_b' is redundant as reference and scattering vectors are parallel.\n"
                     "Please constrain one of the sample angles or choose different reference vector orientation."
                 )
-        if (
-            is_small(sin(surf_tau))
-            and ref_constraint
-            and ref_constraint_name == "bin_eq_bout"
-        ):
+        if is_small(sin(surf_tau)) and ref_constraint_name == "bin_eq_bout":
             raise DiffcalcException(
                 "Reference constraint 'bin_eq_bout' is redundant as scattering vectors is parallel to the surface normal.\n"
                 "Please select another constrain to define sample azimuthal orientation."
             )
 
-        ### Reference constraint column ###
-
-        n_phi = self.ubcalc.n_phi
-        if ref_constraint:
-            if {"psi", "a_eq_b", "alpha", "beta"}.issuperset(ref_constraint.keys()):
-                # An angle for the reference vector (n) is given      (Section 5.2)
-                alpha, _ = self._calc_remaining_reference_angles(
-                    ref_constraint_name, ref_constraint_value, theta, tau
-                )
-            elif {"bin_eq_bout", "betain", "betaout"}.issuperset(ref_constraint.keys()):
-                alpha, _ = self._calc_remaining_reference_angles(
-                    ref_constraint_name, ref_constraint_value, theta, surf_tau
-                )
-                tau = surf_tau
-                n_phi = self.ubcalc.surf_nphi
-
-        solution_tuples = []
-        if det_constraint or naz_constraint:
-
-            if len(samp_constraints) == 1:
-                for (
-                    qaz,
-                    naz,
-                    delta,
-                    nu,
-                ) in self._calc_det_angles_given_det_or_naz_constraint(
-                    det_constraint, naz_constraint, theta, tau, alpha
-                ):
-                    for (
-                        mu,
-                        eta,
-                        chi,
-                        phi,
-                    ) in self._calc_sample_angles_from_one_sample_constraint(
-                        samp_constraints, h_phi, theta, alpha, qaz, naz, n_phi
-                    ):
-                        solution_tuples.append((mu, delta, nu, eta, chi, phi))
-
-            elif len(samp_constraints) == 2:
-                if det_constraint:
-                    det_constraint_name, det_constraint_val = next(
-                        iter(det_constraint.items())
-                    )
-                    for delta, nu, qaz in self._calc_remaining_detector_angles(
-                        det_constraint_name, det_constraint_val, theta
-                    ):
-                        for (
-                            mu,
-                            eta,
-                            chi,
-                            phi,
-                        ) in self._calc_sample_angles_given_two_sample_and_detector(
-                            samp_constraints, qaz, theta, h_phi, n_phi
-                        ):
-                            solution_tuples.append((mu, delta, nu, eta, chi, phi))
-
-                else:
-                    raise DiffcalcException(
-                        "No code yet to handle this combination of detector and sample constraints!"
-                    )
-
-        elif len(samp_constraints) == 2:
-            if ref_constraint_name == "psi":
-                psi_vals = iter(
-                    [
-                        ref_constraint_value,
-                    ]
-                )
-            else:
-                psi_vals = self._calc_psi(alpha, theta, tau)
-            for psi in psi_vals:
-                solution_tuples.extend(
-                    self._calc_sample_given_two_sample_and_reference(
-                        samp_constraints, h_phi, theta, psi, n_phi
-                    )
-                )
-
-        elif len(samp_constraints) == 3:
-            solution_tuples.extend(
-                self._calc_angles_given_three_sample_constraints(
-                    samp_constraints,
-                    h_phi,
-                    theta,
-                )
-            )
+        solution_tuples = strategy.solve(h_phi, theta, tau, surf_tau)
 
         if not solution_tuples:
             raise DiffcalcException(
@@ -387,6 +906,7 @@ class HklCalculation:
         self, merged_solution_tuples: List[Position]
     ) -> List[Tuple[Position, Dict[str, float]]]:
 
+        strategy = self._get_solver_strategy()
         position_pseudo_angles_pairs = []
         for position in merged_solution_tuples:
             # Create position
@@ -400,8 +920,8 @@ class HklCalculation:
             pseudo_angles = self.get_virtual_angles(position, False)
             try:
                 for constraint in [
-                    self.constraints._reference,
-                    self.constraints._detector,
+                    strategy.reference,
+                    strategy.detector,
                 ]:
                     for constraint_name, constraint_value in constraint.items():
                         if constraint_name == "a_eq_b":
@@ -974,9 +1494,9 @@ class HklCalculation:
         h0, h1, h2 = h_phi_norm[0, 0], h_phi_norm[1, 0], h_phi_norm[2, 0]
 
         if "mu" not in samp_constraints:
-            eta = self.constraints._sample["eta"]
-            chi = self.constraints._sample["chi"]
-            phi = self.constraints._sample["phi"]
+            eta = samp_constraints["eta"]
+            chi = samp_constraints["chi"]
+            phi = samp_constraints["phi"]
 
             A = h0 * cos(phi) * sin(chi) + h1 * sin(chi) * sin(phi) - h2 * cos(chi)
             B = (
@@ -1001,9 +1521,9 @@ class HklCalculation:
                     yield mu, delta, nu, eta, chi, phi
 
         elif "eta" not in samp_constraints:
-            mu = self.constraints._sample["mu"]
-            chi = self.constraints._sample["chi"]
-            phi = self.constraints._sample["phi"]
+            mu = samp_constraints["mu"]
+            chi = samp_constraints["chi"]
+            phi = samp_constraints["phi"]
 
             A = (
                 -h0 * cos(chi) * cos(mu) * cos(phi)
@@ -1033,9 +1553,9 @@ class HklCalculation:
                     yield mu, delta, nu, eta, chi, phi
 
         elif "chi" not in samp_constraints:
-            mu = self.constraints._sample["mu"]
-            eta = self.constraints._sample["eta"]
-            phi = self.constraints._sample["phi"]
+            mu = samp_constraints["mu"]
+            eta = samp_constraints["eta"]
+            phi = samp_constraints["phi"]
 
             A = (
                 -h2 * cos(mu) * sin(eta)
@@ -1066,9 +1586,9 @@ class HklCalculation:
                     yield mu, delta, nu, eta, chi, phi
 
         elif "phi" not in samp_constraints:
-            mu = self.constraints._sample["mu"]
-            eta = self.constraints._sample["eta"]
-            chi = self.constraints._sample["chi"]
+            mu = samp_constraints["mu"]
+            eta = samp_constraints["eta"]
+            chi = samp_constraints["chi"]
 
             A = h1 * sin(chi) * sin(mu) - (
                 h1 * cos(chi) * sin(eta) + h0 * cos(eta)
@@ -1662,12 +2182,13 @@ class HklCalculation:
         self, pos: Position, print_degenerate: bool = False
     ) -> Position:
 
-        detector_like_constraint = self.constraints._detector or self.constraints.naz
+        strategy = self._get_solver_strategy()
+        detector_like_constraint = strategy.detector or strategy.naz
         nu_constrained_to_0 = is_small(pos.nu) and detector_like_constraint
-        mu_constrained_to_0 = is_small(pos.mu) and "mu" in self.constraints._sample
+        mu_constrained_to_0 = is_small(pos.mu) and "mu" in strategy.sample
         delta_constrained_to_0 = is_small(pos.delta) and detector_like_constraint
-        eta_constrained_to_0 = is_small(pos.eta) and "eta" in self.constraints._sample
-        phi_not_constrained = "phi" not in self.constraints._sample
+        eta_constrained_to_0 = is_small(pos.eta) and "eta" in strategy.sample
+        phi_not_constrained = "phi" not in strategy.sample
 
         if (
             nu_constrained_to_0
@@ -1726,6 +2247,124 @@ class HklCalculation:
             newpos = pos
         return newpos
 
+    def _verify_solution(
+        self,
+        h: float,
+        k: float,
+        l: float,
+        wavelength: float,
+        pos: Position,
+        virtual_angles: Dict[str, float],
+    ) -> bool:
+        """Verify solution according to the verification policy.
+
+        Returns False if sampled verification failed and solution should be
+        discarded.
+        """
+        if self.verify == "off":
+            self.verification_stats["skipped"] += 1
+            return True
+        if self.verify == "sampled":
+            self._verify_count += 1
+            if self._verify_count % self.verify_every:
+                self.verification_stats["skipped"] += 1
+                return True
+        self.verification_stats["checked"] += 1
+        try:
+            self._verify_pos_map_to_hkl(h, k, l, wavelength, pos)
+            self._verify_virtual_angles(h, k, l, pos, virtual_angles)
+        except DiffcalcException as e:
+            self.verification_stats["failed"] += 1
+            if self.verify == "always":
+                raise
+            logger.warning(
+                "Discarded solution that failed sampled verification "
+                "(%d failures so far):%s",
+                self.verification_stats["failed"],
+                e,
+            )
+            return False
+        return True
+
+    def _verify_solutions_array(
+        self,
+        hkl: np.ndarray,
+        wavelength: float,
+        angles: np.ndarray,
+        virtual_angles: np.ndarray,
+    ) -> np.ndarray:
+        """Verify array of solutions according to the verification policy.
+
+        Batch version of _verify_solution with the same sampling and
+        statistics. Miller indices are checked with get_hkl_array and the
+        constrained virtual angles are compared with the constraint values.
+
+        Returns boolean array, False for solutions that failed sampled
+        verification and should be discarded.
+        """
+        keep = np.ones(len(angles), dtype=bool)
+        if self.verify == "off":
+            self.verification_stats["skipped"] += len(angles)
+            return keep
+        checked = np.ones(len(angles), dtype=bool)
+        if self.verify == "sampled":
+            count = self._verify_count + np.arange(1, len(angles) + 1)
+            self._verify_count += len(angles)
+            checked = count % self.verify_every == 0
+            self.verification_stats["skipped"] += int(np.count_nonzero(~checked))
+        self.verification_stats["checked"] += int(np.count_nonzero(checked))
+
+        index = np.flatnonzero(checked)
+        hkl_readback = self.get_hkl_array(angles[index], wavelength, indegrees=False)
+        mismatch = np.any(np.abs(hkl_readback - hkl[index]) > 0.001, axis=1)
+        errors = {}
+        for i, readback in zip(index[mismatch], hkl_readback[mismatch]):
+            errors[i] = (
+                "ERROR: The angles calculated for hkl=(%f,%f,%f) were %s.\n"
+                % (*hkl[i], str(Position(*angles[i], indegrees=False)))
+            )
+            errors[i] += "Converting these angles back to hkl resulted in hkl=" "(%f,%f,%f)" % (
+                *readback,
+            )
+        for name, value in self._constrained_virtual_angles().items():
+            readback = virtual_angles[name][index]
+            wrong = ~mismatch & (np.abs(np.sin((value - readback) / 2.0)) > 1e-5)
+            for i, val in zip(index[wrong], readback[wrong]):
+                errors.setdefault(
+                    i,
+                    "ERROR: The angles calculated for hkl=(%f,%f,%f) with"
+                    " mode=%s were %s.\n"
+                    % (*hkl[i], self.__repr_mode(), str(Position(*angles[i], indegrees=False)))
+                    + "During verification the virtual angle %s set for this "
+                    "calculation of %f did not match that calculated from the "
+                    "angles of %f" % (name, value, val),
+                )
+        if not errors:
+            return keep
+
+        self.verification_stats["failed"] += len(errors)
+        if self.verify == "always":
+            raise DiffcalcException(errors[min(errors)])
+        logger.warning(
+            "Discarded %d solutions that failed sampled verification "
+            "(%d failures so far):%s",
+            len(errors),
+            self.verification_stats["failed"],
+            errors[min(errors)],
+        )
+        keep[list(errors)] = False
+        return keep
+
+    def _constrained_virtual_angles(self) -> Dict[str, float]:
+        """Return constrained virtual angle names and values in radians."""
+        return {
+            con.name: con.value
+            for con in self.constraints._constrained
+            if con.name in VIRTUAL_ANGLES_DTYPE.names
+            and not isinstance(con.value, bool)
+            and con.value is not None
+        }
+
     def _theta_and_qaz_from_detector_angles(
         self, delta: float, nu: float
     ) -> Tuple[float, float]:
@@ -1785,3 +2424,587 @@ class HklCalculation:
                         "anglesToVirtualAngles of %f" % virtual_angles_readback[key]
                     )
                     raise DiffcalcException(s)
+
+    def _calc_constraint_residuals_array(
+        self, angles: np.ndarray
+    ) -> Optional[np.ndarray]:
+        """Return (N, 3) array of constraint equation residuals.
+
+        Form of the bisect constraint equation is chosen using the first
+        position in the array. Returns None if the constraints cannot be
+        expressed as residuals.
+        """
+        if not self.constraints.is_fully_constrained():
+            return None
+        constraints = {
+            **self.constraints._detector,
+            **self.constraints._reference,
+            **self.constraints._sample,
+        }
+        if "omega" in constraints:
+            return None
+        virtual_angles = None
+        if not constraints.keys().isdisjoint(
+            VIRTUAL_ANGLES_DTYPE.names + ("a_eq_b", "bin_eq_bout")
+        ):
+            virtual_angles = self.get_virtual_angles_array(
+                angles, asdegrees=False, indegrees=False
+            )
+        residuals = []
+        for name, value in constraints.items():
+            if name in Position.fields:
+                diff = angles[:, Position.fields.index(name)] - value
+            elif name == "bisect":
+                # tan(mu) = tan(thomega) * cos(qaz) and
+                # sin(eta) = sin(thomega) * sin(qaz)
+                mu, delta, nu, eta = angles[:, :4].T
+                theta = np.arccos(bound_array(np.cos(delta) * np.cos(nu))) / 2.0
+                sgn = _sign_array(np.sin(2.0 * theta))
+                qaz = np.arctan2(sgn * np.sin(delta), sgn * np.cos(delta) * np.sin(nu))
+                if (
+                    "mu" in constraints
+                    and is_small(cos(qaz[0]))
+                    and is_small(tan(mu[0]))
+                ):
+                    # Vertical scattering geometry with thomega = theta
+                    residuals.append(np.sin(eta) - np.sin(theta) * np.sin(qaz))
+                elif (
+                    "eta" in constraints
+                    and is_small(sin(qaz[0]))
+                    and is_small(sin(eta[0]))
+                ):
+                    # Horizontal scattering geometry with thomega = theta
+                    residuals.append(
+                        np.sin(mu) * np.cos(theta)
+                        - np.cos(mu) * np.sin(theta) * np.cos(qaz)
+                    )
+                else:
+                    # Eta rotated y axis is in the scattering plane
+                    residuals.append(
+                        np.sin(eta) * np.cos(qaz)
+                        - np.sin(mu) * np.cos(eta) * np.sin(qaz)
+                    )
+                continue
+            elif name == "a_eq_b":
+                diff = virtual_angles["alpha"] - virtual_angles["beta"]
+            elif name == "bin_eq_bout":
+                diff = virtual_angles["betain"] - virtual_angles["betaout"]
+            else:
+                diff = virtual_angles[name] - value
+            residuals.append(np.arctan2(np.sin(diff), np.cos(diff)))
+        return np.stack(residuals, axis=-1)
+
+    def _calc_hkl_to_position_array(
+        self, hkl: np.ndarray, wavelength: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (N, M, 6) array of candidate positions and failed hkl mask.
+
+        Candidate solution branches that do not exist are set to NaN. Failed
+        mask marks miller indices for which get_position raises an exception.
+        """
+        if not self.constraints.is_fully_constrained():
+            raise DiffcalcException(
+                "Diffcalc is not fully constrained.\n"
+                "Type 'help con' for instructions"
+            )
+        det_constraint = self.constraints._detector
+        ref_constraint = self.constraints._reference
+        samp_constraints = self.constraints._sample
+        if not (
+            len(det_constraint) == 1
+            and {"delta", "nu"}.issuperset(det_constraint)
+            and (
+                (
+                    len(samp_constraints) == 2
+                    and len({"mu", "eta"}.intersection(samp_constraints)) == 1
+                    and len({"phi", "bisect"}.intersection(samp_constraints)) == 1
+                )
+                or (
+                    len(samp_constraints) == 1
+                    and {"mu", "eta"}.issuperset(samp_constraints)
+                    and set(ref_constraint) == {"psi"}
+                )
+            )
+        ):
+            raise DiffcalcException(
+                "Batch calculation is only available for delta or nu detector, "
+                "mu or eta sample and phi, bisect or psi constraints.\n"
+                "Please use get_position for the current constraint combination."
+            )
+        if self.ubcalc.crystal is None:
+            raise DiffcalcException(
+                "Cannot calculate theta angle as no lattice parameters have been specified."
+            )
+        det_constraint_name, det_constraint_value = next(iter(det_constraint.items()))
+
+        h_phi = hkl @ self.ubcalc.UB.T
+        q_length = norm(hkl @ self.ubcalc.B.T, axis=1)
+        theta = np.arcsin(wavelength * q_length / (4 * pi))
+        failed = np.abs(np.sin(2 * theta)) <= SMALL
+        n_phi = self.ubcalc.n_phi[:, 0]
+        tau = np.arccos(
+            bound_array(h_phi @ n_phi / (norm(h_phi, axis=1) * norm(n_phi)))
+        )
+
+        delta, nu, qaz = self._calc_remaining_detector_angles_array(
+            det_constraint_name, det_constraint_value, theta
+        )
+        if ref_constraint:
+            psi = ref_constraint["psi"]
+            failed |= np.abs(np.sin(tau)) <= SMALL
+            # Equations 26 and 27 for alpha and beta
+            sin_alpha = np.cos(tau) * np.sin(theta) - np.cos(theta) * np.sin(tau) * cos(
+                psi
+            )
+            sin_beta = np.cos(tau) * np.sin(theta) + np.cos(theta) * np.sin(tau) * cos(
+                psi
+            )
+            failed |= (np.abs(sin_alpha) > 1 + SMALL) | (np.abs(sin_beta) > 1 + SMALL)
+            alpha = np.arcsin(bound_array(sin_alpha))
+
+            # Equation 30:
+            top = np.cos(tau) - np.sin(alpha) * np.sin(theta)
+            bottom = np.cos(alpha) * np.cos(theta)
+            failed |= (np.abs(bottom) <= SMALL) & (
+                (np.abs(np.cos(alpha)) <= SMALL) | (np.abs(np.cos(theta)) <= SMALL)
+            )
+            naz_qaz_angle = np.where(
+                np.abs(np.sin(tau)) <= SMALL,
+                0.0,
+                np.arccos(bound_array(top / bottom)),
+            )[:, np.newaxis, np.newaxis]
+            single = np.abs(naz_qaz_angle) <= SMALL
+            naz = np.stack(
+                [
+                    np.where(
+                        single,
+                        qaz[:, :, np.newaxis],
+                        qaz[:, :, np.newaxis] - naz_qaz_angle,
+                    ),
+                    np.where(single, np.nan, qaz[:, :, np.newaxis] + naz_qaz_angle),
+                ],
+                axis=2,
+            ).reshape(len(hkl), -1)
+            delta, nu, qaz = (np.repeat(arr, 2, axis=1) for arr in (delta, nu, qaz))
+
+            q_lab = _vector_from_azimuth_array(theta[:, np.newaxis], qaz)  # (18)
+            n_lab = _vector_from_azimuth_array(alpha[:, np.newaxis], naz)  # (20)
+            sample_angles, samp_failed = self._calc_remaining_sample_angles_array(
+                *next(iter(samp_constraints.items())), q_lab, n_lab, h_phi, n_phi
+            )
+        else:
+            (
+                sample_angles,
+                samp_failed,
+            ) = self._calc_sample_angles_given_two_sample_and_detector_array(
+                samp_constraints, qaz, theta, h_phi
+            )
+        failed |= samp_failed
+
+        mu, eta, chi, phi = np.moveaxis(sample_angles, -1, 0)
+        n_samp = mu.shape[-1]
+        positions = np.stack(
+            [
+                mu,
+                np.repeat(delta[:, :, np.newaxis], n_samp, axis=2),
+                np.repeat(nu[:, :, np.newaxis], n_samp, axis=2),
+                eta,
+                chi,
+                phi,
+            ],
+            axis=-1,
+        ).reshape(len(hkl), -1, 6)
+        positions[np.isnan(positions).any(axis=-1)] = np.nan
+        return positions, failed
+
+    def _calc_N_array(self, Q: np.ndarray, n: np.ndarray) -> np.ndarray:
+        """Return stack of N matrices as described by Equation 31."""
+        Q = Q / norm(Q, axis=-1)[..., np.newaxis]
+        n = np.broadcast_to(n / norm(n), Q.shape) if n.ndim == 1 else n
+        n = n / norm(n, axis=-1)[..., np.newaxis]
+        Qxn = np.cross(Q, n)
+        QxnxQ = np.cross(Qxn, Q)
+        N = np.stack(
+            [
+                Q,
+                QxnxQ / norm(QxnxQ, axis=-1)[..., np.newaxis],
+                Qxn / norm(Qxn, axis=-1)[..., np.newaxis],
+            ],
+            axis=-1,
+        )
+        parallel = np.arccos(bound_array(np.sum(Q * n, axis=-1))) <= SMALL
+        for idx in zip(*np.nonzero(parallel)):
+            # Alternative reference vector from Eq.(78) is rarely needed
+            N[idx] = self._calc_N(Q[idx][:, np.newaxis], n[idx][:, np.newaxis].copy())
+        return N
+
+    def _calc_remaining_detector_angles_array(
+        self, constraint_name: str, constraint_value: float, theta: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (N, 4) arrays of delta, nu and qaz given one detector angle."""
+        sin_2theta = np.sin(2 * theta)[:, np.newaxis]
+        cos_2theta = np.cos(2 * theta)[:, np.newaxis]
+        shape = (len(theta), 2, 2)
+
+        if constraint_name == "delta":
+            delta = constraint_value
+            asin_qaz = np.arcsin(bound_array(sin(delta) / sin_2theta))  # (17 & 18)
+            cos_delta = cos(delta)
+            if is_small(cos_delta):
+                acos_nu = np.ones_like(asin_qaz)
+            else:
+                acos_nu = np.arccos(bound_array(cos_2theta / cos_delta))
+            single = np.abs(np.cos(asin_qaz)) <= SMALL
+            qaz_angles = np.stack(
+                [
+                    np.where(single, _sign_array(asin_qaz) * pi / 2.0, asin_qaz),
+                    np.where(single, np.nan, pi - asin_qaz),
+                ],
+                axis=1,
+            )
+            single = np.abs(acos_nu) <= SMALL
+            nu_angles = np.stack(
+                [
+                    np.where(single, 0.0, acos_nu),
+                    np.where(single, np.nan, -acos_nu),
+                ],
+                axis=2,
+            )
+            qaz = np.broadcast_to(qaz_angles, shape).reshape(len(theta), -1)
+            nu = np.broadcast_to(nu_angles, shape).reshape(len(theta), -1)
+            delta = np.full_like(qaz, delta)
+            sgn_ref = _sign_array(sin_2theta) * _sign_array(np.cos(qaz))
+            sgn_ratio = _sign_array(np.sin(nu)) * sign(cos_delta)
+
+        elif constraint_name == "nu":
+            nu = constraint_value
+            cos_nu = cos(nu)
+            if is_small(cos_nu):
+                raise DiffcalcException(
+                    "The %s circle constraint to %.0f degrees is redundant."
+                    "Please change this constraint or use 4-circle mode."
+                    % ("nu", degrees(nu))
+                )
+            cos_delta = cos_2theta / cos_nu
+            cos_qaz = cos_delta * sin(nu) / sin_2theta
+            acos_delta = np.arccos(bound_array(cos_delta))
+            acos_qaz = np.arccos(bound_array(cos_qaz))
+            single = np.abs(acos_qaz) <= SMALL
+            qaz_angles = np.stack(
+                [
+                    np.where(single, 0.0, acos_qaz),
+                    np.where(single, np.nan, -acos_qaz),
+                ],
+                axis=1,
+            )
+            single = np.abs(acos_delta) <= SMALL
+            delta_angles = np.stack(
+                [
+                    np.where(single, 0.0, acos_delta),
+                    np.where(single, np.nan, -acos_delta),
+                ],
+                axis=2,
+            )
+            qaz = np.broadcast_to(qaz_angles, shape).reshape(len(theta), -1)
+            delta = np.broadcast_to(delta_angles, shape).reshape(len(theta), -1)
+            nu = np.full_like(qaz, nu)
+            sgn_ref = _sign_array(np.sin(delta))
+            sgn_ratio = _sign_array(np.sin(qaz)) * _sign_array(sin_2theta)
+
+        else:
+            raise DiffcalcException(
+                constraint_name + " is not a detector angle supported in batch mode"
+            )
+
+        invalid = (sgn_ref != sgn_ratio) | (np.abs(sin_2theta) <= SMALL)
+        delta, nu, qaz = (np.where(invalid, np.nan, arr) for arr in (delta, nu, qaz))
+        return delta, nu, qaz
+
+    def _calc_remaining_sample_angles_array(
+        self,
+        constraint_name: str,
+        constraint_value: float,
+        q_lab: np.ndarray,
+        n_lab: np.ndarray,
+        q_phi: np.ndarray,
+        n_phi: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (N, M, 2, 4) array of mu, eta, chi and phi given mu or eta."""
+        N_lab = self._calc_N_array(q_lab, n_lab)
+        N_phi = self._calc_N_array(q_phi, n_phi)
+        Z = N_lab @ np.swapaxes(N_phi, -1, -2)[:, np.newaxis]
+        failed = np.zeros(len(q_phi), dtype=bool)
+
+        if constraint_name == "mu":  # (35)
+            mu = constraint_value
+            V = rot_MU(mu).T @ Z
+            acos_chi = np.arccos(bound_array(V[..., 2, 2]))
+            degenerate = (np.abs(np.sin(acos_chi)) <= SMALL)[..., np.newaxis]
+            chi = np.stack([acos_chi, -acos_chi], axis=-1)
+            sgn = _sign_array(np.sin(chi))
+            phi = np.arctan2(
+                -sgn * V[..., 2, 1, np.newaxis], -sgn * V[..., 2, 0, np.newaxis]
+            )
+            eta = np.arctan2(
+                -sgn * V[..., 1, 2, np.newaxis], sgn * V[..., 0, 2, np.newaxis]
+            )
+            # chi ~= 0 or 180 and therefore phi || eta, choose eta=0
+            first = np.array([True, False])
+            degenerate_phi = np.arctan2(-V[..., 1, 0], V[..., 1, 1])[..., np.newaxis]
+            chi = np.where(
+                degenerate, np.where(first, acos_chi[..., np.newaxis], np.nan), chi
+            )
+            eta = np.where(degenerate, np.where(first, 0.0, np.nan), eta)
+            phi = np.where(degenerate, np.where(first, degenerate_phi, np.nan), phi)
+            mu = np.full_like(chi, mu)
+
+        elif constraint_name == "eta":  # (39)
+            eta = constraint_value
+            cos_eta = cos(eta)
+            if is_small(cos_eta):
+                raise DiffcalcException(
+                    "Chi and mu cannot be chosen uniquely with eta "
+                    "constrained so close to +-90."
+                )
+            asin_chi = np.arcsin(bound_array(Z[..., 0, 2] / cos_eta))
+            chi = np.stack([asin_chi, pi - asin_chi], axis=-1)
+            Z = Z[..., np.newaxis, :, :]
+            top_for_mu = Z[..., 2, 2] * sin(eta) * np.sin(chi) + Z[..., 1, 2] * np.cos(
+                chi
+            )
+            bot_for_mu = -Z[..., 2, 2] * np.cos(chi) + Z[..., 1, 2] * sin(eta) * np.sin(
+                chi
+            )
+            failed |= np.any(
+                (np.abs(top_for_mu) <= SMALL) & (np.abs(bot_for_mu) <= SMALL),
+                axis=(1, 2),
+            )
+            mu = np.arctan2(-top_for_mu, -bot_for_mu)  # (41)
+            top_for_phi = Z[..., 0, 1] * cos(eta) * np.cos(chi) - Z[..., 0, 0] * sin(
+                eta
+            )
+            bot_for_phi = Z[..., 0, 1] * sin(eta) + Z[..., 0, 0] * cos(eta) * np.cos(
+                chi
+            )
+            phi = np.arctan2(top_for_phi, bot_for_phi)  # (42)
+            eta = np.full_like(chi, eta)
+
+        else:
+            raise DiffcalcException(
+                "Given angle must be one of eta or mu in batch mode"
+            )
+        return np.stack([mu, eta, chi, phi], axis=-1), failed
+
+    def _calc_sample_angles_given_two_sample_and_detector_array(
+        self,
+        samp_constraints: Dict[str, Optional[float]],
+        qaz: np.ndarray,
+        theta: np.ndarray,
+        q_phi: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (N, M, K, 4) array of mu, eta, chi and phi.
+
+        Available combinations:
+        mu, phi, detector
+        eta, phi, detector
+        mu, bisect, detector
+        eta, bisect, detector
+        """
+        # Only the first column of N_phi matrix is required here
+        N_phi = q_phi / norm(q_phi, axis=1)[:, np.newaxis]
+        N0, N1, N2 = (N_phi[:, idx, np.newaxis] for idx in range(3))
+        theta = theta[:, np.newaxis]
+        q_lab = _vector_from_azimuth_array(theta, qaz)  # (18)
+        failed = np.zeros(len(q_phi), dtype=bool)
+
+        if "bisect" in samp_constraints:
+            if "mu" in samp_constraints:
+                mu = samp_constraints["mu"]
+                cos_qaz = np.cos(qaz)
+                tan_mu = tan(mu)
+                # Vertical scattering geometry with omega = 0
+                atan_thomega = np.arctan(tan_mu / cos_qaz)
+                thomega = np.where(
+                    (np.abs(cos_qaz) <= SMALL)[..., np.newaxis],
+                    np.where(
+                        np.array([is_small(tan_mu), False]),
+                        theta[..., np.newaxis],
+                        np.nan,
+                    ),
+                    np.stack([atan_thomega, pi + atan_thomega], axis=-1),
+                )
+                asin_eta = np.arcsin(np.sin(thomega) * np.sin(qaz)[..., np.newaxis])
+                single = np.abs(np.abs(asin_eta) - pi / 2) <= SMALL
+                eta = np.stack(
+                    [
+                        np.where(single, _sign_array(asin_eta) * pi / 2, asin_eta),
+                        np.where(single, np.nan, pi - asin_eta),
+                    ],
+                    axis=-1,
+                ).reshape(qaz.shape + (4,))
+                mu = np.full_like(eta, mu)
+            else:
+                eta = samp_constraints["eta"]
+                sin_qaz = np.sin(qaz)
+                sin_eta = sin(eta)
+                # Horizontal scattering geometry with omega = 0
+                asin_thomega = np.arcsin(sin_eta / sin_qaz)
+                single = np.abs(np.abs(asin_thomega) - pi / 2) <= SMALL
+                thomega = np.stack(
+                    [
+                        np.where(
+                            single, _sign_array(asin_thomega) * pi / 2, asin_thomega
+                        ),
+                        np.where(single, np.nan, pi - asin_thomega),
+                    ],
+                    axis=-1,
+                )
+                degenerate = (np.abs(sin_qaz) <= SMALL)[..., np.newaxis]
+                thomega = np.where(
+                    degenerate,
+                    np.where(
+                        np.array([is_small(sin_eta), False]),
+                        theta[..., np.newaxis],
+                        np.nan,
+                    ),
+                    thomega,
+                )
+                atan_mu = np.arctan(np.tan(thomega) * np.cos(qaz)[..., np.newaxis])
+                mu = np.stack([atan_mu, pi + atan_mu], axis=-1).reshape(
+                    qaz.shape + (4,)
+                )
+                eta = np.full_like(mu, eta)
+
+            # V = rot_ETA(eta).T @ rot_MU(mu).T @ F @ THETA                (56)
+            q_lab = q_lab[..., np.newaxis, :]
+            W1 = np.cos(mu) * q_lab[..., 1] + np.sin(mu) * q_lab[..., 2]
+            V0 = np.cos(eta) * q_lab[..., 0] - np.sin(eta) * W1
+            V1 = np.sin(eta) * q_lab[..., 0] + np.cos(eta) * W1
+            V2 = -np.sin(mu) * q_lab[..., 1] + np.cos(mu) * q_lab[..., 2]
+            # For the case of (00l) reflection, where N_phi[0,0] = N_phi[1,0] = 0
+            failed |= (
+                (np.abs(N0[:, 0]) <= SMALL)
+                & (np.abs(N1[:, 0]) <= SMALL)
+                & np.any(~np.isnan(mu + eta), axis=(1, 2))
+            )
+            N0, N1, N2 = (arr[..., np.newaxis] for arr in (N0, N1, N2))
+            bot = bound_array(-V1 / np.sqrt(N0**2 + N1**2))
+            eps = np.arctan2(N1, N0)
+            phi = np.stack(
+                [np.arcsin(bot) + eps, pi - np.arcsin(bot) + eps], axis=-1
+            )  # (59)
+            N0, N1, N2, V0, V2 = (arr[..., np.newaxis] for arr in (N0, N1, N2, V0, V2))
+            a = N0 * np.cos(phi) + N1 * np.sin(phi)
+            chi = np.arctan2(N2 * V0 - a * V2, N2 * V2 + a * V0)  # (60)
+            mu, eta = (np.repeat(arr[..., np.newaxis], 2, axis=-1) for arr in (mu, eta))
+            angles = [arr.reshape(qaz.shape + (-1,)) for arr in (mu, eta, chi, phi)]
+
+        elif "mu" in samp_constraints:
+            mu = samp_constraints["mu"]
+            phi = samp_constraints["phi"]
+            V = q_lab @ rot_MU(mu)
+            E = N_phi @ rot_PHI(phi).T
+            E0, E1, E2 = (E[:, idx, np.newaxis] for idx in range(3))
+            bot = bound_array(-V[..., 2] / np.sqrt(E0**2 + E2**2))
+            eps = np.arctan2(E2, E0)
+            chi = np.stack([np.arcsin(bot) + eps, pi - np.arcsin(bot) + eps], axis=-1)
+            E0, E1, E2, V = (arr[..., np.newaxis] for arr in (E0, E1, E2, V))
+            a = E0 * np.cos(chi) + E2 * np.sin(chi)
+            eta = np.arctan2(
+                V[..., 0, :] * E1 - V[..., 1, :] * a,
+                V[..., 0, :] * a + V[..., 1, :] * E1,
+            )
+            angles = [np.full_like(chi, mu), eta, chi, np.full_like(chi, phi)]
+
+        else:
+            eta = samp_constraints["eta"]
+            phi = samp_constraints["phi"]
+            X = N2
+            Y = N0 * cos(phi) + N1 * sin(phi)
+            failed |= (np.abs(X[:, 0]) <= SMALL) & (np.abs(Y[:, 0]) <= SMALL)
+            V = (N1 * cos(phi) - N0 * sin(phi)) * tan(eta)
+            sgn = sign(cos(eta))
+            eps = np.arctan2(X * sgn, Y * sgn)
+            acos_rhs = np.arccos(
+                bound_array(
+                    (np.sin(qaz) * np.cos(theta) / cos(eta) - V) / np.sqrt(X**2 + Y**2)
+                )
+            )
+            single = np.abs(acos_rhs) <= SMALL
+            chi = np.stack(
+                [
+                    np.where(single, eps, eps + acos_rhs),
+                    np.where(single, np.nan, eps - acos_rhs),
+                ],
+                axis=-1,
+            )
+            N0, N1, N2 = (arr[..., np.newaxis] for arr in (N0, N1, N2))
+            A = (N0 * cos(phi) + N1 * sin(phi)) * np.sin(chi) - N2 * np.cos(chi)
+            B = (
+                -N2 * np.sin(chi) * sin(eta)
+                - np.cos(chi) * sin(eta) * (N0 * cos(phi) + N1 * sin(phi))
+                - cos(eta) * (N0 * sin(phi) - N1 * cos(phi))
+            )
+            ks = np.arctan2(A, B)
+            mu = (
+                np.arctan2(np.cos(theta) * np.cos(qaz), -np.sin(theta))[..., np.newaxis]
+                + ks
+            )
+            angles = [mu, np.full_like(chi, eta), chi, np.full_like(chi, phi)]
+
+        return np.stack(angles, axis=-1), failed
+
+    def _tidy_degenerate_solutions_array(self, positions: np.ndarray) -> np.ndarray:
+        """Return array version of _tidy_degenerate_solutions for angles in radians."""
+        mu, delta, nu, eta, chi, phi = np.moveaxis(positions, -1, 0)
+        detector_like_constraint = bool(
+            self.constraints._detector or self.constraints.naz
+        )
+        phi_not_constrained = "phi" not in self.constraints._sample
+        # constrained to vertical 4-circle like mode, phi || eta
+        vertical = (
+            (np.abs(nu) <= SMALL)
+            & detector_like_constraint
+            & (np.abs(mu) <= SMALL)
+            & ("mu" in self.constraints._sample)
+            & phi_not_constrained
+            & (np.abs(chi) <= SMALL)
+        )
+        # constrained to horizontal 4-circle like mode, phi || mu
+        horizontal = (
+            ~vertical
+            & (np.abs(delta) <= SMALL)
+            & detector_like_constraint
+            & (np.abs(eta) <= SMALL)
+            & ("eta" in self.constraints._sample)
+            & phi_not_constrained
+            & (np.abs(chi - pi / 2) <= SMALL)
+        )
+        result = positions.copy()
+        result[..., 3] = np.where(vertical, delta / 2.0, eta)
+        result[..., 0] = np.where(horizontal, nu / 2.0, mu)
+        result[..., 5] = np.where(
+            vertical,
+            phi - (delta / 2.0 - eta),
+            np.where(horizontal, phi + (nu / 2.0 - mu), phi),
+        )
+        return result
+
+
+def _vector_from_azimuth_array(
+    elevation: np.ndarray, azimuth: np.ndarray
+) -> np.ndarray:
+    """Return lab frame unit vectors from Eq. (18) and (20)."""
+    return np.stack(
+        np.broadcast_arrays(
+            np.cos(elevation) * np.sin(azimuth),
+            -np.sin(elevation),
+            np.cos(elevation) * np.cos(azimuth),
+        ),
+        axis=-1,
+    )
+
+
+def _sign_array(x: np.ndarray, tolerance: float = SMALL) -> np.ndarray:
+    """Array version of sign function with specified tolerance."""
+    return np.where(np.abs(x) <= tolerance, 0.0, np.sign(x))
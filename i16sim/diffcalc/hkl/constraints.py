@@ -64,6 +64,7 @@ class Constraints:
         indegrees: bool = True,
     ):
         """Object for setting diffractometer angle constraints."""
+        self._version: int = 0
         self._delta = _Constraint("delta", _con_category.DETECTOR, _con_type.VALUE)
         self._nu = _Constraint("nu", _con_category.DETECTOR, _con_type.VALUE)
         self._qaz = _Constraint("qaz", _con_category.DETECTOR, _con_type.VALUE)
@@ -136,6 +137,17 @@ class Constraints:
             lines.append("    Sorry, this constraint combination is not implemented.")
         return "\n".join(lines)
 
+    @property
+    def version(self) -> int:
+        """Return counter of changes to the constraint values.
+
+        Returns
+        -------
+        int:
+            Number of times any of the constraints were set or removed.
+        """
+        return self._version
+
     @property
     def _constrained(self):
         return tuple(con for con in self._all if con.active)
@@ -262,6 +274,7 @@ class Constraints:
         self, con: _Constraint
     ) -> Callable[[Union[float, bool, None]], None]:
         def _set_value(val: Union[float, bool]) -> None:
+            self._version += 1
             if isinstance(val, bool):
                 if con._type is _con_type.VOID:
                     con.value = val
@@ -288,6 +301,7 @@ class Constraints:
         def _set_constraint(val: Union[float, bool, None]) -> None:
             if val is None or val is False:
                 con.value = None
+                self._version += 1
                 return
             active_con = {c for c in self._constrained if c._category is con._category}
             num_active_con = len(active_con)
@@ -325,6 +339,7 @@ class Constraints:
     def _del_factory(self, con: _Constraint) -> Callable[[], None]:
         def _del_constraint() -> None:
             con.value = None
+            self._version += 1
 
         return _del_constraint
 
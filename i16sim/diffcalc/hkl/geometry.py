@@ -12,8 +12,15 @@ from math import degrees, radians
 from typing import Dict, Tuple, Union
 
 import numpy as np
-from i16sim.diffcalc.util import I, x_rotation, y_rotation, z_rotation
-from numpy.linalg import inv
+from i16sim.diffcalc.util import (
+    I,
+    x_rotation,
+    x_rotation_array,
+    y_rotation,
+    y_rotation_array,
+    z_rotation,
+    z_rotation_array,
+)
 
 
 class Position:
@@ -275,6 +282,43 @@ def get_rotation_matrices(
     )
 
 
+def get_rotation_matrices_array(
+    angles: np.ndarray, indegrees: bool = True
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray,]:
+    """Create stacks of rotation matrices for an array of diffractometer positions.
+
+    Parameters
+    ----------
+    angles: np.ndarray
+        (N, 6) array of mu, delta, nu, eta, chi and phi angles in the Position
+        field order.
+    indegrees: bool, default = True
+        If True, angles are in degrees.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray,
+        np.ndarray, np.ndarray,
+        np.ndarray, np.ndarray]
+        Tuple containing (N, 3, 3) arrays of rotation matrices corresponding
+        to the mu, delta, nu, eta, chi and phi axes.
+    """
+    angles = np.atleast_2d(np.asarray(angles, dtype=float))
+    if angles.shape[-1] != 6:
+        raise ValueError("Position array must have (N, 6) shape.")
+    if indegrees:
+        angles = np.radians(angles)
+    mu, delta, nu, eta, chi, phi = angles.T
+    return (
+        x_rotation_array(mu),
+        z_rotation_array(-delta),
+        x_rotation_array(nu),
+        z_rotation_array(-eta),
+        y_rotation_array(chi),
+        z_rotation_array(-phi),
+    )
+
+
 def rot_NU(nu: float) -> np.ndarray:
     """Return rotation matrix corresponding to nu axis.
 
@@ -392,4 +436,4 @@ def get_q_phi(pos: Position) -> np.ndarray:
     y = np.array([[0], [1], [0]])
     q_lab = (NU @ DELTA - I) @ y
     # Transform this into the phi frame.
-    return inv(PHI) @ inv(CHI) @ inv(ETA) @ inv(MU) @ q_lab
+    return PHI.T @ CHI.T @ ETA.T @ MU.T @ q_lab
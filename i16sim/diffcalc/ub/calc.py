@@ -10,7 +10,7 @@ import uuid
 from copy import deepcopy
 from itertools import product
 from math import acos, asin, cos, degrees, pi, radians, sin
-from typing import List, Optional, Sequence, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 from i16sim.diffcalc.hkl.geometry import Position, get_q_phi, get_rotation_matrices
@@ -22,6 +22,7 @@ from i16sim.diffcalc.util import (
     DiffcalcException,
     allnum,
     bound,
+    bound_array,
     cross3,
     dot3,
     is_small,
@@ -152,9 +153,14 @@ class UBCalculation:
         U matrix as a NumPy array
     UB: np.ndarray
         UB matrix as a NumPy array
+    version: int
+        Counter incremented every time crystal, U, UB, reference or surface
+        vectors are changed.
     """
 
     def __init__(self, name: Optional[str] = None) -> None:
+        self._version: int = 0
+        self._derived: Dict[Any, Any] = {}
         self.name: str = name if name is not None else str(uuid.uuid4())
         self.crystal: Crystal = None
         self.reflist: ReflectionList = ReflectionList()
@@ -167,6 +173,139 @@ class UBCalculation:
         self._WIDTH: int = 13
 
     ### State ###
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Objects pickled before the derived matrix cache was added store
+        # matrices and vectors as plain attributes
+        for attr in ("crystal", "reference", "surface", "U", "UB"):
+            if attr in state:
+                state["_" + attr] = state.pop(attr)
+        state["_version"] = state.get("_version", 0)
+        state["_derived"] = {}
+        self.__dict__.update(state)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_derived"] = {}
+        return state
+
+    @property
+    def version(self) -> int:
+        """Return counter of changes to crystal, U, UB and reference vectors.
+
+        Returns
+        -------
+        int:
+            Version number of the UB calculation state.
+        """
+        return self._version
+
+    def _invalidate(self) -> None:
+        """Drop derived matrices cached for previous UB calculation state."""
+        self._version += 1
+        self._derived.clear()
+
+    def _get_derived(self, key: Any, func: Callable[[], Any]) -> Any:
+        """Return cached value derived from the current UB calculation state.
+
+        Parameters
+        ----------
+        key: Any
+            Hashable identifier of the derived value.
+        func: Callable[[], Any]
+            Function calculating the value if it is not cached. Returned arrays
+            are made read-only as they are shared between callers.
+
+        Returns
+        -------
+        Any
+            Cached value.
+        """
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+        value = func()
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        self._derived[key] = value
+        return value
+
+    @property
+    def crystal(self) -> Crystal:
+        """Return object containing crystal lattice parameters."""
+        return self._crystal
+
+    @crystal.setter
+    def crystal(self, crystal: Crystal) -> None:
+        self._crystal = crystal
+        self._invalidate()
+
+    @property
+    def reference(self) -> ReferenceVector:
+        """Return object representing azimuthal reference vector."""
+        return self._reference
+
+    @reference.setter
+    def reference(self, reference: ReferenceVector) -> None:
+        self._reference = reference
+        self._invalidate()
+
+    @property
+    def surface(self) -> ReferenceVector:
+        """Return object representing surface normal vector."""
+        return self._surface
+
+    @surface.setter
+    def surface(self, surface: ReferenceVector) -> None:
+        self._surface = surface
+        self._invalidate()
+
+    @property
+    def U(self) -> np.ndarray:
+        """Return U matrix as a NumPy array."""
+        return self._U
+
+    @U.setter
+    def U(self, U: np.ndarray) -> None:
+        self._U = U
+        self._invalidate()
+
+    @property
+    def UB(self) -> np.ndarray:
+        """Return UB matrix as a NumPy array."""
+        return self._UB
+
+    @UB.setter
+    def UB(self, UB: np.ndarray) -> None:
+        self._UB = UB
+        self._invalidate()
+
+    @property
+    def inv_UB(self) -> np.ndarray:
+        """Return inverse of UB matrix.
+
+        Returns
+        -------
+        np.ndarray:
+            Inverse UB matrix as (3, 3) read-only NumPy array.
+        """
+        if self.UB is None:
+            return None
+        return self._get_derived("inv_UB", lambda: inv(self.UB))
+
+    @property
+    def B(self) -> np.ndarray:
+        """Return B matrix of the crystal lattice.
+
+        Returns
+        -------
+        np.ndarray:
+            B matrix as (3, 3) read-only NumPy array.
+        """
+        if self.crystal is None:
+            return None
+        return self._get_derived("B", lambda: np.array(self.crystal.B, dtype=float))
+
     @staticmethod
     def load(filename: str) -> "UBCalculation":
         """Load current UB matrix calculation from a pickle file.
@@ -473,7 +612,10 @@ class UBCalculation:
         """
         if self.UB is None and not self.reference.rlv:
             return None
-        return self.reference.get_array(None if self.reference.rlv else self.UB)
+        return self._get_derived(
+            ("n_hkl", tuple(self.reference.n_ref), self.reference.rlv),
+            lambda: self.reference.get_array(None if self.reference.rlv else self.UB),
+        )
 
     @n_hkl.setter
     def n_hkl(self, n_hkl: Tuple[float, float, float]) -> None:
@@ -490,7 +632,10 @@ class UBCalculation:
         """
         if self.UB is None and self.reference.rlv:
             return None
-        return self.reference.get_array(self.UB if self.reference.rlv else None)
+        return self._get_derived(
+            ("n_phi", tuple(self.reference.n_ref), self.reference.rlv),
+            lambda: self.reference.get_array(self.UB if self.reference.rlv else None),
+        )
 
     @n_phi.setter
     def n_phi(self, n_phi: Tuple[float, float, float]) -> None:
@@ -506,7 +651,10 @@ class UBCalculation:
         np.ndarray:
             Surface normal vector represented as (3,1) NumPy array.
         """
-        return self.surface.get_array(None if self.surface.rlv else self.UB)
+        return self._get_derived(
+            ("surf_nhkl", tuple(self.surface.n_ref), self.surface.rlv),
+            lambda: self.surface.get_array(None if self.surface.rlv else self.UB),
+        )
 
     @surf_nhkl.setter
     def surf_nhkl(self, surf_nhkl: Tuple[float, float, float]) -> None:
@@ -521,7 +669,10 @@ class UBCalculation:
         np.ndarray:
             Reference vector represented as (3,1) NumPy array.
         """
-        return self.surface.get_array(self.UB if self.surface.rlv else None)
+        return self._get_derived(
+            ("surf_nphi", tuple(self.surface.n_ref), self.surface.rlv),
+            lambda: self.surface.get_array(self.UB if self.surface.rlv else None),
+        )
 
     @surf_nphi.setter
     def surf_nphi(self, surf_nphi: Tuple[float, float, float]) -> None:
@@ -1321,7 +1472,7 @@ class UBCalculation:
                 "Cannot calculate theta angle as no lattice parameters have been specified."
             )
         wl = 12.39842 / en
-        d = self.crystal.get_hkl_plane_distance(hkl)
+        d = 2 * pi / float(norm(self.B @ np.array(hkl, dtype=float)))
         if wl > (2 * d):
             raise ValueError(
                 "Reflection un-reachable as wavelength (%f) is more than twice\n"
@@ -1334,6 +1485,69 @@ class UBCalculation:
                 f"asin(wl / (d * 2) with wl={wl:f} and d={d:f}: " + e.args[0]
             )
 
+    def get_ttheta_from_hkl_array(self, hkl: np.ndarray, en: float) -> np.ndarray:
+        """Calculate two-theta scattering angles for an array of reflections.
+
+        Parameters
+        ----------
+        hkl: np.ndarray
+            (N, 3) array of miller indices.
+        en: float
+            Beam energy.
+
+        Returns
+        -------
+        np.ndarray
+            (N,) array of two-theta angles. Reflections unreachable at the
+            provided energy and (0, 0, 0) are set to NaN.
+        """
+        if self.crystal is None:
+            raise DiffcalcException(
+                "Cannot calculate theta angle as no lattice parameters have been specified."
+            )
+        wl = 12.39842 / en
+        hkl = np.atleast_2d(np.asarray(hkl, dtype=float))
+        q_length = norm(hkl @ self.B.T, axis=1)
+        ttheta = 2.0 * np.arcsin(bound_array(wl * q_length / (4 * pi)))
+        ttheta[q_length == 0] = np.nan
+        return ttheta
+
+    def get_hkl_within_ttheta(
+        self, en: float, ttheta_max: float = pi
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Find all integer miller indices with two-theta angle below a limit.
+
+        Parameters
+        ----------
+        en: float
+            Beam energy.
+        ttheta_max: float, default = pi
+            Largest two-theta angle in radians.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            (N, 3) integer array of miller indices and (N,) array of two-theta
+            angles sorted by two-theta. Reflection (0, 0, 0) is not included.
+        """
+        if self.crystal is None:
+            raise DiffcalcException(
+                "Cannot calculate theta angle as no lattice parameters have been specified."
+            )
+        wl = 12.39842 / en
+        q_max = 4 * pi * sin(min(ttheta_max, pi) / 2) / wl
+        # Largest index along each axis from the rows of inverse B matrix
+        index_max = np.floor(q_max * norm(inv(self.B), axis=1) + SMALL).astype(int)
+        hkl = np.stack(
+            np.meshgrid(*(np.arange(-n, n + 1) for n in index_max), indexing="ij"),
+            axis=-1,
+        ).reshape(-1, 3)
+        q_length = norm(hkl @ self.B.T, axis=1)
+        hkl = hkl[(q_length > 0) & (q_length <= q_max * (1 + SMALL))]
+        ttheta = self.get_ttheta_from_hkl_array(hkl, en)
+        order = np.lexsort((-hkl[:, 2], -hkl[:, 1], -hkl[:, 0], ttheta))
+        return hkl[order], ttheta[order]
+
     def _rescale_unit_cell(
         self, hkl: Tuple[float, float, float], pos: Position, wavelength: float
     ) -> Tuple[float, Tuple[str, str, float, float, float, float, float, float]]:
@@ -59,6 +59,72 @@ def z_rotation(th: float) -> np.ndarray:
     return np.array(((cos(th), -sin(th), 0), (sin(th), cos(th), 0), (0, 0, 1)))
 
 
+def x_rotation_array(th: np.ndarray) -> np.ndarray:
+    """Stack of rotation matrices over x axis.
+
+    Parameters
+    ----------
+    th: np.ndarray
+        Array of N rotation angles.
+
+    Returns
+    -------
+    np.ndarray
+        (N, 3, 3) array of rotation matrices.
+    """
+    th = np.asarray(th, dtype=float)
+    c, s = np.cos(th), np.sin(th)
+    m = np.zeros(th.shape + (3, 3))
+    m[..., 0, 0] = 1
+    m[..., 1, 1], m[..., 1, 2] = c, -s
+    m[..., 2, 1], m[..., 2, 2] = s, c
+    return m
+
+
+def y_rotation_array(th: np.ndarray) -> np.ndarray:
+    """Stack of rotation matrices over y axis.
+
+    Parameters
+    ----------
+    th: np.ndarray
+        Array of N rotation angles.
+
+    Returns
+    -------
+    np.ndarray
+        (N, 3, 3) array of rotation matrices.
+    """
+    th = np.asarray(th, dtype=float)
+    c, s = np.cos(th), np.sin(th)
+    m = np.zeros(th.shape + (3, 3))
+    m[..., 0, 0], m[..., 0, 2] = c, s
+    m[..., 1, 1] = 1
+    m[..., 2, 0], m[..., 2, 2] = -s, c
+    return m
+
+
+def z_rotation_array(th: np.ndarray) -> np.ndarray:
+    """Stack of rotation matrices over z axis.
+
+    Parameters
+    ----------
+    th: np.ndarray
+        Array of N rotation angles.
+
+    Returns
+    -------
+    np.ndarray
+        (N, 3, 3) array of rotation matrices.
+    """
+    th = np.asarray(th, dtype=float)
+    c, s = np.cos(th), np.sin(th)
+    m = np.zeros(th.shape + (3, 3))
+    m[..., 0, 0], m[..., 0, 1] = c, -s
+    m[..., 1, 0], m[..., 1, 1] = s, c
+    m[..., 2, 2] = 1
+    return m
+
+
 def xyz_rotation(axis: Tuple[float, float, float], angle: float) -> np.ndarray:
     """Rotation matrix over arbitrary axis.
 
@@ -187,6 +253,26 @@ def bound(x: float) -> float:
     return x
 
 
+def bound_array(x: np.ndarray) -> np.ndarray:
+    """Clip array values to [-1, 1] range.
+
+    Array version of bound for batch calculations. Values further than SMALL
+    outside the range are not rejected, they become NaN instead.
+
+    Parameters
+    ----------
+    x: np.ndarray
+        Input values to be checked
+
+    Returns
+    -------
+    np.ndarray
+        Values in [-1, 1] range or NaN.
+    """
+    x = np.asarray(x, dtype=float)
+    return np.where(np.abs(x) > (1 + SMALL), np.nan, np.clip(x, -1, 1))
+
+
 def radians_equivalent(first: float, second: float, tolerance: float = SMALL) -> bool:
     """Check for angle equivalence.
 
@@ -37,18 +37,26 @@ from i16sim.diffcalc.hkl.geometry import Position
 from i16sim.diffcalc.ub.calc import UBCalculation
 
 from math import degrees, radians, sqrt
+from collections import OrderedDict
 import numpy as np
 from time import sleep
 import traceback
 import os
+import tempfile
 
 import i16sim.bl.io_angles as motors
 import i16sim.util.eulerian_conversion as etok
 import i16sim.bl.ik_to_fk as ikfk
-from i16sim.bl.intersect_test import is_intersect
+from i16sim.bl.intersect_test import is_intersect, get_clearance, contact_groups, scene_digest, ShowMessageBox
+import i16sim.bl.export_model as model_export
 import i16sim.bl.vectors as vectors
 import i16sim.bl.read_visual_angle as ra
 import i16sim.util.scannables as scannables
+import i16sim.util.reachability as reachability
+import i16sim.util.collision_map as collision_mapping
+import i16sim.util.move_planner as move_planner
+from i16sim.util.collision import CollisionModel
+from i16sim.util.memo import PoseMemo, quantize
 
 setrange = scannables.setrange
 import i16sim.parameters as params
@@ -112,10 +120,31 @@ class DiffcalcEmulator:
         # boolean modifiers for output
         self.limits = limits  # if you want to restrict the range of allowed movements
         self.collision_test = collision_test  # if test for collisions every time diffractometer moves
+        self.clearance_distance = params.clearance_distance  # largest distance between meshes measured by clearance
+        self.safety_margin = params.safety_margin  # meshes closer than this are near misses
+        self.scan_clearance = []  # [[value, distance, mesh1, mesh2], ...] of the last scan with clearance
+        self.collision_model = None  # meshes used by check_path, see load_collision_model
+        self.scan_path = []  # [[value, path], ...] of the last scan with sweep, see check_path
         self.verbose = verbose  # if print location every time diffractometer moves
         # if reciprocal lattice vectors and scattering vector should have accurate relative sizes
         self.scale_reciprocal_vectors = True
 
+        # cache of hkl to position solutions used by pos_from_hkl
+        self.pos_cache_size = 256  # maximum number of cached hkl values
+        self.hkl_quantum = 1e-6  # hkl values closer than this share a cache entry
+        self.pos_cache_clear()
+        # follow the current solution branch in pos_from_hkl instead of enumerating all solutions
+        self.track_branch = True
+        self.track_step = 10.  # largest distance (see get_dist) accepted from the tracking solver
+        self.track_stats = {'tracked': 0, 'enumerated': 0}
+        # collision maps of each sample environment consulted by inlimits, see load_occupancy
+        self.occupancy_maps = {}
+        self.sample_environment = None
+        self.occupancy_stats = {'checked': 0, 'rejected': 0}
+        # memo of intersect results by motor angles and meshes, see intersect_memo_file
+        self.intersect_memo = PoseMemo(maxsize=4096)
+        self.pose_quantum = 1e-6  # motor values closer than this share a memo entry
+
     def clear(self, keep_scannables=True):
         """Clear previous calculations
         
@@ -137,8 +166,10 @@ class DiffcalcEmulator:
             self.scannables = old_sc
         self.update_pos()
 
-    def intersect(self, popups=False, **kwargs):
-        """Check if meshes in the simulation are intersecting
+    def intersect(self, popups=False, use_memo=True, **kwargs):
+        """Check if meshes in the simulation are intersecting.
+        Results are remembered for each pose of the motors, sx, sy, sz and the visible meshes,
+        so checking the same position again is almost free (see intersect_memo_info).
         
         Example::
             
@@ -148,8 +179,10 @@ class DiffcalcEmulator:
         ----------
         popups : bool, optional
             Draw popup window if collision is detected. The default is False.
+        use_memo : bool, optional
+            reuse the result of an earlier check of the same pose. The default is True.
         verbose : bool, optional
-            print every check. The default is False.
+            print every check, the meshes are always checked. The default is False.
 
 
         Returns
@@ -159,15 +192,313 @@ class DiffcalcEmulator:
 
         """
 
-        exceptions = self.collision_exceptions.copy()
-        intersect_collections = params.intersect_collections
+        exceptions = contact_groups(self.collision_exceptions, params.intersect_collections)
+        if not use_memo or kwargs:
+            return (is_intersect(popups=popups, exceptions=exceptions, **kwargs))
+
+        key = self._intersect_key(exceptions)
+        intersections = self.intersect_memo.get(key)
+        if intersections is None:
+            intersections = self.intersect_memo.put(key, is_intersect(popups=popups, exceptions=exceptions))
+            return [list(pair) for pair in intersections]
+
+        # return new lists so remembered results cannot be modified
+        intersections = [list(pair) for pair in intersections]
+        for name1, name2 in intersections:
+            print(name1 + " and " + name2 + " are touching!")
+        if intersections == []:
+            print("No intersections")
+        else:
+            if popups:
+                ShowMessageBox("Intersections between: " + str(intersections))
+            # select the intersecting meshes, as is_intersect does
+            bpy.ops.object.select_all(action="DESELECT")
+            for pair in intersections:
+                for ob_name in pair:
+                    bpy.data.objects[ob_name].select_set(True)
+        print()
+        return intersections
+
+    def _intersect_key(self, exceptions):
+        """Hashable summary of everything the intersect result depends on:
+        quantized motor and detector angles, sx, sy, sz, the visible meshes and the contact groups.
+        The x, y, z rotations are read from the visual matrix of each bone, so poses driven by the IK target are included.
+        """
+        bpy.context.view_layer.update()
+        bones = bpy.data.objects[params.arm_name].pose.bones
+        values = [angle
+                  for name in self.armature_motors + params.detector_motors if name in bones
+                  for angle in ra.rotation_from_m(ra.visual_matrix(name), degrees=True)]
+        for name in ['sx', 'sy', 'sz']:
+            try:
+                values.append(float(self.scannables[name].get()))
+            except Exception:
+                values.append(None)  # no sample environment
+        groups = tuple(tuple(sorted(group)) for group in exceptions)
+        return (quantize(values, self.pose_quantum), groups, scene_digest())
+
+    def intersect_memo_file(self, filename=None):
+        """Keep intersect results in a file, so they are reused in later Blender sessions.
+        Results already in the file are used if the meshes are unchanged.
+        
+        Example::
+            
+            intersect_memo_file()  # next to the .blend file
+            intersect_memo_file('collisions.sqlite')
+
+        Parameters
+        ----------
+        filename : str, optional
+            SQLite file. The default is None, '<blend file> intersections.sqlite'.
+
+        """
+        if filename is None:
+            if not bpy.data.filepath:
+                raise Exception('Save the .blend file first, or give a filename')
+            filename = os.path.splitext(bpy.data.filepath)[0] + ' intersections.sqlite'
+        self.intersect_memo.close()
+        self.intersect_memo = PoseMemo(self.intersect_memo.maxsize, filename)
+        print('intersect results are kept in', filename)
+
+    def intersect_memo_clear(self, store=False):
+        """Forget remembered intersect results and reset the statistics
+        
+        Example::
+            
+            intersect_memo_clear()
+            intersect_memo_clear(store=True)  # also empty the file, see intersect_memo_file
+
+        Parameters
+        ----------
+        store : bool, optional
+            also remove the results saved in the file. The default is False.
+
+        """
+        self.intersect_memo.clear(store)
+
+    def intersect_memo_info(self, verbose=True):
+        """Hit and miss statistics of the memo of intersect results
+        
+        Example::
+            
+            stats = intersect_memo_info()
+
+        Parameters
+        ----------
+        verbose : bool, optional
+            Print the statistics. The default is True.
+
+        Returns
+        -------
+        stats : dict{ str:int }
+            numbers of hits in memory, hits in the file, misses, remembered poses and
+            the maximum number in memory.
+
+        """
+        memo = self.intersect_memo
+        stats = dict(memo.stats, size=len(memo), maxsize=memo.maxsize)
+        if verbose:
+            hits = stats['hits'] + stats['store_hits']
+            calls = hits + stats['misses']
+            print('intersect memo: %d hits (%d from %s), %d misses (%.1f%% hit rate), %d/%d entries' % (
+                hits, stats['store_hits'], memo.filename, stats['misses'],
+                100. * hits / calls if calls else 0., stats['size'], stats['maxsize']))
+        return stats
+
+    def check_clearance(self, max_distance=None, verbose=True):
+        """Smallest distance between meshes in the simulation, pairs closer than 
+        safety_margin are near misses.
+        
+        Example::
+            
+            pairs = check_clearance() # pairs closer than clearance_distance
+            mesh1, mesh2, distance, point1, point2 = check_clearance(1.)[0] # closest pair
+        
+        Parameters
+        ----------
+        max_distance : float, optional
+            largest distance in m to measure. The default is None, which uses clearance_distance.
+        verbose : bool, optional
+            print every pair. The default is True.
+
+        Returns
+        -------
+        clearance : list [[str:mesh1, str:mesh2, float:distance, point1, point2],...]
+            mesh pairs closer than max_distance, closest first, with the closest point of each mesh.
+
+        """
+        if max_distance is None:
+            max_distance = self.clearance_distance
+        exceptions = contact_groups(self.collision_exceptions, params.intersect_collections)
+        pairs = get_clearance(max_distance, exceptions=exceptions)
+        if verbose:
+            for name1, name2, distance, point1, point2 in pairs:
+                warning = ' near miss!' if distance < self.safety_margin else ''
+                print('%s and %s are %.1f mm apart%s' % (name1, name2, 1000 * distance, warning))
+            if not pairs:
+                print('No meshes closer than %.1f mm' % (1000 * max_distance))
+        return pairs
+
+    def load_collision_model(self, filename=None):
+        """Load the meshes used by check_path. The model is kept, so call again after
+        changing the meshes or the visible sample environment.
+        
+        Example::
+            
+            load_collision_model() # export the current scene
+            load_collision_model('i16model.npz') # saved by export_model
+
+        Parameters
+        ----------
+        filename : str, optional
+            .npz file saved by export_model. The default is None, which exports the current scene
+            to a temporary file.
+
+        Returns
+        -------
+        model : CollisionModel
+            the loaded model.
+
+        """
+        if filename is None:
+            self.collision_model = self.export_model(os.path.join(tempfile.gettempdir(), 'i16sim model.npz'))
+        else:
+            self.collision_model = CollisionModel.load(filename)
+        return self.collision_model
+
+    def check_path(self, start, stop=None, resolution=0.01, verbose=True):
+        """Check the whole move between two positions for collisions, not only the end points. 
+        The real motors move linearly between the positions. Uses the collision model 
+        of load_collision_model, which is exported on first use.
+        
+        Example::
+            
+            path = check_path([0,0,0,0,90,0]) # from the current position to chi 90
+            path = check_path([0,0,0,0,0,0], [0,0,0,0,90,0])
+            
+        Parameters
+        ----------
+        start : [mu, delta, gamma, eta, chi, phi]
+            Eulerian angles of the start of the move, or the end if stop is not given.
+        stop : [mu, delta, gamma, eta, chi, phi], optional
+            Eulerian angles of the end of the move. The default is None, which moves from the current position.
+        resolution : float, optional
+            shortest move in degrees that is bisected. The default is 0.01.
+        verbose : bool, optional
+            print the result. The default is True.
+
+        Returns
+        -------
+        path : dict
+            | 'safe' : True if no meshes touch anywhere along the move
+            | 'k_angles' : first real motor position that collides, or None
+            | 'intersections' : [[mesh1, mesh2], ...] pairs that collide at k_angles
+            | see i16sim.util.collision.CollisionModel.check_path
+
+        """
+        if stop is None:
+            start, stop = self.position.astuple, start
+        if self.collision_model is None:
+            self.load_collision_model()
+        k_angles = [np.hstack([e[:3], etok.EtoK_array(np.asarray(e[3:], dtype=float))[0]]) for e in (start, stop)]
+        exceptions = contact_groups(self.collision_exceptions, params.intersect_collections)
+        return self.collision_model.check_path(*k_angles, exceptions, resolution, verbose)
+
+    def plan_move(self, stop, start=None, use_blender=False, step=1., resolution=0.01, verbose=True):
+        """Check the intermediate positions of the motor move orders in params.move_orders
+        (all at once, detector first, sample first, each axis alone) for collisions 
+        and find the fastest safe order. Motors move at params.motor_speeds.
+        
+        Example::
+            
+            order, duration, results = plan_move([0,60,0,30,90,0])
+            order, duration, results = plan_move(pos_from_hkl([1,1,1])[0].astuple)
+            plan_move([0,60,0,30,90,0], use_blender=True) # check with intersect() every degree
+
+        Parameters
+        ----------
+        stop : [mu, delta, gamma, eta, chi, phi]
+            Eulerian angles of the end of the move.
+        start : [mu, delta, gamma, eta, chi, phi], optional
+            Eulerian angles of the start of the move. The default is None, which is the current position.
+        use_blender : bool, optional
+            move the simulation and check with intersect() every step degrees, instead of 
+            check_path with the collision model. Slow. The default is False.
+        step : float, optional
+            largest motor step in degrees between checks with use_blender. The default is 1.
+        resolution : float, optional
+            shortest move in degrees that is bisected by check_path. The default is 0.01.
+        verbose : bool, optional
+            print every order. The default is True.
+
+        Returns
+        -------
+        order : str or None
+            name of the fastest safe move order, None if no order is safe.
+        duration : float
+            estimated time of the move in seconds.
+        results : list [dict]
+            every order, see i16sim.util.move_planner.plan_move.
+
+        """
+        if start is None:
+            start = self.position.astuple
+        k_angles = [np.hstack([e[:3], etok.EtoK_array(np.asarray(e[3:], dtype=float))[0]]) for e in (start, stop)]
+        if np.any(np.isnan(k_angles)):
+            raise Exception('Eulerian to K conversion not possible in this mode')
+
+        if use_blender:
+            start_position = self.position.astuple
+            def check_segment(k0, k1):
+                n = max(int(np.ceil(np.max(np.abs(k1 - k0)) / step)), 1)
+                for t in np.linspace(0, 1, n + 1):
+                    k = k0 + t * (k1 - k0)
+                    self.moveto([*k[:3], *etok.KtoE(list(k[3:]))], use_limits=False, UI_call=False)
+                    intersections = self.intersect()
+                    if intersections:
+                        return {'safe': False, 'k_angles': k, 'intersections': intersections}
+                return {'safe': True, 'k_angles': None, 'intersections': []}
+        else:
+            if self.collision_model is None:
+                self.load_collision_model()
+            exceptions = contact_groups(self.collision_exceptions, params.intersect_collections)
+            def check_segment(k0, k1):
+                return self.collision_model.check_path(k0, k1, exceptions, resolution)
+
+        try:
+            order, duration, results = move_planner.plan_move(*k_angles, check_segment, verbose=verbose)
+        finally:
+            if use_blender:
+                self.moveto(start_position, use_limits=False)
+        if verbose:
+            if order is None:
+                print('No safe move order')
+            else:
+                print('Fastest safe order: %s, %.1f s' % (order, duration))
+        return order, duration, results
+
+    def export_model(self, filename):
+        """Save the armature and meshes for collision checks without Blender.
+        
+        Load the file with i16sim.util.collision.CollisionModel.load, 
+        which checks for intersections like intersect() in ordinary Python.
+        
+        Example::
+            
+            export_model('i16model.npz')
+        
+        Parameters
+        ----------
+        filename : str
+            .npz file name.
 
-        for collection in intersect_collections:  # collections where all included objects should touch
-            initial_list = collection[1]
-            for name in bpy.data.collections[collection[0]].all_objects.keys():
-                initial_list.append(name)
-            exceptions.append(initial_list)
-        return (is_intersect(popups=popups, exceptions=exceptions, **kwargs))
+        Returns
+        -------
+        model : CollisionModel
+            the saved model.
+
+        """
+        return model_export.export_model(filename)
 
     def moveto(self, e_angles, use_limits=True, UI_call=True):
         """Move the simulation and update the global state
@@ -335,9 +666,117 @@ class DiffcalcEmulator:
                 ret = False
             if not scannables.in_composite_limits(self.composite_limits, position.astuple, raise_error):
                 ret = False
+        if ret and self._collides_array([position.astuple])[0]:
+            if raise_error:
+                raise Exception('Position collides in the occupancy map of %s' % self.sample_environment)
+            ret = False
 
         return (ret)
 
+    def inlimits_array(self, positions):
+        """Array version of inlimits for many positions at once.
+        
+        Example::
+            
+            ok = inlimits_array([[0,20,0,10,90,0], [0,20,0,10,-90,0]])
+
+        Parameters
+        ----------
+        positions : (N, 6) array
+            Eulerian angles mu, delta, nu, eta, chi, phi. Rows with NaN are outside limits.
+
+        Returns
+        -------
+        ret : (N,) bool array
+            if each position is within safety limits.
+
+        """
+        positions = np.atleast_2d(np.asarray(positions, dtype=float))
+        ret = ~np.isnan(positions).any(axis=1)
+        if self.limits:
+            # same conversion as the sixc scannable and the composite limits
+            k_angles = etok.EtoK_array(positions[:, 3:])[:, 0]
+            values = np.hstack([positions, k_angles])
+            for i, key in enumerate(list(Position.fields) + list(self.k_angles.keys())):
+                ret &= scannables.inlimits_array(self.scannables[key], values[:, i])
+            ret[ret] = scannables.in_composite_limits_array(self.composite_limits, positions[ret], k_angles[ret])
+        ret[ret] = ~self._collides_array(positions[ret])
+        return ret
+
+    def _collides_array(self, positions):
+        """If Eulerian positions collide in the occupancy map of the active sample environment,
+        False for all positions if there is no map. Positions not possible in kappa mode 1 don't collide.
+        """
+        positions = np.atleast_2d(np.asarray(positions, dtype=float))
+        occupancy = self.occupancy_maps.get(self.sample_environment)
+        if occupancy is None or not len(positions):
+            return np.zeros(len(positions), dtype=bool)
+        k_angles = np.hstack([positions[:, :3], etok.EtoK_array(positions[:, 3:])[:, 0]])
+        collides = occupancy.collides(k_angles)
+        self.occupancy_stats['checked'] += len(collides)
+        self.occupancy_stats['rejected'] += int(np.count_nonzero(collides))
+        return collides
+
+    def load_occupancy(self, filename=None, environment=None, tolerance=0.5):
+        """Load a collision map used by inlimits to reject positions that collide,
+        without checking the meshes. Maps are stored for each sample environment,
+        only the map of the active sample environment is used (see sample_env).
+        
+        Example::
+            
+            load_occupancy('kappa_ktheta.npy')  # map saved by collision_map
+            load_occupancy('cryostat tree.npz', 'cryostat')  # tree saved by adaptive_collision_map
+            load_occupancy()  # remove all maps
+
+        Parameters
+        ----------
+        filename : str, optional
+            .npy map saved by collision_map or .npz tree saved by adaptive_collision_map.
+            The default is None, which removes all maps.
+        environment : str, optional
+            sample environment of the map. The default is the environment the map was calculated for.
+        tolerance : float, optional
+            largest difference in degrees of motors that are not map axes from the angles
+            the map was calculated at. Other positions are not rejected. The default is 0.5.
+
+        Returns
+        -------
+        occupancy : OccupancyMap
+            the loaded map, see i16sim.util.collision_map.OccupancyMap.
+
+        """
+        if filename is None:
+            self.occupancy_maps.clear()
+            print('Occupancy maps removed')
+            return None
+        occupancy = collision_mapping.OccupancyMap.load(filename, tolerance)
+        if environment is not None:
+            occupancy.environment = environment
+        if not self.occupancy_maps:
+            self.sample_environment = occupancy.environment
+        self.occupancy_maps[occupancy.environment] = occupancy
+        print('Loaded %s, active sample environment: %s' % (occupancy, self.sample_environment))
+        return occupancy
+
+    def sample_env(self, environment=None):
+        """Set the active sample environment, whose occupancy map is used by inlimits (see load_occupancy)
+        
+        Example::
+            
+            sample_env('cryostat')
+
+        Parameters
+        ----------
+        environment : str, optional
+            sample environment name. The default is None, the environment of maps calculated for
+            all visible meshes.
+
+        """
+        self.sample_environment = environment
+        if environment not in self.occupancy_maps:
+            print('No occupancy map loaded for', environment)
+        print("sample environment = ", self.sample_environment)
+
     def get_dist(self, pos1, pos2):
         """Get estimate of how far away two position are in eulerian space
         
@@ -363,12 +802,118 @@ class DiffcalcEmulator:
         dist = sqrt(distsq)
         return dist
 
+    def pos_cache_clear(self):
+        """Empty the cache of hkl to position solutions and reset its statistics
+        
+        Example::
+            
+            pos_cache_clear()
+
+        """
+        self._pos_cache = OrderedDict()
+        self._pos_cache_state = None
+        self.pos_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def pos_cache_info(self, verbose=True):
+        """Hit and miss statistics of the cache of hkl to position solutions
+        
+        Example::
+            
+            stats = pos_cache_info()
+
+        Parameters
+        ----------
+        verbose : bool, optional
+            Print the statistics. The default is True.
+
+        Returns
+        -------
+        stats : dict{ str:int }
+            numbers of cache hits, misses, invalidations, stored hkl values and
+            the maximum cache size.
+
+        """
+        stats = dict(self.pos_cache_stats, size=len(self._pos_cache), maxsize=self.pos_cache_size)
+        if verbose:
+            calls = stats['hits'] + stats['misses']
+            print('hkl cache: %d hits, %d misses (%.1f%% hit rate), %d/%d entries, %d invalidations' % (
+                stats['hits'], stats['misses'], 100. * stats['hits'] / calls if calls else 0.,
+                stats['size'], stats['maxsize'], stats['invalidations']))
+        return stats
+
+    def _get_pos_cache_state(self):
+        """Hashable summary of everything the hkl to position solutions depend on.
+        Returns None if the solutions should not be cached.
+        """
+        ubcalc = self.hklcalc.ubcalc
+        if ubcalc.UB is None or ubcalc.crystal is None:
+            return None
+        # ubcalc.version changes whenever UB, lattice or reference vectors are set,
+        # reference vector arrays are read from the ubcalc derived matrix cache
+        n_phi = ubcalc.n_phi
+        return (ubcalc,
+                ubcalc.version,
+                None if n_phi is None else n_phi.tobytes(),
+                ubcalc.surf_nphi.tobytes(),
+                self.hklcalc.constraints.astuple,
+                float(self.wl),
+                self.hklcalc.verify)
+
+    def get_all_positions(self, hkl):
+        """
+        Get all positions and virtual angles corresponding to a certain hkl regardless of limits.
+        Solutions are stored in a least recently used cache, which is emptied
+        whenever UB, lattice, reference vectors, constraints or wavelength change.
+        
+        Example::
+            
+            solutions = get_all_positions([1,1,1])
+
+        Parameters
+        ----------
+        hkl : [float,float,float]
+            Miller idex list.
+
+        Returns
+        -------
+        solutions : list [(Position, dict{ str:float }),...]
+            All positions and the corresponding virtual angles.
+
+        """
+        state = self._get_pos_cache_state()
+        if state is None or self.pos_cache_size <= 0:
+            return self.hklcalc.get_position(hkl[0], hkl[1], hkl[2], self.wl)
+        if state != self._pos_cache_state:
+            if self._pos_cache:
+                self.pos_cache_stats['invalidations'] += 1
+            self._pos_cache.clear()
+            self._pos_cache_state = state
+
+        key = tuple(int(round(x / self.hkl_quantum)) for x in hkl[:3])
+        if key in self._pos_cache:
+            self.pos_cache_stats['hits'] += 1
+            self._pos_cache.move_to_end(key)
+        else:
+            self.pos_cache_stats['misses'] += 1
+            solutions = self.hklcalc.get_position(hkl[0], hkl[1], hkl[2], self.wl)
+            self._pos_cache[key] = [(pos.astuple, virtual_angles) for pos, virtual_angles in solutions]
+            while len(self._pos_cache) > self.pos_cache_size:
+                self._pos_cache.popitem(last=False)
+        # return new objects so cached solutions cannot be modified
+        return [(Position(*pos), dict(virtual_angles)) for pos, virtual_angles in self._pos_cache[key]]
+
     def pos_from_hkl(self, hkl):
         """
         Get the closest position and virtual angles corresponding to a certain hkl. 
         If limits are enabled, makes sure the position is within limits.
+        Positions that collide in the occupancy map of the sample environment are rejected, see load_occupancy.
         Raises an exception if there are no allowed positions.
         
+        If track_branch is enabled, the solution branch of the current position 
+        is followed first, which is faster and avoids jumps between branches 
+        in scans and slider drags. All solutions are enumerated only if the 
+        branch is lost, goes outside limits or moves further than track_step.
+        
         Example::
             
             position_ob, virtual_angles = pos_from_hkl([1,1,1])
@@ -390,11 +935,19 @@ class DiffcalcEmulator:
 
         pos_now = self.position
 
+        if self.track_branch:
+            tracked = self.hklcalc.track_position(hkl[0], hkl[1], hkl[2], self.wl, pos_now)
+            if (tracked is not None and self.inlimits(tracked[0])
+                    and self.get_dist(pos_now, tracked[0]) <= self.track_step):
+                self.track_stats['tracked'] += 1
+                return tracked
+        self.track_stats['enumerated'] += 1
+
         pos_best = None
         va_best = None
         dist_best = None
 
-        for pos, virtual_angles in self.hklcalc.get_position(hkl[0], hkl[1], hkl[2], self.wl):
+        for pos, virtual_angles in self.get_all_positions(hkl):
 
             # print("choice", pos.asdict)
             if self.inlimits(pos):
@@ -624,6 +1177,8 @@ class DiffcalcEmulator:
             scan(l, 0.1, 2, 0.1, animate, wait, 0.1) # animates the l scan. Moves every 0.1 seconds.
             con(mu,0,gam,0,psi,0)
             scan(psi,0,10,1, collision) # tests for collisions at every value of psi.
+            scan(eta,0,90,5, clearance) # records the smallest distance between meshes at every value of eta.
+            scan(kappa,0,90,10, sweep) # checks the whole move between points for collisions.
 
         Parameters
         ----------
@@ -638,6 +1193,9 @@ class DiffcalcEmulator:
         *args : any, optional
             Implemented options are: 'animate' makes the scan do an animation, 'wait, seconds:float'
             makes the animation wait for the set number of seconds between movements, 'collision' tests for collisions at every step. 
+            'clearance' records the smallest distance between meshes at every step in scan_clearance
+            and reports distances below safety_margin. 'sweep' checks the whole move to every step 
+            for collisions with check_path and records the results in scan_path.
         
             
 
@@ -706,12 +1264,33 @@ class DiffcalcEmulator:
             col_test = False
             if 'collision' in clean_args:
                 col_test = True
+            clearance_test = 'clearance' in clean_args
+            if clearance_test:
+                self.scan_clearance = []
+            path_test = 'sweep' in clean_args
+            if path_test:
+                self.scan_path = []
 
             for val in steps:
+                last_position = self.position.astuple
                 scan_once(val)
+                if path_test:
+                    path = self.check_path(last_position, self.position.astuple, verbose=False)
+                    self.scan_path.append([val, path])
+                    if not path['safe']:
+                        print('Move to', val, 'collides between', path['intersections'])
                 if col_test: self.intersect()
+                if clearance_test:
+                    pairs = self.check_clearance(verbose=False)
+                    closest = pairs[0][:3] if pairs else ['', '', np.inf]
+                    self.scan_clearance.append([val, closest[2], closest[0], closest[1]])
+                    if closest[2] < self.safety_margin:
+                        print('Near miss: %s and %s are %.1f mm apart' % (closest[0], closest[1], 1000 * closest[2]))
 
             scan_cleanup()
+            if clearance_test and self.scan_clearance:
+                value, distance, name1, name2 = min(self.scan_clearance, key=lambda point: point[1])
+                print('Smallest clearance %.1f mm between %s and %s at' % (1000 * distance, name1, name2), value)
 
         print("Scan finished")
         print()
@@ -739,7 +1318,9 @@ class DiffcalcEmulator:
         *args : any, optional
             passed on to the 'scan' command. Implemented options are: 'animate' makes the scan do 
             an animation, 'wait, seconds:float' makes the animation wait for the set number of seconds 
-            between movements, 'collision' tests for collisions at every step.
+            between movements, 'collision' tests for collisions at every step, 
+            'clearance' records the smallest distance between meshes at every step,
+            'sweep' checks the whole move to every step for collisions.
 
         """
         key, step, numsteps = args[:3]
@@ -1019,7 +1600,7 @@ class DiffcalcEmulator:
                     print(azi_hkl)
                     print()
 
-                self.hklcalc = HklCalculation(self.ubcalc, self.cons)
+                self.hklcalc = HklCalculation(self.ubcalc, self.cons, self.hklcalc.verify, self.hklcalc.verify_every)
                 self.update_pos()
                 self.set_reciprocal_vectors()
                 vectors.set_vector('reference azimuthal', self.setnphi())
@@ -1127,15 +1708,316 @@ class DiffcalcEmulator:
 
         """
         print('all positions for hkl =', hkl)
-        for pos, virtual_angles in self.hklcalc.get_position(*hkl, self.wl):
-            pos = pos.asdict
-            for key in pos:
-                print(key + ': %-10.4f' % pos[key], end='')
-            print(' | ', end='')
-            for key in virtual_angles:
-                print(key + ': %-10.4f' % virtual_angles[key], end='')
+        solutions = reachability.solve_hkl_grid([hkl], self.hklcalc.ubcalc, self.cons, self.wl,
+                                                self.hklcalc.verify, workers=0)[0]
+        solutions = solutions[~np.isnan(solutions[:, 0])]
+        if len(solutions) == 0:
+            print('No solutions found for this hkl')
+        else:
+            virtual_angles = self.hklcalc.get_virtual_angles_array(solutions)
+            for pos, va in zip(solutions, virtual_angles):
+                for key, value in zip(Position.fields, pos):
+                    print(key + ': %-10.4f' % value, end='')
+                print(' | ', end='')
+                for key in params.virtual_angle_keys:
+                    print(key + ': %-10.4f' % va[key], end='')
+                print()
+        print()
+
+    def _choose_positions(self, solutions, reference_position=None):
+        """Choose the best of all solutions for many hkl values, as pos_from_hkl would.
+        Solutions within limits are preferred, then the closest to reference_position (see get_dist).
+        
+        Parameters
+        ----------
+        solutions : (N, M, 6) array
+            Eulerian angles of M solutions for every hkl, padded with NaN.
+        reference_position : Position, optional
+            The default is current position.
+
+        Returns
+        -------
+        position : (N, 6) array
+            best position for every hkl, NaN if there are no solutions.
+        inlimits : (N,) bool array
+            if best position is within limits.
+        nsolutions : (N,) int array
+            number of solutions regardless of limits.
+
+        """
+        if reference_position is None:
+            reference_position = self.position
+        n = len(solutions)
+        found = ~np.isnan(solutions[..., 0])
+        allowed = found.copy()
+        allowed[found] = self.inlimits_array(solutions[found])
+
+        position = np.full((n, 6), np.nan)
+        inlimits = np.zeros(n, dtype=bool)
+        if solutions.shape[1]:
+            # same distance as get_dist
+            ref = etok.setRange_array(np.array(reference_position.astuple))
+            dist = np.sqrt(np.sum((etok.setRange_array(solutions) - ref) ** 2, axis=-1))
+            dist[~allowed] += 1e6
+            dist[~found] = np.inf
+            best = np.argmin(dist, axis=1)
+            position[:] = solutions[np.arange(n), best]
+            inlimits = allowed[np.arange(n), best]
+        return position, inlimits, found.sum(axis=1)
+
+    def hkltable(self, tth_max=180., energy=None, workers=None, show=True):
+        """Table of all reflections reachable at the current energy. 
+        Every integer hkl with two-theta below tth_max is solved and the 
+        best position is chosen as pos_from_hkl would.
+        
+        Example::
+            
+            table = hkltable(100) # all reflections with two-theta < 100 deg
+            table[table['inlimits']] # reflections that can be reached within limits
+            table = hkltable(60, 8, show=False) # at 8 keV, without printing
+
+        Parameters
+        ----------
+        tth_max : float, optional
+            Largest two-theta in degrees. The default is 180.
+        energy : float, optional
+            Energy in keV. The default is the current energy.
+        workers : int, optional
+            | Number of worker processes used for solving. The default is the number of CPUs.
+            | Use 0 to solve in this process.
+        show : bool, optional
+            Print the table. The default is True.
+
+        Returns
+        -------
+        table : structured array
+            | Sorted by two-theta, with fields:
+            | 'h', 'k', 'l', 'tth', 'mu', 'delta', 'nu', 'eta', 'chi', 'phi', 
+            | virtual angles 'theta', 'ttheta', 'qaz', 'alpha', 'naz', 'tau', 'psi', 'beta', 'betain', 'betaout',
+            | 'inlimits' and 'nsolutions'.
+
+        """
+        if energy is None:
+            energy = self.scannables['en']()
+        ubcalc = self.hklcalc.ubcalc
+        hkl, tth = ubcalc.get_hkl_within_ttheta(energy, radians(tth_max))
+        solutions = reachability.solve_hkl_grid(hkl, ubcalc, self.cons, 12.39842 / energy,
+                                                self.hklcalc.verify, workers)
+        position, inlimits, nsolutions = self._choose_positions(solutions)
+
+        fields = [(name, int) for name in 'hkl'] + [('tth', float)]
+        fields += [(name, float) for name in Position.fields]
+        fields += [(name, float) for name in params.virtual_angle_keys]
+        fields += [('inlimits', bool), ('nsolutions', np.uint8)]
+        table = np.zeros(len(hkl), dtype=fields)
+        table['h'], table['k'], table['l'] = hkl.T
+        table['tth'] = np.degrees(tth)
+        for i, name in enumerate(Position.fields):
+            table[name] = position[:, i]
+        found = nsolutions > 0
+        for name in params.virtual_angle_keys:
+            table[name] = np.nan
+            if found.any():
+                table[name][found] = self.hklcalc.get_virtual_angles_array(position[found])[name]
+        table['inlimits'] = inlimits
+        table['nsolutions'] = nsolutions
+
+        if show:
+            print('%4s%4s%4s %9s ' % ('h', 'k', 'l', 'tth') + ''.join('%9s' % name for name in Position.fields) + '  inlimits')
+            for row in table:
+                print('%4d%4d%4d %9.4f ' % (row['h'], row['k'], row['l'], row['tth'])
+                      + ''.join('%9.4f' % row[name] for name in Position.fields) + '  ' + str(row['inlimits']))
+            print('%d of %d reflections reachable within limits' % (np.count_nonzero(inlimits), len(table)))
             print()
+        return table
+
+    def reachability_map(self, h_range, k_range, l_range, energy=None, constraints=None,
+                         workers=None, filename=None, reference_position=None):
+        """Map which parts of reciprocal space can be reached within the limits.
+        All hkl grid points are solved in a pool of worker processes, then the 
+        solutions are checked with inlimits_array in this process. For every point the 
+        closest allowed position to reference_position is stored, as pos_from_hkl would choose.
+        If no solution is allowed, the closest solution outside the limits is stored.
+        
+        Example::
+            
+            vol = reachability_map([0,2,0.05], [0,2,0.05], [0,4,0.05], 8, {'mu':0,'nu':0,'psi':0})
+            vol = reachability_map([-1,1,0.1], 0, [0,3,0.1], filename='map.npz', workers=0) # in this process
+            frac = vol['inlimits'].mean() # reachable fraction of the grid
+
+        Parameters
+        ----------
+        h_range, k_range, l_range : float or [start, stop, step] or array
+            Miller indices along each axis. stop is included, like in scan.
+        energy : float, optional
+            Energy in keV. The default is the current energy.
+        constraints : dict or tuple, optional
+            Constraints in the con format, e.g. {'mu':0,'nu':0,'psi':0}. The default is the current constraints.
+        workers : int, optional
+            | Number of worker processes. The default is the number of CPUs.
+            | Use 0 to solve in this process, e.g. if processes cannot be started from Blender.
+        filename : str, optional
+            Save the map to a .npz file, or HDF5 file if the extension is .h5, .hdf5, .hdf or .nxs.
+            The default is None.
+        reference_position : Position, optional
+            Distances to solutions are measured from this position. The default is current position.
+
+        Returns
+        -------
+        volume : dict{ str:array }
+            | 'h', 'k', 'l' : 1D arrays of grid axes
+            | 'position' : (nh, nk, nl, 6) float32 array of best mu, delta, nu, eta, chi, phi, NaN if no solution
+            | 'inlimits' : (nh, nk, nl) bool array, if best position is within limits
+            | 'nsolutions' : (nh, nk, nl) uint8 array, number of solutions regardless of limits
+            | 'energy', 'constraints' : settings the map was calculated with
+
+        """
+        if energy is None:
+            energy = self.scannables['en']()
+        if constraints is None:
+            constraints = self.cons
+        elif not isinstance(constraints, Constraints):
+            constraints = Constraints(constraints)
+        axes, hkl = reachability.hkl_grid(h_range, k_range, l_range)
+        shape = tuple(len(ax) for ax in axes)
+        print('Solving %d hkl values' % len(hkl))
+        solutions = reachability.solve_hkl_grid(hkl, self.hklcalc.ubcalc, constraints, 12.39842 / energy,
+                                                self.hklcalc.verify, workers)
+
+        position, inlimits, nsolutions = self._choose_positions(solutions, reference_position)
+
+        volume = {
+            'h': axes[0],
+            'k': axes[1],
+            'l': axes[2],
+            'position': position.astype(np.float32).reshape(shape + (6,)),
+            'inlimits': inlimits.reshape(shape),
+            'nsolutions': nsolutions.astype(np.uint8).reshape(shape),
+            'energy': np.array(energy, dtype=float),
+            'constraints': np.array(str(constraints.asdict)),
+        }
+        print('%d of %d hkl values reachable within limits' % (np.count_nonzero(inlimits), len(hkl)))
+        if filename is not None:
+            reachability.save_reachability_map(filename, volume)
+            print('Saved', filename)
         print()
+        return volume
+
+    def collision_map(self, axes, ranges, steps=None, environment=None, filename='collision map.npy',
+                      model=None, fixed=None, workers=None, clearance=None):
+        """Map collisions on a grid of real motor angles, without moving the simulation.
+        The meshes are exported once (see export_model) and checked by worker processes
+        with the standalone collision engine. Every finished chunk is saved to filename,
+        calling again with the same arguments resumes an interrupted map.
+        
+        Example::
+            
+            cmap = collision_map(['ktheta', 'kappa'], [[-90, 210], [-180, 180]], [1, 1], 'cryostat')
+            cmap = collision_map(['kphi', 'kappa'], [[-90, 270], [-180, 180]], [5, 5], fixed={'ktheta': 30}, workers=0)
+            collisions = cmap['collision'] == 1
+
+        Parameters
+        ----------
+        axes : [str]
+            motor names of the grid axes, from kmu, kdelta, kgamma, ktheta, kappa, kphi.
+        ranges : [[start, stop], ...]
+            range of each axis in degrees, stop is included.
+        steps : [float], optional
+            step of each axis in degrees.
+        environment : str, optional
+            sample environment collection to check. The default is None, which checks the visible ones.
+        filename : str, optional
+            .npy file of the map. The default is 'collision map.npy'.
+        model : str, optional
+            .npz collision model file. The default is None, which uses '<filename> model.npz',
+            exporting the current scene to it if it doesn't exist.
+        fixed : dict, optional
+            angles of motors not in axes, e.g. {'kphi': 90}. The default is 0.
+        workers : int, optional
+            | Number of worker processes. The default is the number of CPUs.
+            | Use 0 to check in this process, e.g. if processes cannot be started from Blender.
+        clearance : float, optional
+            also save the smallest distance between meshes up to this distance in m, e.g. clearance_distance.
+            The default is None.
+
+        Returns
+        -------
+        cmap : dict
+            | 'axes' : list of motor names of the grid axes
+            | motor name : 1D array of values along each axis
+            | 'collision' : memory-mapped int8 array, 1 collision, 0 no collision, -1 not checked
+            | 'clearance' : memory-mapped float32 array of distances in m, if clearance is given
+
+        """
+        if model is None:
+            model = os.path.splitext(filename)[0] + ' model.npz'
+            if not os.path.isfile(model):
+                self.export_model(model)
+        return collision_mapping.collision_map(filename, model, axes, ranges, steps, environment, fixed, workers,
+                                               clearance=clearance)
+
+    def adaptive_collision_map(self, axes, ranges, coarse_step=8., resolution=0.5, environment=None,
+                               filename=None, model=None, fixed=None, workers=None, use_blender=False):
+        """Map collisions on a coarse grid of real motor angles, refining only cells on a collision boundary.
+        Cells are split in half along every axis while their corners disagree, down to resolution.
+        
+        Example::
+            
+            tree = adaptive_collision_map(['ktheta', 'kappa'], [[-90, 210], [-180, 180]], 8, 0.5, 'cryostat')
+            tree.query([[30, 45]])  # 0 no collision, 1 collision, 2 boundary
+            tree = adaptive_collision_map(['ktheta', 'kappa'], [[-90, 210], [-180, 180]], 20, 5, use_blender=True)
+
+        Parameters
+        ----------
+        axes : [str]
+            motor names of the axes, from kmu, kdelta, kgamma, ktheta, kappa, kphi.
+        ranges : [[start, stop], ...]
+            range of each axis in degrees.
+        coarse_step : float, optional
+            size of the initial cells in degrees. The default is 8.
+        resolution : float, optional
+            largest size of the smallest cells in degrees. The default is 0.5.
+        environment : str, optional
+            sample environment collection to check. The default is None, which checks the visible ones.
+            Not used with use_blender, which checks the visible meshes.
+        filename : str, optional
+            save the tree to this .npz file. The default is None.
+        model : str, optional
+            .npz collision model file. The default is None, which exports the current scene to a temporary file.
+        fixed : dict, optional
+            angles of motors not in axes, e.g. {'kphi': 90}. The default is 0.
+        workers : int, optional
+            | Number of worker processes. The default is the number of CPUs.
+            | Use 0 to check in this process, e.g. if processes cannot be started from Blender.
+        use_blender : bool, optional
+            move the simulation with kang and check with intersect() instead of the collision model, slow.
+            The default is False.
+
+        Returns
+        -------
+        tree : CollisionTree
+            sparse collision map, see i16sim.util.collision_map.CollisionTree.
+
+        """
+        if use_blender:
+            start_position = self.position.astuple
+            def check(k_angles):
+                collides = []
+                for k in k_angles:
+                    self.moveto([*k[:3], *etok.KtoE(list(k[3:]))], use_limits=False, UI_call=False)
+                    collides.append(len(self.intersect()) > 0)
+                return np.array(collides)
+            try:
+                return collision_mapping.adaptive_collision_map(None, axes, ranges, coarse_step, resolution,
+                                                                fixed=fixed, filename=filename, check=check)
+            finally:
+                self.moveto(start_position, use_limits=False)
+
+        if model is None:
+            model = os.path.join(tempfile.gettempdir(), 'i16sim model.npz')
+            self.export_model(model)
+        return collision_mapping.adaptive_collision_map(model, axes, ranges, coarse_step, resolution, environment,
+                                                        fixed, workers, filename)
 
     def c2th(self, hkl):
         """Calculate two-theta scattering angle for a reflection
@@ -1156,7 +2038,9 @@ class DiffcalcEmulator:
             2*theta. Scattering angle
 
         """
-        tth = degrees(self.ubcalc.get_ttheta_from_hkl(hkl, self.scannables['en']()))
+        tth = degrees(self.ubcalc.get_ttheta_from_hkl_array([hkl], self.scannables['en']())[0])
+        if np.isnan(tth):
+            raise Exception('Reflection un-reachable at this energy')
         print(tth)
         print()
         return tth
@@ -1215,7 +2099,7 @@ class DiffcalcEmulator:
         """
         print("Calculating UB matrix")
         self.ubcalc.calc_ub(*args)
-        self.hklcalc = HklCalculation(self.ubcalc, self.cons)
+        self.hklcalc = HklCalculation(self.ubcalc, self.cons, self.hklcalc.verify, self.hklcalc.verify_every)
         print()
 
         self.set_reciprocal_vectors()
@@ -1241,22 +2125,22 @@ class DiffcalcEmulator:
             if self.ubcalc.get_number_reflections() > 0:
                 print("reflections")
                 print("%s,  %s,  %s,  %s,  %s " % ("id", 'hkl_set', 'hkl_computed', 'energy', "tag"))
-                for i in range(1, len(self.ubcalc.reflist) + 1):
-                    ref = self.ubcalc.reflist.get_reflection(i)
-                    hkl = self.hklcalc.get_hkl(ref.pos, self.wl)
+                refs = [self.ubcalc.reflist.get_reflection(i) for i in range(1, len(self.ubcalc.reflist) + 1)]
+                hkls = self.hklcalc.get_hkl_array([Position.asdegrees(ref.pos).astuple for ref in refs], self.wl)
+                for i, ref in enumerate(refs, 1):
                     ref = list(ref.astuple)
-                    ref[1] = hkl  # swap position for calculated hkl
+                    ref[1] = tuple(hkls[i - 1].tolist())  # swap position for calculated hkl
                     print(str(i) + ',', ref)
                 print()
             if self.ubcalc.get_number_orientations() > 0:
                 print("orientations")
                 print("%s,  %s,  %s,  %s,  %s " % ("id", 'hkl_set', 'hkl_computed', 'xyz', "tag"))
-                for i in range(1, len(self.ubcalc.orientlist) + 1):
-                    ref = self.ubcalc.orientlist.get_orientation(i)
-                    hkl = self.hklcalc.get_hkl(ref.pos, self.wl)
+                refs = [self.ubcalc.orientlist.get_orientation(i) for i in range(1, len(self.ubcalc.orientlist) + 1)]
+                hkls = self.hklcalc.get_hkl_array([Position.asdegrees(ref.pos).astuple for ref in refs], self.wl)
+                for i, ref in enumerate(refs, 1):
                     ref = list(ref.astuple)
                     ref[2] = ref[1]  # change order
-                    ref[1] = hkl
+                    ref[1] = tuple(hkls[i - 1].tolist())
                     print(str(i) + ',', ref)
                 print()
 
@@ -1429,9 +2313,46 @@ class DiffcalcEmulator:
         Creates a new hkl calculation object
         
         """
-        self.hklcalc = HklCalculation(self.ubcalc, self.cons)
+        self.hklcalc = HklCalculation(self.ubcalc, self.cons, self.hklcalc.verify, self.hklcalc.verify_every)
         print(self.scannables['hkl'])
 
+    def setverify(self, policy=None, every=None):
+        """Set how hkl to position solutions are verified. 
+        If no parameters given, print the current policy and verification statistics.
+        
+        | 'always': every solution is checked and errors are raised (default).
+        | 'sampled': one in 'every' solutions is checked, failures are logged and discarded.
+        | 'off': solutions are not checked. Fastest, for bulk planning jobs.
+        
+        Example::
+            
+            setverify('sampled', 100) # check one in 100 solutions
+
+        Parameters
+        ----------
+        policy : str, optional
+            One of 'always', 'sampled' or 'off'. The default is None.
+        every : int, optional
+            Sampling interval of the 'sampled' policy. The default is None.
+
+        Returns
+        -------
+        stats : dict{ str:int }
+            numbers of checked, skipped and failed solutions.
+
+        """
+        if policy is not None:
+            self.hklcalc.verify = policy
+        if every is not None:
+            self.hklcalc.verify_every = every
+        print('verification policy:', self.hklcalc.verify, end='')
+        if self.hklcalc.verify == 'sampled':
+            print(' (one in %d)' % self.hklcalc.verify_every, end='')
+        print()
+        print(self.hklcalc.verification_stats)
+        print()
+        return self.hklcalc.verification_stats
+
     def ub(self):
         """Prints the state of the current UB calculation
         
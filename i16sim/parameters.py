@@ -9,7 +9,7 @@ from math import pi
 
 
 #scannable identifiers. 
-simple_scannables=['wait','collision','animate','zp','dettrans','base_y','base_z'] #no movement
+simple_scannables=['wait','collision','clearance','sweep','animate','zp','dettrans','base_y','base_z'] #no movement
 renamed={
         'gam': 'nu', 'gamma': 'nu', 'kgam': 'nu',
         'kth': 'ktheta',
@@ -47,6 +47,20 @@ chi_axis="chi axis"
 collision_exceptions=[["delta","detector arm"]]
 #collections of objects that touch
 intersect_collections=[['Sample environments',['phi']],['Environment',['base']],['nozzles',['detector arm']],['pipe',[]]]
+#collection containing a sub-collection for each sample environment
+sample_environments='Sample environments'
+#approximate motor speeds in degrees per second, used to estimate move times
+motor_speeds={'kmu':1.,'kdelta':1.,'kgamma':1.,'ktheta':1.,'kappa':1.,'kphi':1.}
+#move orders checked by plan_move, motors moving at once in each stage
+move_orders={
+        'simultaneous':[['kmu','kdelta','kgamma','ktheta','kappa','kphi']],
+        'detector first':[['kdelta','kgamma'],['kmu','ktheta','kappa','kphi']],
+        'sample first':[['kmu','ktheta','kappa','kphi'],['kdelta','kgamma']],
+        'each axis alone':[['kmu'],['kdelta'],['kgamma'],['ktheta'],['kappa'],['kphi']],
+        }
+#distances between meshes in Blender units (m)
+clearance_distance=0.05 #largest distance measured by clearance checks
+safety_margin=0.005 #meshes closer than this are reported as near misses
 
 #nexus file paths
 motor_names=['mu','delta','gam','eta','chi','phi']
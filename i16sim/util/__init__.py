@@ -9,4 +9,25 @@ hdf5_to_i16sim:
 
 scannables:
     functions for creating scannable objects and composite limits.
+
+reachability:
+    functions for solving hkl grids in a process pool and saving reciprocal space accessibility maps.
+
+kinematics:
+    forward kinematics of the diffractometer armature for many poses at once, without Blender.
+
+collision:
+    collision detection without Blender: bounding box sweep and prune, triangle BVH trees and CollisionModel.
+
+collision_map:
+    functions for checking grids of motor angles for collisions in a process pool, saved to resumable memory-mapped files.
+
+move_planner:
+    functions for checking the intermediate positions of motor move orders and choosing the fastest safe order.
+
+memo:
+    least recently used memo of results by quantized pose, optionally kept in an SQLite file between sessions.
+
+shared_arrays:
+    NumPy arrays in one shared memory block, used by worker processes without copying them.
 """
\ No newline at end of file
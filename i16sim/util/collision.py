@@ -0,0 +1,1177 @@
+# -*- coding: utf-8 -*-
+"""
+Collision detection helpers that do not need Blender
+
+transform_aabb(bounds_min, bounds_max, matrix):
+    get world axis-aligned bounding box of a local bounding box moved by a 4x4 matrix
+
+sweep_and_prune(bounds_min, bounds_max):
+    get index pairs of overlapping axis-aligned bounding boxes
+
+allowed_contact_matrix(names, groups):
+    get boolean matrix of mesh pairs that are allowed to touch
+
+triangles_intersect(triangles1, triangles2):
+    check if pairs of triangles intersect
+
+triangles_distance(triangles1, triangles2):
+    get distance and closest points of pairs of triangles
+
+TriangleBVH(vertices, triangles):
+    bounding volume hierarchy of a triangle mesh for overlap and distance tests
+
+ConvexProxy.enclosing(points, max_vertices):
+    inflated, decimated convex hull containing all points
+
+convex_proxies(vertices, triangles):
+    get level of detail proxies of a mesh, a hull of the whole mesh and hulls of pieces of it
+
+proxies_overlap(proxies1, proxies2, matrix):
+    check if the proxies of two meshes overlap, from coarse to fine
+
+save_proxies(filename, proxies), load_proxies(filename):
+    cache proxies on disk, see mesh_digest
+
+CollisionModel(armature, mesh_names, parts, ...):
+    meshes of the simulation attached to armature bones, checks for collisions in any pose.
+    Load the file written in Blender by i16sim.bl.export_model.export_model.
+
+Only NumPy and SciPy are needed, the module is imported in plain Python (outside Blender) as:
+
+Example::
+
+    from i16sim.util.collision import CollisionModel
+    model = CollisionModel.load('i16model.npz')
+    print(model.intersect([0, 30, 0, 15, 45, 0]))  # [['mesh1', 'mesh2'], ...]
+    print(model.clearance([0, 30, 0, 15, 45, 0], 0.05))  # [['mesh1', 'mesh2', distance, point1, point2], ...]
+    print(model.check_path([0, 0, 0, 30, 0, 0], [0, 0, 0, 30, 90, 0])['safe'])  # whole move of kappa
+
+"""
+
+import os
+import hashlib
+
+import numpy as np
+from scipy.spatial import ConvexHull
+
+import i16sim.parameters as params
+import i16sim.util.eulerian_conversion as etok
+from i16sim.util.kinematics import ArmatureModel
+
+
+def transform_aabb(bounds_min, bounds_max, matrix):
+    """
+    Get the axis-aligned bounding box enclosing a transformed local bounding box.
+    in: bounds_min, bounds_max # (3,) or (N, 3) local box corners
+        matrix # (4, 4) local to world transform
+    out: world_min, world_max # (3,) or (N, 3) arrays
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    bounds_min = np.asarray(bounds_min, dtype=float)
+    bounds_max = np.asarray(bounds_max, dtype=float)
+    centre = ((bounds_min + bounds_max) / 2) @ matrix[:3, :3].T + matrix[:3, 3]
+    extent = ((bounds_max - bounds_min) / 2) @ np.abs(matrix[:3, :3]).T
+    return centre - extent, centre + extent
+
+
+def sweep_and_prune(bounds_min, bounds_max, axis=None):
+    """
+    Find all pairs of overlapping axis-aligned bounding boxes.
+    Boxes are sorted along one axis and swept, only boxes overlapping on that axis are compared.
+
+    Parameters
+    ----------
+    bounds_min, bounds_max : (N, 3) array
+        Minimum and maximum corners of the boxes.
+    axis : int, optional
+        Axis to sweep along. The default is None, which uses the axis with the largest spread of boxes.
+
+    Returns
+    -------
+    pairs : list [(i, j), ...]
+        Index pairs of overlapping boxes, i < j.
+
+    """
+    bounds_min = np.asarray(bounds_min, dtype=float).reshape(-1, 3)
+    bounds_max = np.asarray(bounds_max, dtype=float).reshape(-1, 3)
+    if axis is None:
+        centres = (bounds_min + bounds_max) / 2
+        axis = int(np.argmax(np.var(centres, axis=0))) if len(centres) else 0
+
+    pairs = []
+    active = []
+    for i in np.argsort(bounds_min[:, axis], kind='stable'):
+        # boxes ending before this one starts can't overlap anything later
+        active = [j for j in active if bounds_max[j, axis] >= bounds_min[i, axis]]
+        for j in active:
+            if np.all(bounds_min[i] <= bounds_max[j]) and np.all(bounds_min[j] <= bounds_max[i]):
+                pairs.append((min(i, j), max(i, j)))
+        active.append(i)
+    return sorted((int(i), int(j)) for i, j in pairs)
+
+
+def allowed_contact_matrix(names, groups):
+    """
+    Get matrix of mesh pairs that are allowed to touch.
+    Two meshes may touch if both are in the same group.
+    in: names # list of N mesh names
+        groups # list of lists of mesh names, e.g. [['delta', 'detector arm'], ...]
+    out: (N, N) boolean array, True if the pair is allowed to touch
+    """
+    index = {name: i for i, name in enumerate(names)}
+    allowed = np.eye(len(names), dtype=bool)
+    for group in groups:
+        idx = np.array(sorted({index[name] for name in group if name in index}), dtype=int)
+        allowed[np.ix_(idx, idx)] = True
+    return allowed
+
+
+def triangles_intersect(triangles1, triangles2, tolerance=1e-9):
+    """
+    Check if pairs of triangles intersect, using the separating axis theorem.
+    Touching triangles intersect.
+    in: triangles1, triangles2 # (N, 3, 3) arrays of triangle vertex coordinates
+        tolerance # gap relative to the coordinate size needed to separate triangles
+    out: (N,) boolean array
+    """
+    t1 = np.asarray(triangles1, dtype=float)
+    t2 = np.asarray(triangles2, dtype=float)
+    e1 = t1[:, [1, 2, 0]] - t1
+    e2 = t2[:, [1, 2, 0]] - t2
+    n1 = np.cross(e1[:, 0], e1[:, 1])
+    n2 = np.cross(e2[:, 0], e2[:, 1])
+    axes = np.concatenate([
+        n1[:, None],
+        n2[:, None],
+        np.cross(e1[:, :, None], e2[:, None, :]).reshape(-1, 9, 3),
+        np.cross(n1[:, None], e1),  # in plane axes, for coplanar triangles
+        np.cross(n2[:, None], e2),
+    ], axis=1)
+    norm = np.linalg.norm(axes, axis=-1, keepdims=True)
+    axes = np.divide(axes, norm, out=np.zeros_like(axes), where=norm > 0)
+
+    p1 = np.einsum('nvk,nak->nav', t1, axes)
+    p2 = np.einsum('nvk,nak->nav', t2, axes)
+    gap = tolerance * (1 + np.maximum(np.abs(t1).max(axis=(1, 2)), np.abs(t2).max(axis=(1, 2))))[:, None]
+    separated = (p1.max(axis=-1) < p2.min(axis=-1) - gap) | (p2.max(axis=-1) < p1.min(axis=-1) - gap)
+    return ~np.any(separated, axis=1)
+
+
+def _closest_segment_points(p1, q1, p2, q2):
+    """
+    Closest points of pairs of line segments p1-q1 and p2-q2.
+    in: p1, q1, p2, q2 # (N, 3) arrays of segment end points
+    out: c1, c2 # (N, 3) arrays of the closest point on each segment
+    """
+    d1, d2, r = q1 - p1, q2 - p2, p1 - p2
+    a = np.einsum('ij,ij->i', d1, d1)
+    e = np.einsum('ij,ij->i', d2, d2)
+    b = np.einsum('ij,ij->i', d1, d2)
+    c = np.einsum('ij,ij->i', d1, r)
+    f = np.einsum('ij,ij->i', d2, r)
+    eps = 1e-12 * (1 + a + e)
+    safe_a = np.where(a > eps, a, 1)
+    safe_e = np.where(e > eps, e, 1)
+    denom = a * e - b * b
+    # closest point on the infinite line of segment 1, then clamp to both segments
+    s = np.where(denom > eps * (a + e), np.clip((b * f - c * e) / np.where(denom > 0, denom, 1), 0, 1), 0)
+    t = (b * s + f) / safe_e
+    s = np.where(t < 0, np.clip(-c / safe_a, 0, 1), np.where(t > 1, np.clip((b - c) / safe_a, 0, 1), s))
+    t = np.clip(t, 0, 1)
+    # degenerate segments are points
+    s = np.where(a > eps, s, 0)
+    t = np.where(e > eps, np.where(a > eps, t, np.clip(f / safe_e, 0, 1)), 0)
+    s = np.where((e <= eps) & (a > eps), np.clip(-c / safe_a, 0, 1), s)
+    return p1 + s[:, None] * d1, p2 + t[:, None] * d2
+
+
+def _inside_triangles(points, triangles, normals):
+    """True for each point, in the plane of the triangle, that is inside the triangle"""
+    inside = np.ones(len(points), dtype=bool)
+    for i in range(3):
+        edge = triangles[:, (i + 1) % 3] - triangles[:, i]
+        inside &= np.einsum('ij,ij->i', np.cross(edge, points - triangles[:, i]), normals) >= 0
+    return inside
+
+
+def triangles_distance(triangles1, triangles2):
+    """
+    Get the distance and closest points of pairs of triangles.
+    The closest points are on two edges or a vertex and the face of the other triangle,
+    intersecting triangles have distance 0 and both points where an edge crosses the other triangle.
+    in: triangles1, triangles2 # (N, 3, 3) arrays of triangle vertex coordinates
+    out: distance # (N,) array
+         points1, points2 # (N, 3) arrays of the closest points
+    """
+    t1 = np.asarray(triangles1, dtype=float).reshape(-1, 3, 3)
+    t2 = np.asarray(triangles2, dtype=float).reshape(-1, 3, 3)
+    n = len(t1)
+    candidates1, candidates2 = [], []
+    # edge to edge
+    for i in range(3):
+        for j in range(3):
+            c1, c2 = _closest_segment_points(t1[:, i], t1[:, (i + 1) % 3], t2[:, j], t2[:, (j + 1) % 3])
+            candidates1.append(c1)
+            candidates2.append(c2)
+    # vertex to face, only if the vertex projects inside the face, otherwise an edge is closer
+    crossings = []
+    for ta, tb, first in ((t1, t2, True), (t2, t1, False)):
+        normal = np.cross(tb[:, 1] - tb[:, 0], tb[:, 2] - tb[:, 0])
+        norm2 = np.einsum('ij,ij->i', normal, normal)
+        valid = norm2 > 0
+        safe_norm2 = np.where(valid, norm2, 1)
+        height = np.einsum('nvk,nk->nv', ta - tb[:, None, 0], normal)  # signed height * |normal|
+        for v in range(3):
+            projected = ta[:, v] - (height[:, v] / safe_norm2)[:, None] * normal
+            inside = valid & _inside_triangles(projected, tb, normal)
+            point = np.where(inside[:, None], projected, np.nan)
+            candidates1.append(ta[:, v] if first else point)
+            candidates2.append(point if first else ta[:, v])
+            # edge from this vertex crossing the face
+            w = (v + 1) % 3
+            h0, h1 = height[:, v], height[:, w]
+            crosses = valid & (h0 * h1 <= 0) & (h0 != h1)
+            x = ta[:, v] + (h0 / np.where(crosses, h0 - h1, 1))[:, None] * (ta[:, w] - ta[:, v])
+            crossings.append(np.where((crosses & _inside_triangles(x, tb, normal))[:, None], x, np.nan))
+
+    candidates1 = np.stack(candidates1, axis=1)
+    candidates2 = np.stack(candidates2, axis=1)
+    dist = np.linalg.norm(candidates1 - candidates2, axis=-1)
+    best = np.argmin(np.where(np.isnan(dist), np.inf, dist), axis=1)
+    points1 = candidates1[np.arange(n), best]
+    points2 = candidates2[np.arange(n), best]
+    distance = dist[np.arange(n), best]
+
+    touching = triangles_intersect(t1, t2)
+    distance[touching] = 0
+    crossings = np.stack(crossings, axis=1)
+    crossed = ~np.isnan(crossings[..., 0])
+    use = touching & crossed.any(axis=1)
+    crossing = crossings[np.arange(n), np.argmax(crossed, axis=1)]
+    points1[use] = points2[use] = crossing[use]
+    return distance, points1, points2
+
+
+class TriangleBVH:
+    """
+    Bounding volume hierarchy of a triangle mesh
+
+    Binary tree of axis-aligned boxes, split at the median triangle along the longest axis,
+    with up to leaf_size triangles in each leaf.
+
+    Parameters
+    ----------
+    vertices : (n, 3) array
+        vertex coordinates.
+    triangles : (m, 3) int array
+        vertex indices of each triangle.
+    leaf_size : int, optional
+        largest number of triangles in a leaf. The default is 8.
+    """
+
+    def __init__(self, vertices, triangles, leaf_size=8):
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+        tris = vertices[np.asarray(triangles, dtype=int).reshape(-1, 3)]
+        centroids = tris.mean(axis=1)
+        tri_min = tris.min(axis=1)
+        tri_max = tris.max(axis=1)
+
+        order = np.arange(len(tris))
+        node_min, node_max, children, start, count = [], [], [], [], []
+        stack = [(0, len(tris), -1, 0)]  # triangle range, parent node, child number
+        while stack:
+            lo, hi, parent, side = stack.pop()
+            idx = order[lo:hi]
+            node = len(start)
+            node_min.append(tri_min[idx].min(axis=0) if len(idx) else np.zeros(3))
+            node_max.append(tri_max[idx].max(axis=0) if len(idx) else np.zeros(3))
+            children.append([-1, -1])
+            start.append(lo)
+            count.append(hi - lo)
+            if parent >= 0:
+                children[parent][side] = node
+            if hi - lo > leaf_size:
+                c = centroids[idx]
+                axis = np.argmax(c.max(axis=0) - c.min(axis=0))
+                mid = (hi - lo) // 2
+                order[lo:hi] = idx[np.argpartition(c[:, axis], mid)]
+                stack.append((lo, lo + mid, node, 0))
+                stack.append((lo + mid, hi, node, 1))
+
+        self.triangles = tris[order]
+        self.node_min = np.array(node_min)
+        self.node_max = np.array(node_max)
+        self.children = np.array(children, dtype=int)
+        self.start = np.array(start, dtype=int)
+        self.count = np.array(count, dtype=int)
+        self.is_leaf = self.children[:, 0] < 0
+        self.volume = np.prod(self.node_max - self.node_min, axis=1)
+
+    def __repr__(self):
+        return 'TriangleBVH(%d triangles, %d nodes)' % (len(self.triangles), len(self.start))
+
+    @property
+    def asdict(self):
+        """Dictionary of tree arrays, see TriangleBVH.from_arrays"""
+        return {'triangles': self.triangles, 'node_min': self.node_min, 'node_max': self.node_max,
+                'children': self.children, 'start': self.start, 'count': self.count}
+
+    @classmethod
+    def from_arrays(cls, triangles, node_min, node_max, children, start, count):
+        """Tree from the arrays of a built tree (see asdict), e.g. views of shared memory, without copying them"""
+        bvh = cls.__new__(cls)
+        bvh.triangles = triangles
+        bvh.node_min = node_min
+        bvh.node_max = node_max
+        bvh.children = children
+        bvh.start = start
+        bvh.count = count
+        bvh.is_leaf = children[:, 0] < 0
+        bvh.volume = np.prod(node_max - node_min, axis=1)
+        return bvh
+
+    def _leaf_triangles(self, la, other, lb):
+        """indexes of all triangle pairs in the leaf node pairs (la, lb)"""
+        ca, cb = self.count[la], other.count[lb]
+        n = ca * cb
+        pair = np.repeat(np.arange(len(la)), n)
+        k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        return self.start[la][pair] + k // cb[pair], other.start[lb][pair] + k % cb[pair]
+
+    def _leaves_overlap(self, a, other, b, matrix, chunk_size=4096):
+        """True if any triangle pair in the leaf node pairs (a, b) intersects"""
+        rotation, translation = matrix[:3, :3].T, matrix[:3, 3]
+        for i in range(0, len(a), chunk_size):
+            ia, ib = self._leaf_triangles(a[i:i + chunk_size], other, b[i:i + chunk_size])
+            if np.any(triangles_intersect(self.triangles[ia], other.triangles[ib] @ rotation + translation)):
+                return True
+        return False
+
+    def overlap(self, other, matrix=None):
+        """
+        Check if any triangle of this mesh intersects any triangle of another mesh.
+        in: other # TriangleBVH
+            matrix # (4, 4) transform from the space of other into the space of this mesh, default identity
+        out: bool
+        """
+        if len(self.triangles) == 0 or len(other.triangles) == 0:
+            return False
+        matrix = np.eye(4) if matrix is None else np.asarray(matrix, dtype=float)
+        other_min, other_max = transform_aabb(other.node_min, other.node_max, matrix)
+
+        a = np.zeros(1, dtype=int)
+        b = np.zeros(1, dtype=int)
+        while len(a):
+            keep = np.all(self.node_min[a] <= other_max[b], axis=1) & np.all(other_min[b] <= self.node_max[a], axis=1)
+            a, b = a[keep], b[keep]
+            leaf_a, leaf_b = self.is_leaf[a], other.is_leaf[b]
+            leaves = leaf_a & leaf_b
+            if np.any(leaves) and self._leaves_overlap(a[leaves], other, b[leaves], matrix):
+                return True
+            # descend into the larger box, or the one that is not a leaf
+            split_a = ~leaf_a & (leaf_b | (self.volume[a] >= other.volume[b]))
+            split_b = ~leaves & ~split_a
+            a = np.concatenate([self.children[a[split_a], 0], self.children[a[split_a], 1], a[split_b], a[split_b]])
+            b = np.concatenate([b[split_a], b[split_a], other.children[b[split_b], 0], other.children[b[split_b], 1]])
+        return False
+
+    def nearest(self, other, matrix=None, max_distance=np.inf, chunk_size=1024):
+        """
+        Find the closest points of this mesh and another mesh.
+        Node pairs further apart than the closest points found so far, or than max_distance, are skipped.
+
+        Parameters
+        ----------
+        other : TriangleBVH
+            the other mesh.
+        matrix : (4, 4) array, optional
+            transform from the space of other into the space of this mesh. The default is identity.
+        max_distance : float, optional
+            stop searching for points further apart than this. The default is inf.
+
+        Returns
+        -------
+        distance : float
+            smallest distance between the meshes, 0 if they intersect, inf if further than max_distance.
+        point, other_point : (3,) array or None
+            closest point of each mesh in the space of this mesh, None if further than max_distance.
+
+        """
+        if len(self.triangles) == 0 or len(other.triangles) == 0:
+            return np.inf, None, None
+        matrix = np.eye(4) if matrix is None else np.asarray(matrix, dtype=float)
+        rotation, translation = matrix[:3, :3].T, matrix[:3, 3]
+        other_min, other_max = transform_aabb(other.node_min, other.node_max, matrix)
+        # a vertex of each node, any two give an upper bound of the distance
+        vertex = self.triangles[self.start, 0]
+        other_vertex = other.triangles[other.start, 0] @ rotation + translation
+
+        best, points = max_distance, None
+        a = np.zeros(1, dtype=int)
+        b = np.zeros(1, dtype=int)
+        while len(a):
+            gap = np.maximum(np.maximum(self.node_min[a] - other_max[b], other_min[b] - self.node_max[a]), 0)
+            lower = np.linalg.norm(gap, axis=1)
+            upper = np.linalg.norm(vertex[a] - other_vertex[b], axis=1)
+            i = np.argmin(upper)
+            if upper[i] <= best:
+                best, points = upper[i], (vertex[a[i]], other_vertex[b[i]])
+                if best == 0:
+                    return 0., points[0], points[1]
+            keep = lower <= best
+            a, b, lower = a[keep], b[keep], lower[keep]
+
+            leaf_a, leaf_b = self.is_leaf[a], other.is_leaf[b]
+            leaves = leaf_a & leaf_b
+            order = np.argsort(lower[leaves])
+            la, lb, ll = a[leaves][order], b[leaves][order], lower[leaves][order]
+            for i in range(0, len(la), chunk_size):
+                if ll[i] > best:
+                    break
+                ia, ib = self._leaf_triangles(la[i:i + chunk_size], other, lb[i:i + chunk_size])
+                dist, p1, p2 = triangles_distance(self.triangles[ia], other.triangles[ib] @ rotation + translation)
+                j = np.argmin(dist)
+                if dist[j] <= best:
+                    best, points = dist[j], (p1[j], p2[j])
+                if best == 0:
+                    return 0., points[0], points[1]
+
+            split_a = ~leaf_a & (leaf_b | (self.volume[a] >= other.volume[b]))
+            split_b = ~leaves & ~split_a
+            a = np.concatenate([self.children[a[split_a], 0], self.children[a[split_a], 1], a[split_b], a[split_b]])
+            b = np.concatenate([b[split_a], b[split_a], other.children[b[split_b], 0], other.children[b[split_b], 1]])
+        if points is None:
+            return np.inf, None, None
+        return float(best), points[0], points[1]
+
+
+def _unique_directions(vectors, signed=True):
+    """unit vectors of all distinct directions, opposite directions are the same if not signed"""
+    vectors = np.asarray(vectors, dtype=float).reshape(-1, 3)
+    norm = np.linalg.norm(vectors, axis=1)
+    vectors = vectors[norm > 1e-12] / norm[norm > 1e-12, None]
+    if not signed:
+        # point every direction into the same half space
+        first = np.argmax(np.abs(vectors) > 1e-9, axis=1)
+        vectors *= np.sign(vectors[np.arange(len(vectors)), first])[:, None]
+    _, index = np.unique(np.round(vectors, 6), axis=0, return_index=True)
+    return vectors[np.sort(index)]
+
+
+def _box_corners(lower, upper):
+    """(8, 3) array of the corners of a box"""
+    return np.array([[x, y, z] for x in (lower[0], upper[0]) for y in (lower[1], upper[1])
+                     for z in (lower[2], upper[2])])
+
+
+def _fibonacci_directions(n):
+    """n unit vectors spread evenly over a sphere"""
+    i = np.arange(n) + 0.5
+    z = 1 - 2 * i / n
+    r = np.sqrt(1 - z ** 2)
+    angle = np.pi * (1 + 5 ** 0.5) * i
+    return np.column_stack([r * np.cos(angle), r * np.sin(angle), z])
+
+
+class ConvexProxy:
+    """
+    Convex polyhedron standing in for part of a mesh
+
+    Two proxies overlap if no separating axis is found among their face normals and the
+    cross products of their edges, so containment counts as overlap.
+    Use ConvexProxy.enclosing to make a proxy that contains a mesh.
+
+    Parameters
+    ----------
+    vertices : (n, 3) array
+        points whose convex hull is the proxy.
+    """
+
+    def __init__(self, vertices):
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+        hull = ConvexHull(vertices)
+        self.vertices = vertices[hull.vertices]
+        hull = ConvexHull(self.vertices)
+        self.triangles = hull.simplices
+        self.planes = hull.equations  # unit normal and offset of each face, inside if normal . x + offset <= 0
+        self.normals = _unique_directions(hull.equations[:, :3])
+        tris = self.vertices[self.triangles]
+        self.edges = _unique_directions(tris[:, [1, 2, 0]] - tris, signed=False)
+        self.bounds = (self.vertices.min(axis=0), self.vertices.max(axis=0))
+
+    def __repr__(self):
+        return 'ConvexProxy(%d vertices, %d faces)' % (len(self.vertices), len(self.triangles))
+
+    @classmethod
+    def enclosing(cls, points, max_vertices=32):
+        """
+        Convex proxy containing all points.
+        The hull of the points is decimated to the points furthest along max_vertices directions,
+        then scaled about its centre until every point is inside.
+        Points that don't span a volume get a thin box.
+        in: points # (n, 3) array
+            max_vertices # largest number of hull points kept
+        out: ConvexProxy
+        """
+        points = np.unique(np.asarray(points, dtype=float).reshape(-1, 3), axis=0)
+        lower, upper = points.min(axis=0), points.max(axis=0)
+        eps = 1e-6 * (1 + np.max(upper - lower)) + 1e-6 * np.max(np.abs(points))
+        try:
+            selected = points[ConvexHull(points, qhull_options='QJ').vertices]
+            if len(selected) > max_vertices:
+                extreme = np.argmax(_fibonacci_directions(max_vertices) @ selected.T, axis=1)
+                selected = selected[np.unique(extreme)]
+            centre = selected.mean(axis=0)
+            planes = ConvexHull(selected).equations
+            height = -(centre @ planes[:, :3].T + planes[:, 3])  # distance of each face from the centre
+            if np.min(height) > eps:
+                # scaling by s moves each face to s * height from the centre
+                scale = np.max(((points - centre) @ planes[:, :3].T + eps) / height, initial=1)
+                proxy = cls(centre + max(scale, 1) * (selected - centre))
+                if np.max(points @ proxy.planes[:, :3].T + proxy.planes[:, 3]) <= 0:
+                    return proxy
+        except Exception:
+            pass
+        return cls(_box_corners(lower - eps, upper + eps))
+
+    def overlap(self, other, matrix=None):
+        """
+        Check if this proxy overlaps another proxy, using the separating axis theorem.
+        in: other # ConvexProxy
+            matrix # (4, 4) transform from the space of other into the space of this proxy, default identity
+        out: bool
+        """
+        matrix = np.eye(4) if matrix is None else np.asarray(matrix, dtype=float)
+        rotation = matrix[:3, :3]
+        vertices = other.vertices @ rotation.T + matrix[:3, 3]
+
+        def separated(axes):
+            p1 = axes @ self.vertices.T
+            p2 = axes @ vertices.T
+            return np.any((p1.max(axis=1) < p2.min(axis=1)) | (p2.max(axis=1) < p1.min(axis=1)))
+
+        # face normals separate most proxies, edge pairs are only needed for edge to edge contact
+        if separated(np.concatenate([self.normals, other.normals @ rotation.T])):
+            return False
+        axes = np.cross(self.edges[:, None], (other.edges @ rotation.T)[None]).reshape(-1, 3)
+        norm = np.linalg.norm(axes, axis=1)
+        return not separated(axes[norm > 1e-9] / norm[norm > 1e-9, None])
+
+
+def convex_proxies(vertices, triangles, pieces=8, max_vertices=32):
+    """
+    Level of detail proxies of a mesh, for testing from coarse to fine.
+    The pieces are groups of neighbouring triangles, the leaves of a TriangleBVH.
+
+    Parameters
+    ----------
+    vertices : (n, 3) array
+        vertex coordinates.
+    triangles : (m, 3) int array
+        vertex indices of each triangle.
+    pieces : int, optional
+        approximate number of convex pieces. The default is 8.
+    max_vertices : int, optional
+        largest number of points kept by each hull, see ConvexProxy.enclosing. The default is 32.
+
+    Returns
+    -------
+    hull : ConvexProxy
+        convex proxy of the whole mesh.
+    pieces : [ConvexProxy]
+        convex proxies containing all triangles between them.
+
+    """
+    tris = np.asarray(vertices, dtype=float)[np.asarray(triangles, dtype=int).reshape(-1, 3)]
+    hull = ConvexProxy.enclosing(tris.reshape(-1, 3), max_vertices)
+    bvh = TriangleBVH(vertices, triangles, leaf_size=max(int(np.ceil(len(tris) / pieces)), 1))
+    leaves = np.flatnonzero(bvh.is_leaf & (bvh.count > 0))
+    return hull, [ConvexProxy.enclosing(bvh.triangles[bvh.start[leaf]:bvh.start[leaf] + bvh.count[leaf]],
+                                        max_vertices) for leaf in leaves]
+
+
+def proxies_overlap(proxies1, proxies2, matrix=None):
+    """
+    Check the proxies of two meshes from coarse to fine, see convex_proxies.
+    If a level doesn't overlap, the meshes don't intersect.
+    in: proxies1, proxies2 # (hull, pieces)
+        matrix # (4, 4) transform from the space of mesh 2 into the space of mesh 1, default identity
+    out: number of levels that overlap, 0 if the hulls don't overlap, 1 if no pieces overlap,
+         2 if the exact meshes need to be checked
+    """
+    hull1, pieces1 = proxies1
+    hull2, pieces2 = proxies2
+    matrix = np.eye(4) if matrix is None else np.asarray(matrix, dtype=float)
+    if not hull1.overlap(hull2, matrix):
+        return 0
+    bounds1 = np.array([piece.bounds for piece in pieces1])  # (n, 2, 3)
+    bounds2 = np.array([transform_aabb(*piece.bounds, matrix) for piece in pieces2])
+    boxes = (np.all(bounds1[:, None, 0] <= bounds2[None, :, 1], axis=-1) &
+             np.all(bounds2[None, :, 0] <= bounds1[:, None, 1], axis=-1))
+    for i, j in zip(*np.nonzero(boxes)):
+        if pieces1[i].overlap(pieces2[j], matrix):
+            return 2
+    return 1
+
+
+def mesh_digest(vertices, triangles, pieces=8, max_vertices=32):
+    """key of the proxies of a mesh in a proxy file, changes if the mesh or the proxy settings change"""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(vertices, dtype=np.float32).tobytes())
+    digest.update(np.ascontiguousarray(triangles, dtype=np.int32).tobytes())
+    digest.update(np.array([pieces, max_vertices], dtype=np.int32).tobytes())
+    return digest.hexdigest()
+
+
+def save_proxies(filename, proxies):
+    """
+    Save proxies of many meshes as NumPy .npz file, written to a temporary file first
+    so processes reading it never see a partly written file.
+    in: filename # .npz file name
+        proxies # {mesh_digest: (hull, pieces)}
+    """
+    keys = list(proxies)
+    shapes = [[proxies[key][0]] + list(proxies[key][1]) for key in keys]
+    temp = '%s.%d.tmp.npz' % (os.path.splitext(filename)[0], os.getpid())
+    np.savez_compressed(
+        temp,
+        digests=np.array(keys, dtype=str),
+        shapes=np.array([len(shape) for shape in shapes], dtype=int),  # hull and pieces of each mesh
+        sizes=np.array([len(proxy.vertices) for shape in shapes for proxy in shape], dtype=int),
+        vertices=np.concatenate([proxy.vertices for shape in shapes for proxy in shape] + [np.zeros((0, 3))]),
+    )
+    os.replace(temp, filename)
+
+
+def load_proxies(filename):
+    """
+    Load proxies saved by save_proxies.
+    in: filename # .npz file name
+    out: {mesh_digest: (hull, pieces)}
+    """
+    with np.load(filename) as data:
+        vertices = np.split(data['vertices'], np.cumsum(data['sizes'])[:-1]) if len(data['sizes']) else []
+        shapes = np.split(np.arange(len(vertices)), np.cumsum(data['shapes'])[:-1]) if len(data['shapes']) else []
+        return {str(key): (ConvexProxy(vertices[shape[0]]), [ConvexProxy(vertices[i]) for i in shape[1:]])
+                for key, shape in zip(data['digests'], shapes)}
+
+
+class CollisionModel:
+    """
+    Meshes of the simulation attached to the armature bones
+
+    Checks for intersecting meshes in any pose without Blender, with the same results as
+    i16sim.bl.intersect_test.is_intersect. Each mesh is split into rigid parts that move with one bone,
+    the part BVH trees are built once in bone space and only moved by the pair-relative transform.
+    Part pairs are tested with convex proxies first (see convex_proxies), the exact BVH trees are
+    only checked if the proxies overlap. Proxies are saved to proxy_file, '<model> proxies.npz' for
+    loaded models, and only built for parts that are not in the file.
+
+    Parameters
+    ----------
+    armature : ArmatureModel
+        bone chain of the armature.
+    mesh_names : [str]
+        names of all meshes.
+    parts : [dict]
+        rigid parts of the meshes, {'mesh': mesh index, 'bone': bone name or '' if static,
+        'vertices': (n, 3) array in bone space (world space if static), 'triangles': (m, 3) int array}.
+    collections : dict, optional
+        {collection name: [mesh names]} meshes in each collection, used by contact_groups.
+    visible : [bool], optional
+        meshes checked for collisions, like visible meshes in Blender. The default checks all.
+    """
+
+    def __init__(self, armature, mesh_names, parts, collections=None, visible=None, leaf_size=8):
+        self.armature = armature
+        self.mesh_names = [str(name) for name in mesh_names]
+        self.parts = parts
+        self.collections = {} if collections is None else collections
+        self.visible = np.ones(len(self.mesh_names), dtype=bool) if visible is None else np.array(visible, dtype=bool)
+        self.leaf_size = leaf_size
+
+        self.part_mesh = np.array([part['mesh'] for part in parts], dtype=int)
+        self.part_bone = np.array([armature.index(part['bone']) if part['bone'] else -1 for part in parts], dtype=int)
+        self.part_bounds = [
+            (part['vertices'].min(axis=0), part['vertices'].max(axis=0)) if len(part['triangles']) else None
+            for part in parts
+        ]
+        self._bvh = [None] * len(parts)
+        self._fixed_pairs = {}  # results of part pairs that never move relative to each other
+        self._fixed_clearance = {}  # {(part1, part2): (max_distance, nearest result in part1 space)}
+        self._motor_radii = None
+        self.use_proxies = True
+        self.proxy_file = None
+        self.proxy_pieces = 8  # approximate number of convex pieces of each part
+        self.proxy_vertices = 32  # largest number of vertices of each convex proxy
+        self._proxies = [None] * len(parts)
+        self.stats = {}
+
+    def __repr__(self):
+        return 'CollisionModel(%d meshes, %d parts, %s)' % (len(self.mesh_names), len(self.parts), self.armature)
+
+    @property
+    def asdict(self):
+        """Dictionary of model arrays, as saved in the .npz file"""
+        collection_names = list(self.collections)
+        return {
+            **self.armature.asdict,
+            'mesh_names': np.array(self.mesh_names),
+            'mesh_visible': self.visible,
+            'collection_names': np.array(collection_names, dtype=str),
+            'mesh_collections': np.array([
+                [name in self.collections[collection] for collection in collection_names]
+                for name in self.mesh_names
+            ], dtype=bool).reshape(len(self.mesh_names), len(collection_names)),
+            'part_mesh': self.part_mesh,
+            'part_bone': np.array([part['bone'] for part in self.parts], dtype=str),
+            'part_vertices': np.cumsum([0] + [len(part['vertices']) for part in self.parts]),
+            'vertices': np.concatenate([part['vertices'] for part in self.parts] + [np.zeros((0, 3))]).astype(np.float32),
+            'part_triangles': np.cumsum([0] + [len(part['triangles']) for part in self.parts]),
+            'triangles': np.concatenate([part['triangles'] for part in self.parts] + [np.zeros((0, 3))]).astype(np.int32),
+        }
+
+    def save(self, filename):
+        """Save model as NumPy .npz file"""
+        np.savez_compressed(filename, **self.asdict)
+
+    @property
+    def tree_arrays(self):
+        """BVH tree arrays of all parts, concatenated, building the trees not built yet (see from_arrays)"""
+        trees = [self.bvh(i).asdict for i in range(len(self.parts))]
+        arrays = {
+            'part_nodes': np.cumsum([0] + [len(tree['start']) for tree in trees]),
+            'part_tree_triangles': np.cumsum([0] + [len(tree['triangles']) for tree in trees]),
+        }
+        empty = {'triangles': np.zeros((0, 3, 3)), 'node_min': np.zeros((0, 3)), 'node_max': np.zeros((0, 3)),
+                 'children': np.zeros((0, 2), dtype=int), 'start': np.zeros(0, dtype=int),
+                 'count': np.zeros(0, dtype=int)}
+        for key in empty:
+            arrays['tree_' + key] = np.concatenate([tree[key] for tree in trees] + [empty[key]])
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, data, leaf_size=8):
+        """
+        Model from a dictionary of model arrays (see asdict), with BVH trees if it has tree_arrays.
+        Vertices in float64, triangles and tree arrays are used without copying them,
+        e.g. views of shared memory, see i16sim.util.shared_arrays.
+        """
+        armature = ArmatureModel(data['bone_names'], data['parents'], data['rest'], data['basis'],
+                                 data['matrix_world'], data['motors'])
+        mesh_names = [str(name) for name in data['mesh_names']]
+        vertex_range, triangle_range = data['part_vertices'], data['part_triangles']
+        parts = [
+            {
+                'mesh': int(mesh),
+                'bone': str(bone),
+                'vertices': np.asarray(data['vertices'][vertex_range[i]:vertex_range[i + 1]], dtype=float),
+                'triangles': np.asarray(data['triangles'][triangle_range[i]:triangle_range[i + 1]], dtype=int),
+            }
+            for i, (mesh, bone) in enumerate(zip(data['part_mesh'], data['part_bone']))
+        ]
+        collections = {
+            str(collection): [name for name, member in zip(mesh_names, data['mesh_collections'][:, i]) if member]
+            for i, collection in enumerate(data['collection_names'])
+        }
+        model = cls(armature, mesh_names, parts, collections, data['mesh_visible'], leaf_size)
+        if 'part_nodes' in data:
+            nodes, triangles = data['part_nodes'], data['part_tree_triangles']
+            for i in range(len(parts)):
+                n, t = slice(nodes[i], nodes[i + 1]), slice(triangles[i], triangles[i + 1])
+                model._bvh[i] = TriangleBVH.from_arrays(
+                    data['tree_triangles'][t], data['tree_node_min'][n], data['tree_node_max'][n],
+                    data['tree_children'][n], data['tree_start'][n], data['tree_count'][n])
+        return model
+
+    @classmethod
+    def load(cls, filename, leaf_size=8):
+        """Load model saved by CollisionModel.save or export_model"""
+        with np.load(filename) as data:
+            model = cls.from_arrays(dict(data), leaf_size)  # read each array once
+        model.proxy_file = os.path.splitext(filename)[0] + ' proxies.npz'
+        return model
+
+    def bvh(self, part):
+        """BVH tree of part in bone space, built on first use"""
+        if self._bvh[part] is None:
+            self._bvh[part] = TriangleBVH(self.parts[part]['vertices'], self.parts[part]['triangles'], self.leaf_size)
+        return self._bvh[part]
+
+    def build_proxies(self):
+        """Get convex proxies of all parts, from proxy_file if they are saved, and save new proxies"""
+        cached = {}
+        if self.proxy_file is not None and os.path.isfile(self.proxy_file):
+            cached = load_proxies(self.proxy_file)
+        new = False
+        for i, part in enumerate(self.parts):
+            if self._proxies[i] is not None or self.part_bounds[i] is None:
+                continue
+            key = mesh_digest(part['vertices'], part['triangles'], self.proxy_pieces, self.proxy_vertices)
+            if key not in cached:
+                cached[key] = convex_proxies(part['vertices'], part['triangles'], self.proxy_pieces, self.proxy_vertices)
+                new = True
+            self._proxies[i] = cached[key]
+        if new and self.proxy_file is not None:
+            save_proxies(self.proxy_file, cached)
+
+    def proxies(self, part):
+        """convex proxies (hull, pieces) of part in bone space, see convex_proxies"""
+        if self._proxies[part] is None:
+            self.build_proxies()
+        return self._proxies[part]
+
+    def _part_overlap(self, pa, pb, matrix):
+        """True if two parts intersect, matrix from the space of part pb into part pa, checks proxies first"""
+        if self.use_proxies:
+            self.stats['proxy_tests'] = self.stats.get('proxy_tests', 0) + 1
+            if proxies_overlap(self.proxies(pa), self.proxies(pb), matrix) < 2:
+                return False
+        self.stats['exact_tests'] = self.stats.get('exact_tests', 0) + 1
+        return self.bvh(pa).overlap(self.bvh(pb), matrix)
+
+    def contact_groups(self, collision_exceptions=params.collision_exceptions,
+                       intersect_collections=params.intersect_collections):
+        """
+        Groups of meshes that are allowed to touch, as intersect_test.contact_groups
+        in: collision_exceptions # [[mesh names], ...]
+            intersect_collections # [[collection name, [mesh names]], ...]
+        out: tuple of tuples of mesh names
+        """
+        groups = [tuple(group) for group in collision_exceptions]
+        for collection, names in intersect_collections:  # collections where all included objects should touch
+            groups.append(tuple(names) + tuple(self.collections.get(collection, ())))
+        return tuple(groups)
+
+    def set_environment(self, environment=None):
+        """
+        Only check the sample environment in one sub-collection of params.sample_environments.
+        in: environment # collection name, None or '' to check no sample environment
+        """
+        if environment and environment not in self.collections:
+            raise Exception('Unknown sample environment: %s' % environment)
+        keep = set(self.collections.get(environment, []))
+        for i, name in enumerate(self.mesh_names):
+            if name in self.collections.get(params.sample_environments, []):
+                self.visible[i] = name in keep
+
+    def part_matrices(self, b_angles):
+        """
+        Transform of each part from bone space to world space.
+        in: b_angles # (nmotors,) Blender motor angles in radians
+        out: (nparts, 4, 4) array
+        """
+        bones = self.armature.pose_b_angles(b_angles)[0]
+        matrices = np.tile(np.eye(4), (len(self.parts), 1, 1))
+        moving = self.part_bone >= 0
+        matrices[moving] = bones[self.part_bone[moving]]
+        return matrices
+
+    def intersect_b_angles(self, b_angles, exceptions=None, verbose=False):
+        """
+        Check which meshes intersect in a pose given by the Blender motor angles.
+
+        Parameters
+        ----------
+        b_angles : (nmotors,) array
+            Blender motor bone rotations in radians, see ArmatureModel.pose_b_angles.
+        exceptions : [[str]], optional
+            groups of meshes that should touch. The default is None, which uses contact_groups().
+        verbose : bool, optional
+            print every intersecting pair. The default is False.
+
+        Returns
+        -------
+        intersections : list [[mesh1, mesh2], ...]
+            list of intersecting mesh name pairs.
+
+        """
+        if exceptions is None:
+            exceptions = self.contact_groups()
+        b_angles = np.asarray(b_angles, dtype=float)
+        if np.any(np.isnan(b_angles)):
+            raise Exception('Eulerian to K conversion not possible in this mode')
+        allowed = allowed_contact_matrix(self.mesh_names, exceptions)
+        matrices = self.part_matrices(b_angles)
+
+        checked = [i for i, bounds in enumerate(self.part_bounds)
+                   if bounds is not None and self.visible[self.part_mesh[i]]]
+        boxes = [transform_aabb(*self.part_bounds[i], matrices[i]) for i in checked]
+        candidates = sweep_and_prune([box[0] for box in boxes], [box[1] for box in boxes])
+
+        touching = set()
+        n_tested = 0
+        self.stats = {}
+        for i, j in candidates:
+            pa, pb = checked[i], checked[j]
+            ma, mb = sorted((self.part_mesh[pa], self.part_mesh[pb]))
+            if ma == mb or allowed[ma, mb] or (ma, mb) in touching:
+                continue
+            if self.part_bone[pa] == self.part_bone[pb]:
+                # parts on the same bone never move relative to each other
+                if (pa, pb) not in self._fixed_pairs:
+                    self._fixed_pairs[(pa, pb)] = self._part_overlap(pa, pb, np.linalg.solve(matrices[pa], matrices[pb]))
+                    n_tested += 1
+                overlap = self._fixed_pairs[(pa, pb)]
+            else:
+                overlap = self._part_overlap(pa, pb, np.linalg.solve(matrices[pa], matrices[pb]))
+                n_tested += 1
+            if overlap:
+                touching.add((ma, mb))
+
+        intersections = [[self.mesh_names[ma], self.mesh_names[mb]] for ma, mb in sorted(touching)]
+        self.stats.update({'parts': len(checked), 'candidates': len(candidates),
+                           'tested': n_tested, 'intersections': len(intersections)})
+        if verbose:
+            for name1, name2 in intersections:
+                print(name1 + " and " + name2 + " are touching!")
+        return intersections
+
+    def intersect_k_angles(self, k_angles, exceptions=None, verbose=False):
+        """
+        Check which meshes intersect in a pose given by real motor angles.
+        in: k_angles # [kmu, kdelta, kgamma, ktheta, kappa, kphi] in degrees
+        out: list of intersecting mesh name pairs, see intersect_b_angles
+        """
+        return self.intersect_b_angles(etok.KtoB_array(k_angles), exceptions, verbose)
+
+    def intersect(self, e_angles, exceptions=None, mode=1, verbose=False):
+        """
+        Check which meshes intersect at a diffractometer position, like DiffcalcEmulator.intersect.
+        in: e_angles # [mu, delta, gamma, eta, chi, phi] in degrees
+            mode # kappa mode, see eulerian_conversion.EtoK
+        out: list of intersecting mesh name pairs, see intersect_b_angles
+        """
+        e_angles = np.asarray(e_angles, dtype=float)
+        k_angles = etok.EtoK_array(e_angles[3:])[mode - 1]
+        return self.intersect_k_angles(np.hstack([e_angles[:3], k_angles]), exceptions, verbose)
+
+    def _part_nearest(self, pa, pb, matrices, max_distance):
+        """closest points of two parts in world space, see TriangleBVH.nearest"""
+        if self.part_bone[pa] == self.part_bone[pb]:
+            # parts on the same bone never move relative to each other
+            last = self._fixed_clearance.get((pa, pb))
+            if last is None or last[0] < max_distance:
+                last = (max_distance, self.bvh(pa).nearest(self.bvh(pb), np.linalg.solve(matrices[pa], matrices[pb]),
+                                                          max_distance))
+                self._fixed_clearance[(pa, pb)] = last
+            distance, point1, point2 = last[1]
+            if distance > max_distance:
+                return np.inf, None, None
+        else:
+            distance, point1, point2 = self.bvh(pa).nearest(
+                self.bvh(pb), np.linalg.solve(matrices[pa], matrices[pb]), max_distance)
+        if point1 is None:
+            return np.inf, None, None
+        to_world = matrices[pa]
+        return distance, point1 @ to_world[:3, :3].T + to_world[:3, 3], point2 @ to_world[:3, :3].T + to_world[:3, 3]
+
+    def clearance_b_angles(self, b_angles, max_distance=np.inf, exceptions=None, verbose=False):
+        """
+        Smallest distance between meshes in a pose given by the Blender motor angles.
+        Only mesh pairs closer than max_distance are searched, using bounding boxes grown by max_distance.
+
+        Parameters
+        ----------
+        b_angles : (nmotors,) array
+            Blender motor bone rotations in radians, see ArmatureModel.pose_b_angles.
+        max_distance : float, optional
+            largest distance in Blender units (m) to report. The default is inf, which checks all pairs.
+        exceptions : [[str]], optional
+            groups of meshes that should touch. The default is None, which uses contact_groups().
+        verbose : bool, optional
+            print every pair. The default is False.
+
+        Returns
+        -------
+        clearance : list [[mesh1, mesh2, distance, point1, point2], ...]
+            mesh pairs closer than max_distance, closest first, with the closest point of each mesh in
+            world space. Intersecting meshes have distance 0.
+
+        """
+        if exceptions is None:
+            exceptions = self.contact_groups()
+        b_angles = np.asarray(b_angles, dtype=float)
+        if np.any(np.isnan(b_angles)):
+            raise Exception('Eulerian to K conversion not possible in this mode')
+        allowed = allowed_contact_matrix(self.mesh_names, exceptions)
+        matrices = self.part_matrices(b_angles)
+
+        checked = [i for i, bounds in enumerate(self.part_bounds)
+                   if bounds is not None and self.visible[self.part_mesh[i]]]
+        if np.isfinite(max_distance):
+            boxes = [transform_aabb(*self.part_bounds[i], matrices[i]) for i in checked]
+            candidates = sweep_and_prune([box[0] - max_distance / 2 for box in boxes],
+                                         [box[1] + max_distance / 2 for box in boxes])
+        else:
+            candidates = [(i, j) for i in range(len(checked)) for j in range(i + 1, len(checked))]
+
+        nearest = {}
+        n_tested = 0
+        for i, j in candidates:
+            pa, pb = checked[i], checked[j]
+            if self.part_mesh[pa] > self.part_mesh[pb]:
+                pa, pb = pb, pa
+            ma, mb = self.part_mesh[pa], self.part_mesh[pb]
+            if ma == mb or allowed[ma, mb]:
+                continue
+            # parts further than the closest part pair of these meshes don't matter
+            limit = nearest[(ma, mb)][0] if (ma, mb) in nearest else max_distance
+            result = self._part_nearest(pa, pb, matrices, limit)
+            n_tested += 1
+            if result[1] is not None and result[0] <= limit:
+                nearest[(ma, mb)] = result
+
+        clearance = sorted([[self.mesh_names[ma], self.mesh_names[mb], float(distance), point1, point2]
+                            for (ma, mb), (distance, point1, point2) in nearest.items()], key=lambda x: x[2])
+        self.stats = {'parts': len(checked), 'candidates': len(candidates), 'tested': n_tested,
+                      'pairs': len(clearance), 'clearance': clearance[0][2] if clearance else np.inf}
+        if verbose:
+            for name1, name2, distance, point1, point2 in clearance:
+                print("%s and %s are %.4g apart" % (name1, name2, distance))
+        return clearance
+
+    def clearance_k_angles(self, k_angles, max_distance=np.inf, exceptions=None, verbose=False):
+        """
+        Smallest distance between meshes in a pose given by real motor angles.
+        in: k_angles # [kmu, kdelta, kgamma, ktheta, kappa, kphi] in degrees
+            max_distance # largest distance to report, in Blender units (m)
+        out: list of [mesh1, mesh2, distance, point1, point2], see clearance_b_angles
+        """
+        return self.clearance_b_angles(etok.KtoB_array(k_angles), max_distance, exceptions, verbose)
+
+    def clearance(self, e_angles, max_distance=np.inf, exceptions=None, mode=1, verbose=False):
+        """
+        Smallest distance between meshes at a diffractometer position.
+        in: e_angles # [mu, delta, gamma, eta, chi, phi] in degrees
+            max_distance # largest distance to report, in Blender units (m)
+            mode # kappa mode, see eulerian_conversion.EtoK
+        out: list of [mesh1, mesh2, distance, point1, point2], see clearance_b_angles
+        """
+        e_angles = np.asarray(e_angles, dtype=float)
+        k_angles = etok.EtoK_array(e_angles[3:])[mode - 1]
+        return self.clearance_k_angles(np.hstack([e_angles[:3], k_angles]), max_distance, exceptions, verbose)
+
+    def motor_radii(self):
+        """
+        Largest distance of each part from the pivot of each motor that moves it, in any pose.
+        A motor rotating by angle (radians) moves no point of the part further than angle * radius.
+        The bound is the sum of the distances between the pivots of the motor chain down to the part,
+        which don't change with the motor angles, and the bounding sphere of the part.
+        out: (nparts, nmotors) array in Blender units (m) per radian, 0 for motors that don't move the part
+        """
+        if self._motor_radii is not None:
+            return self._motor_radii
+        armature = self.armature
+        bones = armature.pose_b_angles(np.zeros(len(armature.motors)))[0]
+        pivots = bones[:, :3, 3]
+        motor_of_bone = {bone: m for m, bone in enumerate(armature.motor_index)}
+        radii = np.zeros((len(self.parts), len(armature.motors)))
+        for i, part in enumerate(self.parts):
+            bone = self.part_bone[i]
+            if bone < 0 or self.part_bounds[i] is None:
+                continue
+            vertices = part['vertices'] @ bones[bone, :3, :3].T + bones[bone, :3, 3]
+            centre = (vertices.min(axis=0) + vertices.max(axis=0)) / 2
+            radius = np.max(np.linalg.norm(vertices - centre, axis=1))
+            # motor bones from the part up to the root
+            chain = []
+            while bone >= 0:
+                if bone in motor_of_bone:
+                    chain.append(bone)
+                bone = armature.parents[bone]
+            point = centre
+            for bone in chain:
+                radius += np.linalg.norm(point - pivots[bone])
+                point = pivots[bone]
+                radii[i, motor_of_bone[bone]] = radius
+        self._motor_radii = radii
+        return radii
+
+    def check_path(self, k_start, k_stop, exceptions=None, resolution=0.01, verbose=False):
+        """
+        Check the whole move between two positions of the real motors for collisions.
+        All motors move at once, linearly from k_start to k_stop.
+
+        The clearance between meshes is found at both ends of the move. No point of a mesh moves
+        further than the sum of motor angle * motor radius (see motor_radii), so if the clearance
+        at both ends of a pair is larger than their largest displacement over the move, the pair
+        can't touch. Otherwise the move is bisected and the halves are checked the same way,
+        only pairs closer than the largest displacement are measured.
+
+        Parameters
+        ----------
+        k_start, k_stop : [kmu, kdelta, kgamma, ktheta, kappa, kphi]
+            real motor angles in degrees at the start and end of the move.
+        exceptions : [[str]], optional
+            groups of meshes that should touch. The default is None, which uses contact_groups().
+        resolution : float, optional
+            shortest move in degrees that is bisected, a shorter move that can't be shown to
+            be safe is unsafe. The default is 0.01.
+        verbose : bool, optional
+            print the result. The default is False.
+
+        Returns
+        -------
+        path : dict
+            | 'safe' : True if no meshes touch anywhere along the move
+            | 'k_angles' : first position along the move that collides or is closer than resolution, or None
+            | 'intersections' : [[mesh1, mesh2], ...] pairs that collide or nearly collide at k_angles
+            | 'clearance' : smallest clearance at the checked positions
+            | 'checks' : number of positions checked
+
+        """
+        if exceptions is None:
+            exceptions = self.contact_groups()
+        k_start = np.asarray(k_start, dtype=float)
+        k_stop = np.asarray(k_stop, dtype=float)
+        if np.any(np.isnan(k_start)) or np.any(np.isnan(k_stop)):
+            raise Exception('Eulerian to K conversion not possible in this mode')
+        # largest displacement of each mesh per unit of the move
+        part_rate = self.motor_radii() @ np.radians(np.abs(k_stop - k_start))
+        mesh_rate = np.zeros(len(self.mesh_names))
+        np.maximum.at(mesh_rate, self.part_mesh, part_rate)
+        index = {name: i for i, name in enumerate(self.mesh_names)}
+        total = np.sum(np.sort(mesh_rate)[-2:])  # largest displacement of any pair over the whole move
+        move = np.max(np.abs(k_stop - k_start), initial=0)
+
+        clearance = {}  # {t: (max_distance, {(mesh1, mesh2): distance})}
+        def pairs_at(t, max_distance):
+            if t not in clearance or clearance[t][0] < max_distance:
+                pairs = self.clearance_k_angles(k_start + t * (k_stop - k_start), max_distance, exceptions)
+                clearance[t] = (max_distance, {(m1, m2): d for m1, m2, d, p1, p2 in pairs})
+            return clearance[t]
+
+        result = {'safe': True, 'k_angles': None, 'intersections': [], 'clearance': np.inf, 'checks': 0}
+        segments = [(0., 1.)]
+        while segments:
+            t0, t1 = segments.pop()
+            limit = total * (t1 - t0)
+            max0, pairs0 = pairs_at(t0, limit)
+            max1, pairs1 = pairs_at(t1, limit)
+            touching = [pair for pair in sorted(set(pairs0) | set(pairs1))
+                        if pairs0.get(pair, max0) + pairs1.get(pair, max1) <=
+                        (mesh_rate[index[pair[0]]] + mesh_rate[index[pair[1]]]) * (t1 - t0)]
+            if not touching:
+                continue
+            if 0 in pairs0.values() or move * (t1 - t0) <= resolution:
+                t = t0 if min(pairs0.values(), default=np.inf) <= min(pairs1.values(), default=np.inf) else t1
+                distance = clearance[t][1]
+                closest = 0 if 0 in distance.values() else limit  # collisions, otherwise near misses
+                result.update(safe=False, k_angles=k_start + t * (k_stop - k_start), intersections=[
+                    list(pair) for pair in touching if distance.get(pair, np.inf) <= closest])
+                break
+            # check the first half first, so the first collision along the move is found
+            mid = (t0 + t1) / 2
+            segments.append((mid, t1))
+            segments.append((t0, mid))
+
+        result['checks'] = len(clearance)
+        result['clearance'] = min([min(pairs.values(), default=max_distance) for max_distance, pairs in clearance.values()])
+        self.stats = dict(result)
+        if verbose:
+            if result['safe']:
+                print('Move is safe, %(checks)d positions checked' % result)
+            else:
+                print('Move collides at', np.round(result['k_angles'], 3), 'between', result['intersections'])
+        return result
@@ -0,0 +1,695 @@
+# -*- coding: utf-8 -*-
+"""
+Collision maps of the diffractometer motors
+
+Checks a grid of real motor positions for collisions with the standalone collision engine,
+so it runs outside Blender. The grid is split into chunks solved in a pool of worker processes
+(ModelPool), which use one copy of the model arrays in shared memory.
+Results are written to a memory-mapped NumPy .npy file as each chunk finishes,
+so an interrupted map is resumed by calling collision_map again with the same file.
+
+collision_map(filename, model, axes, ranges, steps, environment=None, ...):
+    check every position of a grid of motor angles for collisions
+
+load_collision_map(filename):
+    load map saved by collision_map
+
+adaptive_collision_map(model, axes, ranges, coarse_step, resolution=0.5, ...):
+    map collisions on a coarse grid, only refining cells on the boundary of collisions
+
+CollisionTree:
+    sparse tree of an adaptive collision map, queried by angle
+
+OccupancyMap.load(filename):
+    collision lookup of many motor positions from a saved collision map or tree
+
+ModelPool(model, environment=None, workers=None):
+    worker processes checking chunks of positions, sharing the mesh and BVH tree arrays
+
+The map array is int8: 1 for collision, 0 for no collision, -1 not checked yet.
+The axis names and values are in the .json file next to the .npy file.
+
+Worker processes only import i16sim.util modules, so maps are made in plain Python
+(outside Blender), with either the fork or spawn start method.
+
+Example::
+
+    from i16sim.util.collision_map import collision_map
+    # i16sim.bl.export_model.export_model('i16model.npz') in Blender first
+    cmap = collision_map('kappa_ktheta.npy', 'i16model.npz', ['ktheta', 'kappa'], [[-90, 210], [-180, 180]], [1, 1])
+    collisions = cmap['collision'] == 1
+
+"""
+
+import os
+import json
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import i16sim.parameters as params
+from i16sim.util.collision import CollisionModel
+from i16sim.util.reachability import scan_range
+from i16sim.util.shared_arrays import SharedArrays
+
+# motor names of the grid axes, in k_angles order
+motor_names = params.armature_motors  # ["kmu","kdelta","kgamma","ktheta","kappa","kphi"]
+motor_aliases = {'mu': 'kmu', 'delta': 'kdelta', 'gamma': 'kgamma', 'nu': 'kgamma', 'gam': 'kgamma',
+                 'kgam': 'kgamma', 'kth': 'ktheta'}
+
+# collision model of the worker process, set by _init_worker
+_worker_model = None
+# shared memory block of the worker model arrays, kept while the model uses it
+_worker_shared = None
+
+
+def _motor_index(axis):
+    """index of motor name in k_angles"""
+    name = motor_aliases.get(axis, axis)
+    if name not in motor_names:
+        raise Exception('Unknown motor %s, use one of %s' % (axis, motor_names))
+    return motor_names.index(name)
+
+
+def _init_worker(model_file, environment, spec=None):
+    """Load collision model once per worker process, from the shared arrays of ModelPool if spec is given"""
+    global _worker_model, _worker_shared
+    if spec is None:
+        _worker_model = CollisionModel.load(model_file)
+    else:
+        _worker_shared = SharedArrays.attach(spec)
+        _worker_model = CollisionModel.from_arrays(_worker_shared.arrays)
+        _worker_model.proxy_file = os.path.splitext(model_file)[0] + ' proxies.npz'
+    if environment is not None:
+        _worker_model.set_environment(environment)
+
+
+def _check_chunk(args):
+    """
+    Check a chunk of the grid for collisions in the worker process.
+    in: (start, stop, axes, values, fixed, clearance) # flat grid index range, axis indexes, axis values,
+        fixed k_angles, largest clearance to find or None
+    out: (start, stop, (stop-start,) int8 array, (stop-start,) float32 clearance array or None)
+    """
+    start, stop, axes, values, fixed, clearance = args
+    shape = tuple(len(v) for v in values)
+    index = np.unravel_index(np.arange(start, stop), shape)
+    k_angles = np.tile(np.asarray(fixed, dtype=float), (stop - start, 1))
+    for axis, idx, v in zip(axes, index, values):
+        k_angles[:, axis] = np.asarray(v)[idx]
+    if clearance is None:
+        result = np.array([len(_worker_model.intersect_k_angles(k)) > 0 for k in k_angles], dtype=np.int8)
+        return start, stop, result, None
+    # closest pair of each position, intersecting meshes have clearance 0
+    distance = np.full(len(k_angles), np.inf, dtype=np.float32)
+    for i, k in enumerate(k_angles):
+        pairs = _worker_model.clearance_k_angles(k, clearance)
+        if pairs:
+            distance[i] = pairs[0][2]
+    return start, stop, (distance == 0).astype(np.int8), distance
+
+
+def _clearance_file(filename):
+    """file name of the clearance array of a collision map"""
+    return os.path.splitext(filename)[0] + ' clearance.npy'
+
+
+def load_collision_map(filename, mode='r'):
+    """
+    Load collision map saved by collision_map.
+
+    Parameters
+    ----------
+    filename : str
+        .npy file name.
+    mode : str, optional
+        memory map mode, see numpy.load. The default is 'r'.
+
+    Returns
+    -------
+    cmap : dict
+        | 'axes' : list of motor names of the grid axes
+        | motor name : 1D array of values along each axis
+        | 'collision' : memory-mapped int8 array, 1 collision, 0 no collision, -1 not checked
+        | 'clearance' : memory-mapped float32 array of the smallest distance between meshes,
+          inf if further than the clearance the map was calculated with, NaN not checked.
+          Only if the map was calculated with clearance.
+        | 'fixed', 'environment', 'model' : settings the map was calculated with
+
+    """
+    with open(os.path.splitext(filename)[0] + '.json') as f:
+        meta = json.load(f)
+    cmap = {'axes': meta['axes']}
+    for axis, values in zip(meta['axes'], meta['values']):
+        cmap[axis] = np.array(values)
+    cmap['collision'] = np.load(filename, mmap_mode=mode)
+    if meta.get('clearance') is not None:
+        cmap['clearance'] = np.load(_clearance_file(filename), mmap_mode=mode)
+    cmap['fixed'] = meta['fixed']
+    cmap['environment'] = meta['environment']
+    cmap['model'] = meta['model']
+    return cmap
+
+
+def collision_map(filename, model, axes, ranges, steps=None, environment=None, fixed=None,
+                  workers=None, chunk_size=500, verbose=True, clearance=None):
+    """
+    Check every position of a grid of real motor angles for collisions.
+    Each chunk is saved when finished, if the map file exists with the same grid
+    only chunks not finished are checked.
+
+    Parameters
+    ----------
+    filename : str
+        .npy file name of the map, metadata is saved to a .json file with the same name.
+    model : str
+        .npz collision model file, saved in Blender by i16sim.bl.export_model.export_model.
+    axes : [str]
+        motor names of the grid axes, from kmu, kdelta, kgamma, ktheta, kappa, kphi.
+    ranges : [[start, stop], ...] or [array, ...]
+        range of each axis in degrees, stop is included.
+    steps : [float], optional
+        step of each axis in degrees. Not needed if ranges are arrays of values.
+    environment : str, optional
+        name of the sample environment collection to check, see CollisionModel.set_environment.
+        The default is None, which checks the environments visible when the model was exported.
+    fixed : dict, optional
+        angles of motors not in axes, e.g. {'kphi': 90}. The default is 0.
+    workers : int, optional
+        | Number of worker processes. The default is os.cpu_count().
+        | If 0, check in the current process.
+    chunk_size : int, optional
+        number of positions checked and saved at once. The default is 500.
+    verbose : bool, optional
+        print progress. The default is True.
+    clearance : float, optional
+        also save the smallest distance between meshes up to this distance in Blender units (m),
+        see CollisionModel.clearance_k_angles. Slower than only checking for collisions.
+        The default is None.
+
+    Returns
+    -------
+    cmap : dict
+        collision map, see load_collision_map.
+
+    """
+    if steps is None:
+        steps = [None] * len(axes)
+    values = [scan_range(np.asarray(r)) if step is None else scan_range([r[0], r[1], step])
+              for r, step in zip(ranges, steps)]
+    axis_index = [_motor_index(axis) for axis in axes]
+    fixed_angles = np.zeros(len(motor_names))
+    for axis, value in (fixed or {}).items():
+        fixed_angles[_motor_index(axis)] = value
+    shape = tuple(len(v) for v in values)
+    meta = {
+        'axes': [motor_names[i] for i in axis_index],
+        'values': [v.tolist() for v in values],
+        'fixed': fixed_angles.tolist(),
+        'environment': environment,
+        'model': os.path.abspath(model),
+        'clearance': clearance,
+    }
+    compared = ('axes', 'values', 'fixed', 'environment', 'clearance')
+
+    meta_file = os.path.splitext(filename)[0] + '.json'
+    if os.path.isfile(filename) and os.path.isfile(meta_file):
+        with open(meta_file) as f:
+            old_meta = json.load(f)
+        if {k: old_meta.get(k) for k in compared} != {k: meta[k] for k in compared}:
+            raise Exception('%s exists with a different grid, use a new file name' % filename)
+        result = np.load(filename, mmap_mode='r+')
+        distance = None if clearance is None else np.load(_clearance_file(filename), mmap_mode='r+')
+    else:
+        with open(meta_file, 'w') as f:
+            json.dump(meta, f)
+        result = np.lib.format.open_memmap(filename, mode='w+', dtype=np.int8, shape=shape)
+        result[...] = -1
+        result.flush()
+        distance = None
+        if clearance is not None:
+            distance = np.lib.format.open_memmap(_clearance_file(filename), mode='w+', dtype=np.float32, shape=shape)
+            distance[...] = np.nan
+            distance.flush()
+
+    flat = result.reshape(-1)
+    total = flat.size
+    chunks = [(i, min(i + chunk_size, total), axis_index, values, fixed_angles, clearance)
+              for i in range(0, total, chunk_size) if np.any(flat[i:i + chunk_size] < 0)]
+    if verbose:
+        print('Checking %d of %d positions for collisions' % (sum(c[1] - c[0] for c in chunks), total))
+
+    def save(start, stop, chunk_result, chunk_distance):
+        # the clearance is saved first, a chunk is finished when its collisions are saved
+        if distance is not None:
+            distance.reshape(-1)[start:stop] = chunk_distance
+            distance.flush()
+        flat[start:stop] = chunk_result
+        result.flush()
+
+    done = 0
+    if workers == 0:
+        _init_worker(model, environment)
+        for chunk in chunks:
+            save(*_check_chunk(chunk))
+            done += 1
+            if verbose:
+                print('  %d / %d chunks' % (done, len(chunks)))
+    elif chunks:
+        workers = min(workers or os.cpu_count() or 1, len(chunks))
+        with ModelPool(model, environment, workers) as pool:
+            for future in as_completed([pool.submit(_check_chunk, chunk) for chunk in chunks]):
+                save(*future.result())
+                done += 1
+                if verbose:
+                    print('  %d / %d chunks' % (done, len(chunks)))
+    return load_collision_map(filename)
+
+
+class ModelPool:
+    """
+    Worker processes checking positions for collisions with one collision model
+
+    The model is loaded once and its vertex, triangle and BVH tree arrays are copied into one
+    shared memory block (see i16sim.util.shared_arrays). Each worker uses NumPy views of the block
+    instead of loading the model, so memory doesn't grow with the number of workers.
+    Convex proxies are saved to the proxy file first, so the workers only load them.
+    Use as a context manager, or call close to stop the workers and free the block.
+
+    Example::
+
+        with ModelPool('i16model.npz') as pool:
+            collides = pool.check(k_angles)
+
+    Parameters
+    ----------
+    model : str
+        .npz collision model file, saved in Blender by i16sim.bl.export_model.export_model.
+    environment : str, optional
+        sample environment collection to check, see CollisionModel.set_environment.
+    workers : int, optional
+        Number of worker processes. The default is os.cpu_count().
+    shared : bool, optional
+        share the model arrays, otherwise every worker loads the model file. The default is True.
+    """
+
+    def __init__(self, model, environment=None, workers=None, shared=True):
+        collision_model = CollisionModel.load(model)
+        collision_model.build_proxies()
+        self.shared = None
+        spec = None
+        if shared:
+            arrays = dict(collision_model.asdict, **collision_model.tree_arrays)
+            # types used by the workers without copying
+            arrays['vertices'] = arrays['vertices'].astype(float)
+            arrays['triangles'] = arrays['triangles'].astype(int)
+            self.shared = SharedArrays(arrays)
+            spec = self.shared.spec
+        del collision_model
+        self.workers = workers or os.cpu_count() or 1
+        try:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(model, environment, spec))
+        except Exception:
+            self._free()
+            raise
+
+    def __repr__(self):
+        return 'ModelPool(%d workers, %s)' % (self.workers, self.shared)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def submit(self, function, *args):
+        """Run function(*args) in a worker process, the model is in _worker_model, returns a Future"""
+        return self.pool.submit(function, *args)
+
+    def check(self, k_angles, chunks_per_worker=4):
+        """
+        Check positions for collisions, split into chunks handed to the workers.
+        in: k_angles # (n, 6) array of real motor angles in degrees
+            chunks_per_worker # number of chunks for each worker, more chunks balance uneven chunks
+        out: (n,) bool array, True if position collides
+        """
+        k_angles = np.asarray(k_angles, dtype=float).reshape(-1, len(motor_names))
+        chunks = np.array_split(k_angles, max(min(self.workers * chunks_per_worker, len(k_angles)), 1))
+        return np.concatenate(list(self.pool.map(_check_points, chunks)))
+
+    def _free(self):
+        """free the shared memory block"""
+        if self.shared is not None:
+            self.shared.close()
+            self.shared.unlink()
+            self.shared = None
+
+    def close(self):
+        """Stop the worker processes and free the shared memory"""
+        self.pool.shutdown()
+        self._free()
+
+
+def _check_points(k_angles):
+    """True for each of (n, 6) k_angles that collides, in the worker process"""
+    return np.array([len(_worker_model.intersect_k_angles(k)) > 0 for k in k_angles], dtype=bool)
+
+
+class CollisionTree:
+    """
+    Sparse tree of an adaptive collision map
+
+    The map is a grid of coarse cells, each the root of a tree that is split in half
+    along every axis (quadtree for 2 axes, octree for 3) where the cell corners disagree.
+    Leaf values: 0 no collision, 1 collision, 2 boundary cell at the finest resolution.
+
+    Example::
+
+        tree = CollisionTree.load('kappa_ktheta.npz')
+        tree.query([[30, 45], [100, -20]])  # ktheta, kappa values -> [0, 1]
+        tree.compare(load_collision_map('kappa_ktheta.npy'))  # positions that differ from a uniform map
+    """
+
+    def __init__(self, axes, start, coarse_step, levels, shape, value, child, fixed=None, environment=None):
+        self.axes = list(axes)
+        self.start = np.asarray(start, dtype=float)
+        self.coarse_step = float(coarse_step)
+        self.levels = int(levels)
+        self.shape = tuple(int(n) for n in shape)  # number of coarse cells along each axis
+        self.value = np.asarray(value, dtype=np.int8)
+        self.child = np.asarray(child, dtype=int)  # index of first child, -1 for leaves
+        self.fixed = fixed
+        self.environment = environment
+
+    def __repr__(self):
+        return 'CollisionTree(%s, %d nodes, resolution=%.3g)' % (self.axes, len(self.value), self.resolution)
+
+    @property
+    def resolution(self):
+        """smallest cell size in degrees"""
+        return self.coarse_step / 2 ** self.levels
+
+    @property
+    def stop(self):
+        """end of the mapped range along each axis"""
+        return self.start + np.array(self.shape) * self.coarse_step
+
+    def query(self, angles):
+        """
+        Map value at each position.
+        in: angles # (N, naxes) array of angles in degrees, in the order of axes
+        out: (N,) int8 array, 0 no collision, 1 collision, 2 boundary, -1 outside the map
+        """
+        angles = np.atleast_2d(np.asarray(angles, dtype=float))
+        d = len(self.axes)
+        x = (angles - self.start) / self.coarse_step
+        x[np.isnan(x)] = -1
+        shape = np.array(self.shape)
+        inside = np.all((x >= 0) & (x <= shape), axis=1)
+        # the upper edge of the range is in the last cell, at local position 1
+        root = np.minimum(np.floor(x).astype(int), shape - 1)
+        result = np.full(len(angles), -1, dtype=np.int8)
+
+        node = np.ravel_multi_index(tuple(root[inside].T), self.shape) if d else np.zeros(0, dtype=int)
+        local = x[inside] - root[inside]  # position in the cell, 0 to 1
+        weights = 2 ** np.arange(d - 1, -1, -1)
+        while True:
+            split = self.child[node] >= 0
+            if not split.any():
+                break
+            bits = local[split] >= 0.5
+            node[split] = self.child[node[split]] + bits @ weights
+            local[split] = 2 * local[split] - bits
+        result[inside] = self.value[node]
+        return result
+
+    def compare(self, cmap):
+        """
+        Positions of a uniform collision map that the tree disagrees with.
+        Boundary cells and positions outside the tree or not checked in the map are skipped.
+        in: cmap # map of the same axes, see load_collision_map
+        out: (N, naxes) array of angles where the tree and the map differ
+        """
+        grid = np.meshgrid(*[cmap[axis] for axis in self.axes], indexing='ij')
+        angles = np.stack([g.reshape(-1) for g in grid], axis=1)
+        collision = np.transpose(cmap['collision'], [cmap['axes'].index(a) for a in self.axes]).reshape(-1)
+        value = self.query(angles)
+        differ = (value >= 0) & (value < 2) & (collision >= 0) & (value != collision)
+        return angles[differ]
+
+    @property
+    def asdict(self):
+        """Dictionary of tree arrays, as saved in the .npz file"""
+        return {
+            'axes': np.array(self.axes),
+            'start': self.start,
+            'coarse_step': self.coarse_step,
+            'levels': self.levels,
+            'shape': np.array(self.shape),
+            'value': self.value,
+            'child': self.child,
+            'fixed': np.array(self.fixed if self.fixed is not None else []),
+            'environment': str(self.environment or ''),
+        }
+
+    def save(self, filename):
+        """Save tree as NumPy .npz file"""
+        np.savez_compressed(filename, **self.asdict)
+
+    @classmethod
+    def load(cls, filename):
+        """Load tree saved by CollisionTree.save"""
+        with np.load(filename) as data:
+            return cls([str(a) for a in data['axes']], data['start'], float(data['coarse_step']),
+                       int(data['levels']), data['shape'], data['value'], data['child'],
+                       data['fixed'].tolist(), str(data['environment']) or None)
+
+
+def adaptive_collision_map(model, axes, ranges, coarse_step=8., resolution=0.5, environment=None,
+                           fixed=None, workers=None, filename=None, check=None, verbose=True):
+    """
+    Map collisions on a coarse grid of real motor angles, splitting only the cells whose
+    corners disagree until the cells are smaller than resolution.
+    Collisions smaller than a coarse cell that touch none of its corners can be missed,
+    so coarse_step should be smaller than the smallest expected feature.
+
+    Parameters
+    ----------
+    model : str or None
+        .npz collision model file, saved in Blender by i16sim.bl.export_model.export_model.
+        Not used if check is given.
+    axes : [str]
+        motor names of the axes, from kmu, kdelta, kgamma, ktheta, kappa, kphi.
+    ranges : [[start, stop], ...]
+        range of each axis in degrees. The map is extended to a whole number of coarse cells.
+    coarse_step : float, optional
+        size of the initial cells in degrees. The default is 8.
+    resolution : float, optional
+        largest size of the smallest cells in degrees. The default is 0.5.
+    environment : str, optional
+        sample environment collection to check, see CollisionModel.set_environment.
+    fixed : dict, optional
+        angles of motors not in axes, e.g. {'kphi': 90}. The default is 0.
+    workers : int, optional
+        | Number of worker processes. The default is os.cpu_count().
+        | If 0, check in the current process.
+    filename : str, optional
+        save the tree to this .npz file. The default is None.
+    check : callable, optional
+        check(k_angles) -> bool array, if each of (n, 6) k_angles collides.
+        The default uses the collision model, e.g. use the Blender simulation instead.
+    verbose : bool, optional
+        print number of checked positions. The default is True.
+
+    Returns
+    -------
+    tree : CollisionTree
+        sparse collision map.
+
+    """
+    d = len(axes)
+    axis_index = [_motor_index(axis) for axis in axes]
+    fixed_angles = np.zeros(len(motor_names))
+    for axis, value in (fixed or {}).items():
+        fixed_angles[_motor_index(axis)] = value
+    start = np.array([r[0] for r in ranges], dtype=float)
+    shape = tuple(max(int(np.ceil((r[1] - r[0]) / coarse_step - 1e-9)), 1) for r in ranges)
+    levels = max(int(np.ceil(np.log2(coarse_step / resolution) - 1e-9)), 0)
+    scale = 2 ** levels  # finest cells per coarse cell
+    unit = coarse_step / scale
+
+    pool = None
+    if check is None:
+        if workers == 0:
+            _init_worker(model, environment)
+            check = _check_points
+        else:
+            pool = ModelPool(model, environment, workers)
+            check = pool.check
+
+    corners = {}  # collision at each corner, keyed by finest grid index
+
+    def evaluate(points):
+        """collision at (n, d) finest grid index points"""
+        new = [p for p in dict.fromkeys(map(tuple, points)) if p not in corners]
+        if new:
+            k_angles = np.tile(fixed_angles, (len(new), 1))
+            k_angles[:, axis_index] = start + np.array(new) * unit
+            for p, c in zip(new, check(k_angles)):
+                corners[p] = bool(c)
+        return np.array([corners[tuple(p)] for p in points], dtype=bool)
+
+    offsets = np.array(list(itertools.product([0, 1], repeat=d)), dtype=int)
+    value = []
+    child = []
+    try:
+        # roots in C order, so the root of a position is found by its coarse index
+        cells = np.array(list(itertools.product(*[range(n) for n in shape])), dtype=int).reshape(-1, d) * scale
+        ids = np.arange(len(cells))
+        value.extend([0] * len(cells))
+        child.extend([-1] * len(cells))
+        for level in range(levels + 1):
+            size = scale >> level
+            corner_index = (cells[:, None, :] + offsets[None, :, :] * size).reshape(-1, d)
+            vals = evaluate(corner_index).reshape(len(cells), len(offsets))
+            agree = np.all(vals == vals[:, :1], axis=1)
+            # leaf values
+            for n, i in enumerate(ids):
+                if agree[n]:
+                    value[i] = int(vals[n, 0])
+                elif level == levels:
+                    value[i] = 2
+            split = ~agree & (level < levels)
+            if not split.any():
+                break
+            # children of split cells, numbered contiguously in offset order
+            first = len(value) + np.arange(split.sum()) * len(offsets)
+            for i, f in zip(ids[split], first):
+                child[i] = int(f)
+            cells = (cells[split][:, None, :] + offsets[None, :, :] * (size // 2)).reshape(-1, d)
+            ids = np.arange(len(value), len(value) + len(cells))
+            value.extend([0] * len(cells))
+            child.extend([-1] * len(cells))
+    finally:
+        if pool is not None:
+            pool.close()
+
+    tree = CollisionTree([motor_names[i] for i in axis_index], start, coarse_step, levels, shape,
+                         value, child, fixed_angles.tolist(), environment)
+    if verbose:
+        uniform = np.prod([n * scale + 1 for n in shape])
+        print('Checked %d positions for %s, a uniform %.3g deg grid has %d' % (len(corners), tree, tree.resolution, uniform))
+    if filename is not None:
+        tree.save(filename)
+    return tree
+
+
+class OccupancyMap:
+    """
+    Collision lookup from a saved collision map or collision tree
+
+    Positions are wrapped by 360 deg into the mapped range. Positions outside the map,
+    or with the motors that are not map axes further than tolerance from the mapped angles,
+    are not known to collide.
+
+    Parameters
+    ----------
+    axes : [str]
+        motor names of the map axes.
+    fixed : [float]
+        k_angles of all motors the map was calculated at, only those not in axes are used.
+    environment : str or None
+        sample environment the map was calculated for.
+    grid : (values, collision), optional
+        1D values along each axis and the collision array of a collision_map.
+    tree : CollisionTree, optional
+        adaptive collision map.
+    tolerance : float, optional
+        largest difference in degrees of motors that are not map axes. The default is 0.5.
+    threshold : float, optional
+        grid positions collide if the interpolated collision value of the surrounding grid
+        points is above threshold, 0.5 is the nearest point. The default is 0.5.
+    """
+
+    def __init__(self, axes, fixed, environment=None, grid=None, tree=None, tolerance=0.5, threshold=0.5):
+        self.axes = list(axes)
+        self.axis_index = [_motor_index(axis) for axis in self.axes]
+        self.fixed = np.asarray(fixed, dtype=float)
+        self.environment = environment
+        self.grid = grid
+        self.tree = tree
+        self.tolerance = tolerance
+        self.threshold = threshold
+        if tree is not None:
+            self.lower, self.upper = tree.start, tree.stop
+        else:
+            # single value axes are known within tolerance
+            self.lower = np.array([v[0] - (tolerance if len(v) == 1 else 0) for v in grid[0]])
+            self.upper = np.array([v[-1] + (tolerance if len(v) == 1 else 0) for v in grid[0]])
+
+    def __repr__(self):
+        return 'OccupancyMap(%s, environment=%s)' % (self.axes, self.environment)
+
+    @classmethod
+    def load(cls, filename, tolerance=0.5, threshold=0.5):
+        """Load .npy map saved by collision_map or .npz tree saved by adaptive_collision_map"""
+        if os.path.splitext(filename)[1].lower() == '.npy':
+            cmap = load_collision_map(filename)
+            grid = ([cmap[axis] for axis in cmap['axes']], np.array(cmap['collision']))
+            return cls(cmap['axes'], cmap['fixed'], cmap['environment'], grid=grid,
+                       tolerance=tolerance, threshold=threshold)
+        tree = CollisionTree.load(filename)
+        return cls(tree.axes, tree.fixed, tree.environment, tree=tree, tolerance=tolerance, threshold=threshold)
+
+    def _grid_value(self, x):
+        """multilinear interpolation of the grid collision values at (n, naxes) positions inside the grid"""
+        values, collision = self.grid
+        collision = np.maximum(collision, 0)  # not checked yet
+        lo, frac = [], []
+        for axis, v in enumerate(values):
+            if len(v) == 1:
+                lo.append(np.zeros(len(x), dtype=int))
+                frac.append(np.zeros(len(x)))
+                continue
+            f = np.interp(x[:, axis], v, np.arange(len(v)))
+            i = np.minimum(np.floor(f).astype(int), len(v) - 2)
+            lo.append(i)
+            frac.append(f - i)
+        result = np.zeros(len(x))
+        for corner in itertools.product([0, 1], repeat=len(values)):
+            weight = np.ones(len(x))
+            index = []
+            for axis, c in enumerate(corner):
+                if len(values[axis]) == 1:
+                    if c:
+                        weight[:] = 0
+                    index.append(lo[axis])
+                    continue
+                weight *= frac[axis] if c else 1 - frac[axis]
+                index.append(lo[axis] + c)
+            result += weight * collision[tuple(index)]
+        return result
+
+    def collides(self, k_angles):
+        """
+        If each position collides according to the map.
+        in: k_angles # (N, 6) array of kmu, kdelta, kgamma, ktheta, kappa, kphi in degrees
+        out: (N,) bool array
+        """
+        k_angles = np.atleast_2d(np.asarray(k_angles, dtype=float))
+        x = k_angles[:, self.axis_index]
+        x = np.where(x < self.lower, x + 360. * np.ceil((self.lower - x) / 360.), x)
+        x = np.where(x > self.upper, x - 360. * np.ceil((x - self.upper) / 360.), x)
+        other = [i for i in range(len(motor_names)) if i not in self.axis_index]
+        known = np.all((x >= self.lower) & (x <= self.upper), axis=1)
+        known &= np.all(np.abs(k_angles[:, other] - self.fixed[other]) <= self.tolerance, axis=1)
+
+        result = np.zeros(len(k_angles), dtype=bool)
+        if known.any():
+            if self.tree is not None:
+                result[known] = self.tree.query(x[known]) > 0
+            else:
+                result[known] = self._grid_value(x[known]) > self.threshold
+        return result
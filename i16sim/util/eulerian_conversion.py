@@ -15,6 +15,7 @@ by Alessandro Bombardi and Dan Porter
 """
 
 import math
+import numpy as np
 pi = math.pi
 asin = math.asin
 atan = math.atan
@@ -47,6 +48,20 @@ def setRange(x,m=-180.,M=180.):
         return x
 
 
+def setRange_array(x,m=-180.,M=180.):
+    """
+    Array version of setRange
+    in: x, m, M # x is an array of angles in degrees, m and M floats with M = m+360
+    out: array of x equivalents, such that m <= x <= M
+    """
+    x = np.array(x, dtype=float)
+    above = x > M
+    below = x < m
+    x[above] -= 360. * np.ceil((x[above] - M) / 360.)
+    x[below] += 360. * np.ceil((m - x[below]) / 360.)
+    return x
+
+
 def EtoK(e_angles, mode=1, kalpha=kalpha, chi_magic = chi_magic):
     """
     Convert from Eulerian space angles to real world motor angles
@@ -198,6 +213,113 @@ def KtoE(k_angles, mode=1, kalpha=kalpha):
     return e_angles
 
 
+def EtoK_array(e_angles, kalpha=kalpha, chi_magic=chi_magic):
+    """
+    Convert many Eulerian positions to real world motor angles in all four modes at once
+    in: e_angles = [[eta, chi, phi], ...] # (N, 3) array in degrees
+    out: k_angles = [[[ktheta, kappa, kphi] for mode in 1..4], ...] # (N, 4, 3) array in degrees
+    
+    Vectorised equivalent of calling EtoK(e_angles[i], mode) for every position and mode.
+    Modes that are not possible for a given chi are filled with NaN, 
+    so np.isnan(k_angles[:, mode-1, 0]) is the mask of impossible solutions.
+    A single (3,) position returns a (4, 3) array.
+    """
+    e_angles = np.asarray(e_angles, dtype=float)
+    single = e_angles.ndim == 1
+    e_angles = np.atleast_2d(e_angles)
+    
+    theta_now = setRange_array(e_angles[:, 0])
+    chi_now = setRange_array(e_angles[:, 1])
+    phi_now = setRange_array(e_angles[:, 2])
+    k_angles = np.full((len(e_angles), 4, 3), np.nan)
+    
+    with np.errstate(invalid='ignore'):
+        #modes 1 and 2 for -100 < chi < 100
+        ok12 = np.abs(chi_now) < kalpha*180./pi*2
+        chi = chi_now[ok12]
+        delta1 = -np.arcsin(np.tan(pi/180.*chi/2.)/np.tan(kalpha))
+        K1 = -np.arcsin(np.cos(delta1)*np.sin(pi/180*chi)/np.sin(kalpha))*180/pi
+        magic = np.abs(chi) > chi_magic
+        K1 = np.where(magic & (chi > 0.), setRange_array(180-K1), K1)
+        K1 = np.where(magic & (chi < 0.), setRange_array(-180-K1), K1)
+        delta1 = delta1*180/pi
+        k_angles[ok12, 0] = np.stack([
+            setRange_array(theta_now[ok12]-delta1, -90., 270.),
+            K1,
+            setRange_array(phi_now[ok12]-delta1, -90., 270.)], axis=-1)
+        k_angles[ok12, 1] = np.stack([
+            setRange_array(theta_now[ok12]-(180.-delta1), -90., 270.),
+            setRange_array(-K1),
+            setRange_array(phi_now[ok12]-(180.-delta1), -90., 270.)], axis=-1)
+        
+        #modes 3 and 4 for -180 < chi < -100 and 100 < chi < 180
+        ok34 = np.abs(chi_now) > (180.-kalpha*180./pi*2)
+        chi_r = setRange_array(180-chi_now[ok34])
+        delta3 = -np.arcsin(np.tan(pi/180.*chi_r/2.)/np.tan(kalpha))
+        K3 = -np.arcsin(np.cos(delta3)*np.sin(pi/180*chi_r)/np.sin(kalpha))*180/pi
+        magic = np.abs(chi_r) > chi_magic
+        K3 = np.where(magic & (chi_r > 0.), setRange_array(180-K3), K3)
+        K3 = np.where(magic & (chi_r < 0.), setRange_array(-180-K3), K3)
+        delta3 = delta3*180/pi
+        k_angles[ok34, 2] = np.stack([
+            setRange_array(theta_now[ok34]-delta3, -90., 270.),
+            K3,
+            setRange_array(phi_now[ok34]-delta3+180., -90., 270.)], axis=-1)
+        k_angles[ok34, 3] = np.stack([
+            setRange_array(theta_now[ok34]-(180.-delta3), -90., 270.),
+            setRange_array(-K3),
+            setRange_array(phi_now[ok34]-(180.-delta3)+180., -90., 270.)], axis=-1)
+    
+    if single:
+        return k_angles[0]
+    return k_angles
+
+
+def KtoE_array(k_angles, mode=1, kalpha=kalpha):
+    """
+    Convert many real motor positions to Eulerian space
+    in : k_angles = [[ktheta, kappa, kphi], ...] # (N, 3) array in degrees
+    out: e_angles = [[eta, chi, phi], ...] # (N, 3) array in degrees
+    mode: must be the same mode as in EtoK(). If None, all four modes are 
+    returned in a (N, 4, 3) array.
+    
+    Vectorised equivalent of calling KtoE(k_angles[i], mode) for every position.
+    """
+    k_angles = np.asarray(k_angles, dtype=float)
+    if mode is None:
+        return np.stack([KtoE_array(k_angles, m, kalpha) for m in (1, 2, 3, 4)], axis=-2)
+    
+    theta_K_now = setRange_array(k_angles[..., 0], -90, 270)
+    K = setRange_array(k_angles[..., 1])
+    phi_K_now = setRange_array(k_angles[..., 2], -90, 270)
+    
+    gamma = -np.arctan(np.cos(kalpha)*np.tan(K/2.*pi/180.))*180./pi
+    chi = 2*np.arcsin(np.sin(K/2*pi/180)*np.sin(kalpha))*180./pi
+    if mode==1:
+        chi = -chi
+        theta = theta_K_now-gamma
+        phi = phi_K_now-gamma
+    elif mode==2:
+        gamma = gamma+180.
+        theta = theta_K_now-gamma
+        phi = phi_K_now-gamma
+    elif mode==3:
+        chi = chi+180.
+        theta = theta_K_now-gamma
+        phi = phi_K_now-gamma+180.
+    elif mode==4:
+        chi = -chi+180.
+        theta = theta_K_now-gamma+180.
+        phi = phi_K_now-gamma
+    else:
+        raise Exception('mode not recognized')
+        
+    e_angles = np.stack([setRange_array(theta,-90., 270.), 
+                         setRange_array(chi), 
+                         setRange_array(phi,-90., 270.)], axis=-1)
+    return e_angles
+
+
 def KtoB(k_angles, degrees=False):
     """
     Convert k_angles of real motors to correspoding b_angles in Blender
@@ -220,6 +342,22 @@ def KtoB(k_angles, degrees=False):
     return (b_angles)
 
 
+def KtoB_array(k_angles, degrees=False):
+    """
+    Array version of KtoB
+    in: k_angles = [[kmu,kdelta,kgamma,ktheta,kappa,kphi], ...] # (N, 6) array in degrees
+    out: b_angles = [[bmu,bdelta,bgamma,btheta,bkappa,bphi], ...] # (N, 6) array of blender model angles
+    degrees: if Blender angles should be in degrees
+    """
+    k_angles = np.asarray(k_angles, dtype=float)
+    if k_angles.shape[-1] != 6:
+        raise Exception('wrong number of angles given')
+    b_angles = k_angles * np.array([1, -1, 1, -1, -1, -1])
+    if (degrees==False):
+        b_angles = np.radians(b_angles)
+    return b_angles
+
+
 def BtoK(b_angles, degrees=False):
     """
     Convert b_angles in Blender to correspoding real motor k_angles  
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Forward kinematics of the diffractometer armature without Blender
+
+The rest matrices and bone chain of the Blender armature are exported once
+with i16sim.bl.export_model.export_armature, then bone transforms of many poses
+are calculated at once with NumPy.
+
+ArmatureModel(bone_names, parents, rest, basis, matrix_world, motors):
+    bone chain of the armature, see ArmatureModel.load
+
+rotation_y_array(angles):
+    get (N, 4, 4) rotation matrices about the bone y axis, the axis the motor bones rotate about
+
+Only NumPy is needed, the module is imported in plain Python (outside Blender) as:
+
+Example::
+
+    from i16sim.util.kinematics import ArmatureModel
+    model = ArmatureModel.load('armature.npz')
+    matrices = model.pose_e_angles([[0, 30, 0, 15, 45, 0], [0, 60, 0, 30, 90, 0]])  # (2, nbones, 4, 4)
+    kphi = matrices[:, model.index('kphi')]
+
+"""
+
+import numpy as np
+
+import i16sim.parameters as params
+import i16sim.util.eulerian_conversion as etok
+
+
+def rotation_y_array(angles):
+    """
+    Rotation matrices about the y axis, as Blender euler rotation_euler[1]
+    in: angles # (N,) array in radians
+    out: (N, 4, 4) array of homogeneous rotation matrices
+    """
+    angles = np.asarray(angles, dtype=float)
+    c, s = np.cos(angles), np.sin(angles)
+    m = np.zeros(angles.shape + (4, 4))
+    m[..., 0, 0] = c
+    m[..., 0, 2] = s
+    m[..., 1, 1] = 1
+    m[..., 2, 0] = -s
+    m[..., 2, 2] = c
+    m[..., 3, 3] = 1
+    return m
+
+
+class ArmatureModel:
+    """
+    Bone chain of the diffractometer armature
+
+    The pose matrix of each bone in armature space is calculated as Blender does
+    for bones without constraints:
+        pose[bone] = pose[parent] @ inv(rest[parent]) @ rest[bone] @ basis[bone] @ Ry(angle)
+    where angle is the motor rotation of motor bones and 0 for other bones.
+
+    Parameters
+    ----------
+    bone_names : [str]
+        names of all bones, parents before children.
+    parents : (nbones,) int array
+        index of the parent of each bone, -1 for root bones.
+    rest : (nbones, 4, 4) array
+        rest matrix of each bone in armature space (Bone.matrix_local).
+    basis : (nbones, 4, 4) array
+        pose basis matrix of each bone (PoseBone.matrix_basis) with the motor rotation removed.
+    matrix_world : (4, 4) array
+        armature object world matrix.
+    motors : [str]
+        motor bone names, in the order of Blender angles, default params.armature_motors.
+    """
+
+    def __init__(self, bone_names, parents, rest, basis, matrix_world, motors=params.armature_motors):
+        self.bone_names = [str(name) for name in bone_names]
+        self.parents = np.asarray(parents, dtype=int)
+        self.rest = np.asarray(rest, dtype=float)
+        self.basis = np.asarray(basis, dtype=float)
+        self.matrix_world = np.asarray(matrix_world, dtype=float)
+        self.motors = [str(name) for name in motors]
+        self.motor_index = np.array([self.index(name) for name in self.motors], dtype=int)
+
+        for i, parent in enumerate(self.parents):
+            if parent >= i:
+                raise Exception('Bones must be ordered with parents first: %s' % self.bone_names[i])
+        # rest transform of each bone relative to its parent, constant for all poses
+        self.local = np.empty_like(self.rest)
+        for i, parent in enumerate(self.parents):
+            rest = self.rest[i] if parent < 0 else np.linalg.solve(self.rest[parent], self.rest[i])
+            self.local[i] = rest @ self.basis[i]
+
+    def __repr__(self):
+        return 'ArmatureModel(%d bones, motors=%s)' % (len(self.bone_names), self.motors)
+
+    def index(self, bone_name):
+        """Index of bone in the bone arrays"""
+        return self.bone_names.index(bone_name)
+
+    @property
+    def asdict(self):
+        """Dictionary of model arrays, as saved in the .npz file"""
+        return {
+            'bone_names': np.array(self.bone_names),
+            'parents': self.parents,
+            'rest': self.rest,
+            'basis': self.basis,
+            'matrix_world': self.matrix_world,
+            'motors': np.array(self.motors),
+        }
+
+    def save(self, filename):
+        """Save model as NumPy .npz file"""
+        np.savez_compressed(filename, **self.asdict)
+
+    @classmethod
+    def load(cls, filename):
+        """Load model saved by ArmatureModel.save or export_armature"""
+        with np.load(filename) as data:
+            return cls(data['bone_names'], data['parents'], data['rest'], data['basis'],
+                       data['matrix_world'], data['motors'])
+
+    def pose_b_angles(self, b_angles, world=True):
+        """
+        Bone matrices for many poses of the Blender motor bones.
+
+        Parameters
+        ----------
+        b_angles : (N, nmotors) array
+            Blender motor bone rotations in radians, as set by io_angles.set_motor_angles.
+        world : bool, optional
+            If True, return world matrices, otherwise armature space pose matrices. The default is True.
+
+        Returns
+        -------
+        matrices : (N, nbones, 4, 4) array
+            Transform of every bone for every pose.
+
+        """
+        b_angles = np.atleast_2d(np.asarray(b_angles, dtype=float))
+        if b_angles.shape[-1] != len(self.motors):
+            raise Exception('wrong number of angles given')
+        matrices = np.empty((len(b_angles), len(self.bone_names), 4, 4))
+        motor_rotations = dict(zip(self.motor_index, rotation_y_array(b_angles.T)))
+        for i, parent in enumerate(self.parents):
+            m = self.local[i] if parent < 0 else matrices[:, parent] @ self.local[i]
+            if i in motor_rotations:
+                m = m @ motor_rotations[i]
+            matrices[:, i] = m
+        if world:
+            matrices = self.matrix_world @ matrices
+        return matrices
+
+    def pose_k_angles(self, k_angles, world=True):
+        """
+        Bone matrices for many poses of the real motors.
+        in: k_angles = [[kmu,kdelta,kgamma,ktheta,kappa,kphi], ...] # (N, 6) array in degrees
+        out: (N, nbones, 4, 4) array of bone matrices, see pose_b_angles
+        """
+        return self.pose_b_angles(etok.KtoB_array(k_angles), world=world)
+
+    def pose_e_angles(self, e_angles, mode=1, world=True):
+        """
+        Bone matrices for many Eulerian positions.
+        in: e_angles = [[mu, delta, gamma, eta, chi, phi], ...] # (N, 6) array in degrees
+            mode # kappa mode, see eulerian_conversion.EtoK
+        out: (N, nbones, 4, 4) array of bone matrices, see pose_b_angles.
+             Bones moved by the kappa motors are NaN for positions not possible in this kappa mode.
+        """
+        e_angles = np.atleast_2d(np.asarray(e_angles, dtype=float))
+        k_angles = etok.EtoK_array(e_angles[:, 3:])[:, mode - 1]
+        return self.pose_k_angles(np.hstack([e_angles[:, :3], k_angles]), world=world)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Least recently used memo of results, optionally kept in an SQLite file between sessions
+
+PoseMemo(maxsize, filename=None):
+    memo of JSON serialisable results, see PoseMemo.get and PoseMemo.put
+
+quantize(values, quantum):
+    get tuple of integers, equal for values closer than quantum
+
+Example::
+
+    memo = PoseMemo(4096, 'collisions.sqlite')
+    key = (quantize(angles, 1e-6), mesh_digest)
+    result = memo.get(key)
+    if result is None:
+        result = memo.put(key, calculate(angles))
+
+"""
+
+import json
+import sqlite3
+from collections import OrderedDict
+
+import numpy as np
+
+
+def quantize(values, quantum):
+    """
+    Round values to integer multiples of quantum, for use in keys.
+    in: values # list of floats, NaN and None are kept as None
+        quantum # step of the rounding
+    out: tuple of int or None
+    """
+    return tuple(None if value is None or np.isnan(value) else int(round(value / quantum)) for value in values)
+
+
+class PoseMemo:
+    """
+    Memo of results with a bounded number of entries in memory
+
+    The least recently used entry is removed when there are more than maxsize entries.
+    If filename is given, every new result is also written to an SQLite file and
+    results not in memory are looked up in it, so results are kept between sessions.
+
+    Parameters
+    ----------
+    maxsize : int
+        largest number of entries in memory.
+    filename : str, optional
+        SQLite file of the persistent store. The default is None, memory only.
+    """
+
+    def __init__(self, maxsize=4096, filename=None):
+        self.maxsize = maxsize
+        self.filename = filename
+        self._memo = OrderedDict()
+        self._db = None
+        if filename is not None:
+            self._db = sqlite3.connect(filename)
+            self._db.execute('CREATE TABLE IF NOT EXISTS memo (key TEXT PRIMARY KEY, value TEXT)')
+            self._db.commit()
+        self.stats = {'hits': 0, 'store_hits': 0, 'misses': 0}
+
+    def __repr__(self):
+        return 'PoseMemo(%d/%d entries, file=%s)' % (len(self._memo), self.maxsize, self.filename)
+
+    def __len__(self):
+        return len(self._memo)
+
+    def _remember(self, key, value):
+        self._memo[key] = value
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.maxsize:
+            self._memo.popitem(last=False)
+
+    def get(self, key):
+        """Result stored for key, or None"""
+        if key in self._memo:
+            self.stats['hits'] += 1
+            self._memo.move_to_end(key)
+            return self._memo[key]
+        if self._db is not None:
+            row = self._db.execute('SELECT value FROM memo WHERE key = ?', (repr(key),)).fetchone()
+            if row is not None:
+                self.stats['store_hits'] += 1
+                value = json.loads(row[0])
+                self._remember(key, value)
+                return value
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        """Store JSON serialisable result for key, returns value"""
+        self._remember(key, value)
+        if self._db is not None:
+            self._db.execute('INSERT OR REPLACE INTO memo VALUES (?, ?)', (repr(key), json.dumps(value)))
+            self._db.commit()
+        return value
+
+    def clear(self, store=False):
+        """Empty the memo and reset its statistics, and the SQLite file if store is True"""
+        self._memo.clear()
+        if store and self._db is not None:
+            self._db.execute('DELETE FROM memo')
+            self._db.commit()
+        self.stats = {'hits': 0, 'store_hits': 0, 'misses': 0}
+
+    def close(self):
+        """Close the SQLite file, the memo only keeps results in memory afterwards"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            self.filename = None
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Motor move order planner
+
+The motors of a move on the instrument don't all arrive at the same time, each moves at its
+own speed and some moves are done in stages, e.g. the detector first. The intermediate positions
+of each move order are interpolated and checked for collisions, the fastest safe order is chosen.
+
+stage_waypoints(k_start, k_stop, motors, speeds):
+    get positions where motors stop when a set of motors starts moving at once
+
+order_waypoints(k_start, k_stop, order, speeds):
+    get positions where motors stop and the duration of a move order
+
+plan_move(k_start, k_stop, check_segment, orders, speeds):
+    check every move order and get the fastest safe one
+
+Example::
+
+    model = i16sim.util.collision.CollisionModel.load('i16model.npz')
+    check = lambda k0, k1: model.check_path(k0, k1)
+    order, duration, results = plan_move([0, 0, 0, 30, 0, 0], [0, 60, 0, 30, 90, 0], check)
+
+"""
+
+import numpy as np
+
+import i16sim.parameters as params
+
+# motor names in k_angles order
+motor_names = params.armature_motors  # ["kmu","kdelta","kgamma","ktheta","kappa","kphi"]
+
+
+def stage_waypoints(k_start, k_stop, motors, speeds=params.motor_speeds):
+    """
+    Positions along a stage of a move, where motors start moving at once and each stops at its target.
+    Between waypoints all moving motors move linearly.
+    in: k_start, k_stop # [kmu, kdelta, kgamma, ktheta, kappa, kphi] in degrees
+        motors # names of the motors moving in this stage, other motors stay at k_start
+        speeds # {motor name: speed in degrees per second}
+    out: waypoints # (n, 6) array, starting with k_start
+         duration # time of the stage in seconds
+    """
+    k_start = np.asarray(k_start, dtype=float)
+    k_stop = np.asarray(k_stop, dtype=float)
+    moving = np.array([name in motors for name in motor_names])
+    speed = np.array([speeds[name] for name in motor_names], dtype=float)
+    change = np.where(moving, k_stop - k_start, 0)
+    times = np.abs(change) / speed
+    waypoints = [k_start]
+    for t in np.unique(times[times > 0]):
+        waypoints.append(k_start + np.sign(change) * np.minimum(speed * t, np.abs(change)))
+    return np.array(waypoints), float(np.max(times, initial=0))
+
+
+def order_waypoints(k_start, k_stop, order, speeds=params.motor_speeds):
+    """
+    Positions along a move done in stages.
+    in: k_start, k_stop # [kmu, kdelta, kgamma, ktheta, kappa, kphi] in degrees
+        order # [[motor names], ...] motors moving in each stage, see params.move_orders
+        speeds # {motor name: speed in degrees per second}
+    out: waypoints # (n, 6) array from k_start to k_stop
+         duration # time of the move in seconds
+    """
+    for name in [name for stage in order for name in stage]:
+        if name not in motor_names:
+            raise Exception('Unknown motor %s, use one of %s' % (name, motor_names))
+    position = np.asarray(k_start, dtype=float)
+    waypoints = [position[None]]
+    duration = 0.
+    for stage in order:
+        stage_points, stage_time = stage_waypoints(position, k_stop, stage, speeds)
+        waypoints.append(stage_points[1:])
+        duration += stage_time
+        position = stage_points[-1]
+    if not np.allclose(position, k_stop):
+        raise Exception('Motors missing from move order: %s' % order)
+    return np.concatenate(waypoints), duration
+
+
+def plan_move(k_start, k_stop, check_segment, orders=params.move_orders, speeds=params.motor_speeds,
+              verbose=False):
+    """
+    Check the intermediate positions of every move order for collisions and choose the fastest safe order.
+
+    Parameters
+    ----------
+    k_start, k_stop : [kmu, kdelta, kgamma, ktheta, kappa, kphi]
+        real motor angles in degrees at the start and end of the move.
+    check_segment : function
+        check_segment(k0, k1) checks the linear move from k0 to k1 and returns a dict with
+        'safe', 'k_angles' and 'intersections', like CollisionModel.check_path.
+    orders : dict, optional
+        {name: [[motor names], ...]} motors moving in each stage of each move order.
+        The default is params.move_orders.
+    speeds : dict, optional
+        {motor name: speed in degrees per second}. The default is params.motor_speeds.
+    verbose : bool, optional
+        print every order. The default is False.
+
+    Returns
+    -------
+    order : str or None
+        name of the fastest safe move order, None if no order is safe.
+    duration : float
+        estimated time of the move in seconds, inf if no order is safe.
+    results : list [dict]
+        | every order, safe orders first, fastest first:
+        | 'order', 'stages', 'duration', 'waypoints', 'safe',
+        | 'k_angles' and 'intersections' of the first collision
+
+    """
+    checked = {}  # segments shared by several orders are only checked once
+    results = []
+    for name, stages in orders.items():
+        waypoints, duration = order_waypoints(k_start, k_stop, stages, speeds)
+        result = {'order': name, 'stages': stages, 'duration': duration, 'waypoints': waypoints,
+                  'safe': True, 'k_angles': None, 'intersections': []}
+        for k0, k1 in zip(waypoints[:-1], waypoints[1:]):
+            key = (tuple(k0), tuple(k1))
+            if key not in checked:
+                checked[key] = check_segment(k0, k1)
+            if not checked[key]['safe']:
+                result.update(safe=False, k_angles=checked[key]['k_angles'],
+                              intersections=checked[key]['intersections'])
+                break
+        results.append(result)
+        if verbose:
+            print('%-20s %8.1f s  %s' % (name, duration, 'safe' if result['safe'] else
+                                         'collides between %s' % result['intersections']))
+
+    results.sort(key=lambda result: (not result['safe'], result['duration']))
+    if results and results[0]['safe']:
+        return results[0]['order'], results[0]['duration'], results
+    return None, np.inf, results
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Reciprocal space accessibility maps
+
+Solves a grid of hkl values in a process pool. Only uses the diffcalc core,
+so it can run outside Blender.
+
+hkl_grid(h_range, k_range, l_range):
+    get 1D hkl axes and the (N, 3) array of all grid points
+
+solve_hkl_grid(hkl, ubcalc, constraints, wavelength, ...):
+    get all diffractometer positions for every hkl, sharded across worker processes
+
+save_reachability_map(filename, volume):
+    save map as compressed NumPy .npz or HDF5 file
+
+load_reachability_map(filename):
+    load map saved by save_reachability_map
+
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from i16sim.diffcalc.hkl.calc import HklCalculation
+from i16sim.diffcalc.hkl.constraints import Constraints
+from i16sim.diffcalc.util import DiffcalcException
+
+hdf5_extensions = ('.h5', '.hdf5', '.hdf', '.nxs')
+
+# hkl calculation of the worker process, set by _init_worker
+_worker_hklcalc = None
+
+
+def scan_range(values):
+    """
+    Get array of values from a scan style range.
+    in: values # single value, [start, stop, step] like the scan command, or a NumPy array of values
+    out: 1D array of values, stop is included
+    """
+    if isinstance(values, np.ndarray):
+        return np.atleast_1d(values.astype(float))
+    if np.ndim(values) == 0:
+        return np.array([values], dtype=float)
+    if len(values) != 3:
+        raise Exception('Range must be a single value, [start, stop, step] or an array of values')
+    start, stop, step = values
+    return np.arange(start, stop + step / 10., step)
+
+
+def hkl_grid(h_range, k_range, l_range):
+    """
+    Create grid of hkl values.
+
+    Parameters
+    ----------
+    h_range, k_range, l_range : float or [start, stop, step] or array
+        Values along each axis, see scan_range.
+
+    Returns
+    -------
+    axes : (h, k, l) tuple of 1D arrays
+        Values along each axis.
+    hkl : (N, 3) array
+        All grid points, l changing fastest.
+
+    """
+    axes = tuple(scan_range(r) for r in (h_range, k_range, l_range))
+    hkl = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    return axes, hkl
+
+
+def _init_worker(ubcalc, constraints, verify):
+    """Create hkl calculation once per worker process"""
+    global _worker_hklcalc
+    _worker_hklcalc = HklCalculation(ubcalc, Constraints(constraints), verify)
+
+
+def _solve_chunk(args):
+    """
+    Get all positions for a chunk of hkl values in the worker process.
+    Uses the batch solver if it supports the constraint mode, otherwise solves one hkl at a time.
+    in: (hkl, wavelength) # (n, 3) array and float
+    out: (n, M, 6) array of positions in degrees padded with NaN
+    """
+    hkl, wavelength = args
+    hklcalc = _worker_hklcalc
+    try:
+        positions, _ = hklcalc.get_positions(hkl, wavelength)
+        return positions
+    except DiffcalcException:
+        pass
+
+    solutions = []
+    for h, k, l in hkl:
+        try:
+            solutions.append([pos.astuple for pos, _ in hklcalc.get_position(h, k, l, wavelength)])
+        except (DiffcalcException, ValueError, ZeroDivisionError, AssertionError):
+            # unreachable or degenerate reflection
+            solutions.append([])
+    positions = np.full((len(hkl), max([len(s) for s in solutions], default=0), 6), np.nan)
+    for i, s in enumerate(solutions):
+        if s:
+            positions[i, :len(s)] = s
+    return positions
+
+
+def solve_hkl_grid(hkl, ubcalc, constraints, wavelength, verify='always', workers=None, chunk_size=1000):
+    """
+    Get all diffractometer positions for every hkl regardless of limits.
+    The hkl array is split into chunks that are solved in a pool of worker processes.
+
+    Parameters
+    ----------
+    hkl : (N, 3) array
+        Miller indices.
+    ubcalc : UBCalculation
+        UB calculation, copied to every worker.
+    constraints : Constraints or dict or tuple
+        Diffractometer constraints.
+    wavelength : float
+        Wavelength in Angstroms.
+    verify : str, optional
+        Verification policy of the worker hkl calculations, see HklCalculation.verify.
+        The default is 'always'.
+    workers : int, optional
+        | Number of worker processes. The default is os.cpu_count().
+        | If 0, solve in the current process, e.g. if processes cannot be started from Blender.
+    chunk_size : int, optional
+        Number of hkl values sent to a worker at once. The default is 1000.
+
+    Returns
+    -------
+    positions : (N, M, 6) array
+        mu, delta, nu, eta, chi, phi in degrees of the M solutions for every hkl, padded with NaN.
+
+    """
+    hkl = np.atleast_2d(np.asarray(hkl, dtype=float))
+    if not isinstance(constraints, Constraints):
+        constraints = Constraints(constraints)
+    if not constraints.is_fully_constrained():
+        raise DiffcalcException("Diffcalc is not fully constrained.")
+    if not constraints.is_current_mode_implemented():
+        raise DiffcalcException("The selected constraint combination is not implemented.")
+    constraints = constraints.astuple
+    chunks = [(hkl[i:i + chunk_size], wavelength) for i in range(0, len(hkl), chunk_size)]
+    initargs = (ubcalc, constraints, verify)
+
+    if workers == 0:
+        _init_worker(*initargs)
+        results = [_solve_chunk(chunk) for chunk in chunks]
+    else:
+        workers = min(workers or os.cpu_count() or 1, max(len(chunks), 1))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            results = list(pool.map(_solve_chunk, chunks))
+
+    positions = np.full((len(hkl), max([r.shape[1] for r in results], default=0), 6), np.nan)
+    i = 0
+    for r in results:
+        positions[i:i + len(r), :r.shape[1]] = r
+        i += len(r)
+    return positions
+
+
+def save_reachability_map(filename, volume):
+    """
+    Save reachability map.
+
+    N.B. Blender does not ship with h5py installed, use .npz files there.
+
+    Parameters
+    ----------
+    filename : str
+        .npz file, or .h5, .hdf5, .hdf or .nxs file for HDF5 output.
+    volume : dict {str : array}
+        Map arrays, as returned by DiffcalcEmulator.reachability_map.
+
+    """
+    if os.path.splitext(filename)[1].lower() in hdf5_extensions:
+        import h5py
+        with h5py.File(filename, 'w') as h:
+            for key, value in volume.items():
+                value = np.asarray(value)
+                if value.ndim > 1:
+                    h.create_dataset(key, data=value, compression='gzip', chunks=True)
+                else:
+                    h.create_dataset(key, data=value)
+    else:
+        np.savez_compressed(filename, **volume)
+
+
+def load_reachability_map(filename):
+    """
+    Load reachability map saved by save_reachability_map.
+
+    Parameters
+    ----------
+    filename : str
+        .npz or HDF5 file.
+
+    Returns
+    -------
+    volume : dict {str : array}
+        Map arrays.
+
+    """
+    if os.path.splitext(filename)[1].lower() in hdf5_extensions:
+        import h5py
+        with h5py.File(filename, 'r') as h:
+            return {key: h[key][()] for key in h.keys()}
+    with np.load(filename) as data:
+        return {key: data[key] for key in data.files}
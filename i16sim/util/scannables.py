@@ -16,9 +16,16 @@ create_composite_limits(dc):
     
 in_composite_limits(composite_limits, position=None, raise_error=False):
     If outside any of the composite limits
+
+inlimits_array(scannable, values):
+    If each of many values is inside the scannable limits
+
+in_composite_limits_array(composite_limits, positions, k_angles):
+    If each of many positions is inside all composite limits
     
 """
 
+import numpy as np
 import i16sim.util.eulerian_conversion as etok
 import i16sim.parameters as params
 
@@ -134,6 +141,38 @@ def _inlimits(self,value=None,raise_error=False):
     return ret
     
 
+def inlimits_array(scannable,values):
+    """Array version of scannable.inlimits for many values at once.
+    Scannables with a custom _inlimits function are checked one value at a time.
+    
+
+    Parameters
+    ----------
+    scannable : Scannable
+    values : array of floats
+        values to check against the scannable limits. NaN is never within limits.
+
+    Returns
+    -------
+    ret : bool array
+        if each value is within the scannable limits
+
+    """
+    x=np.array(values,dtype=float)
+    if scannable._inlimits is not _inlimits:
+        return np.array([not np.isnan(v) and scannable.inlimits(v) for v in x],dtype=bool)
+    
+    cut=scannable.cut
+    if cut is not None:
+        x=etok.setRange_array(x,cut,cut+360.)
+    ret=~np.isnan(x)
+    if scannable.min is not None:
+        ret &= x >= setrange(scannable.min,cut)
+    if scannable.max is not None:
+        ret &= x <= setrange(scannable.max,cut)
+    return ret
+
+
 class Scannable:
     """Class for defining scannable objects in a factory. 
     Each instance has its methods defined on creation and the methods can be modified.
@@ -805,6 +844,41 @@ def in_composite_limits(composite_limits,position=None,raise_error=False):
     return True
 
 
+
+def in_composite_limits_array(composite_limits,positions,k_angles):
+    """Array version of in_composite_limits for many positions at once.
+    The angles are normalised for all positions together, 
+    then the limit functions are called for every position.
+    
+
+    Parameters
+    ----------
+    composite_limits : dict {str : CompositeLimit}
+        a dictionary of composite limits indexed by their keys.
+    positions : (N, 6) array of floats
+        Eulerian angles mu, delta, nu, eta, chi, phi.
+    k_angles : (N, 3) array of floats
+        ktheta, kappa, kphi of every position, NaN if conversion not possible.
+
+    Returns
+    -------
+    ret : (N,) bool array
+        if each position is within all composite limits
+
+    """
+    positions=np.atleast_2d(np.asarray(positions,dtype=float))
+    k_angles=np.atleast_2d(np.asarray(k_angles,dtype=float))
+    ret=~np.isnan(k_angles).any(axis=1)
+    keys=['ktheta','kappa','kphi','mu','delta','nu','eta','chi','phi']
+    angles=etok.setRange_array(np.hstack([k_angles,positions]))
+    for i in np.nonzero(ret)[0]:
+        angles_i=dict(zip(keys,angles[i].tolist()))
+        for limit in composite_limits.values():
+            if not limit._inlimits(limit,angles_i,limit.args):
+                ret[i]=False
+                break
+    return ret
+
     
 def create_composite_limits(dc):
     """Create user defined limits and return them in a dictionary.
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy arrays in shared memory, so worker processes use one copy of large arrays
+
+SharedArrays(arrays):
+    copy a dictionary of arrays into one multiprocessing.shared_memory block
+
+SharedArrays.attach(spec):
+    NumPy views of the arrays in another process, without copying them
+
+Example::
+
+    with SharedArrays(model.asdict) as shared:
+        pool = ProcessPoolExecutor(initializer=init, initargs=(shared.spec,))
+        ...
+
+    # in the worker process
+    shared = SharedArrays.attach(spec)
+    vertices = shared.arrays['vertices']
+
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# arrays start at multiples of this many bytes in the block
+alignment = 64
+
+
+def _views(shm, layout, writeable=True):
+    """{name: array view of the shared memory block} of layout {name: (offset, dtype, shape)}"""
+    arrays = {}
+    for name, (offset, dtype, shape) in layout.items():
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        array.flags.writeable = writeable
+        arrays[name] = array
+    return arrays
+
+
+class SharedArrays:
+    """
+    Dictionary of NumPy arrays in one multiprocessing.shared_memory block
+
+    The process creating the block copies the arrays into it and removes it with unlink,
+    or at the end of a with block, when all processes using it have finished.
+    Other processes get read-only views of the arrays with SharedArrays.attach(spec).
+
+    Parameters
+    ----------
+    arrays : dict
+        {name: array} arrays to copy, object arrays can't be shared.
+
+    Attributes
+    ----------
+    arrays : dict
+        {name: array} views of the shared memory block.
+    spec : dict
+        name and layout of the block, small enough to pass to other processes.
+    """
+
+    def __init__(self, arrays):
+        arrays = {name: np.asarray(array) for name, array in arrays.items()}
+        layout = {}
+        size = 0
+        for name, array in arrays.items():
+            if array.dtype.hasobject:
+                raise Exception('Object array %s can not be shared' % name)
+            layout[name] = (size, array.dtype.str, array.shape)
+            size += -(-array.nbytes // alignment) * alignment
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self._owner = True
+        self.spec = {'name': self._shm.name, 'layout': layout}
+        self.arrays = _views(self._shm, layout)
+        for name, array in arrays.items():
+            self.arrays[name][...] = array
+
+    def __repr__(self):
+        return 'SharedArrays(%d arrays, %d bytes, %s)' % (len(self.arrays), self._shm.size, self.spec['name'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        self.unlink()
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        Read-only views of arrays shared by another process, without copying them.
+        Keep the returned object while the arrays are used.
+        in: spec # SharedArrays.spec of the creating process
+        out: SharedArrays
+        """
+        shared = cls.__new__(cls)
+        shared._shm = shared_memory.SharedMemory(name=spec['name'])
+        shared._owner = False
+        shared.spec = spec
+        shared.arrays = _views(shared._shm, spec['layout'], writeable=False)
+        return shared
+
+    def close(self):
+        """Remove the views and close the block in this process, arrays from it can't be used afterwards"""
+        self.arrays = {}
+        self._shm.close()
+
+    def unlink(self):
+        """Free the block, only in the creating process"""
+        if self._owner:
+            self._shm.unlink()
+            self._owner = False